@@ -42,6 +42,7 @@ from nova.openstack.common import excutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova import quota
+from nova import servicegroup
 from nova import utils
 from nova import volume
 
@@ -190,6 +191,7 @@ class CloudController(object):
                                    volume_api=self.volume_api,
                                    security_group_api=self.security_group_api)
         self.keypair_api = compute.api.KeypairAPI()
+        self.servicegroup_api = servicegroup.API()
 
     def __str__(self):
         return 'CloudController'
@@ -238,6 +240,8 @@ class CloudController(object):
                                         'zoneState': 'available'}]}
 
         services = db.service_get_all(context, False)
+        up_ids = set(service['id'] for service in
+                     self.servicegroup_api.get_up_services(services))
         hosts = []
         for host in [service['host'] for service in services]:
             if not host in hosts:
@@ -248,7 +252,7 @@ class CloudController(object):
             hsvcs = [service for service in services
                      if service['host'] == host]
             for svc in hsvcs:
-                alive = utils.service_is_up(svc)
+                alive = svc['id'] in up_ids
                 art = (alive and ":-)") or "XXX"
                 active = 'enabled'
                 if svc['disabled']:
@@ -48,6 +48,7 @@ class ConsoleOutputController(wsgi.Controller):
 
         try:
             length = body['os-getConsoleOutput'].get('length')
+            offset = body['os-getConsoleOutput'].get('offset')
         except (TypeError, KeyError):
             raise webob.exc.HTTPBadRequest(_('os-getConsoleOutput malformed '
                                              'or missing from request body'))
@@ -59,10 +60,26 @@ class ConsoleOutputController(wsgi.Controller):
                 raise webob.exc.HTTPBadRequest(_('Length in request body must '
                                                  'be an integer value'))
 
+        if offset is not None:
+            try:
+                offset = int(offset)
+            except ValueError:
+                offset = -1
+            if offset < 0:
+                raise webob.exc.HTTPBadRequest(_('Offset in request body must '
+                                                 'be a non-negative integer '
+                                                 'value'))
+
+        result = {}
         try:
-            output = self.compute_api.get_console_output(context,
-                                                         instance,
-                                                         length)
+            if offset is None:
+                output = self.compute_api.get_console_output(context,
+                                                             instance,
+                                                             length)
+            else:
+                result = self.compute_api.get_console_output_range(
+                        context, instance, offset=offset, tail_length=length)
+                output = result['output']
         except exception.NotFound:
             raise webob.exc.HTTPNotFound(_('Unable to get console'))
 
@@ -70,11 +87,17 @@ class ConsoleOutputController(wsgi.Controller):
         remove_re = re.compile('[\x00-\x08\x0B-\x0C\x0E-\x1F]')
         output = remove_re.sub('', output)
 
-        return {'output': output}
+        if offset is None:
+            return {'output': output}
+        return {'output': output, 'offset': result['offset']}
 
 
 class Console_output(extensions.ExtensionDescriptor):
-    """Console log output support, with tailing ability."""
+    """Console log output support, with tailing ability.
+
+    An offset in the request returns only the output written from that
+    offset on, with the offset to send next time.
+    """
 
     name = "Console_output"
     alias = "os-console-output"
@@ -22,6 +22,7 @@ from webob import exc
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import instance_types
 from nova import db
 from nova import exception
 
@@ -68,6 +69,7 @@ class FlavorExtraSpecsController(object):
                                                               specs)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=unicode(error))
+        instance_types.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecsTemplate)
@@ -87,6 +89,7 @@ class FlavorExtraSpecsController(object):
                                                                body)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=unicode(error))
+        instance_types.invalidate_cache()
 
         return body
 
@@ -106,6 +109,7 @@ class FlavorExtraSpecsController(object):
         context = req.environ['nova.context']
         authorize(context)
         db.instance_type_extra_specs_delete(context, flavor_id, id)
+        instance_types.invalidate_cache()
 
 
 class Flavorextraspecs(extensions.ExtensionDescriptor):
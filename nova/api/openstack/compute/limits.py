@@ -19,6 +19,8 @@ Module dedicated functions/classes dealing with rate limiting requests.
 
 import collections
 import copy
+import functools
+import hashlib
 import httplib
 import math
 import re
@@ -30,13 +32,18 @@ import webob.exc
 from nova.api.openstack.compute.views import limits as limits_views
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova import flags
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
 from nova import quota
+from nova import utils
 from nova import wsgi as base_wsgi
 
 
 QUOTAS = quota.QUOTAS
+FLAGS = flags.FLAGS
+LOG = logging.getLogger(__name__)
 
 
 # Convenience constants for the limits dictionary passed to Limiter().
@@ -89,6 +96,8 @@ class LimitsController(object):
                                            usages=False)
         abs_limits = dict((k, v['limit']) for k, v in quotas.items())
         rate_limits = req.environ.get("nova.limits", [])
+        if callable(rate_limits):
+            rate_limits = rate_limits()
 
         builder = self._get_view_builder(req)
         return builder.build(rate_limits, abs_limits)
@@ -101,6 +110,35 @@ def create_resource():
     return wsgi.Resource(LimitsController())
 
 
+_compiled_regexes = {}
+
+
+def _regex_match(regex, url):
+    """re.match() with the compiled patterns kept for all the limits."""
+    compiled = _compiled_regexes.get(regex)
+    if compiled is None:
+        compiled = _compiled_regexes[regex] = re.compile(regex)
+    return compiled.match(url) is not None
+
+
+def _matching_limits(limits, verb, url):
+    """
+    Return the limits which apply to a request.  Each distinct regex is
+    matched once, however many limits and users share it.
+    """
+    matches = {}
+    result = []
+    for limit in limits:
+        if limit.verb != verb:
+            continue
+        matched = matches.get(limit.regex)
+        if matched is None:
+            matched = matches[limit.regex] = _regex_match(limit.regex, url)
+        if matched:
+            result.append(limit)
+    return result
+
+
 class Limit(object):
     """
     Stores information about a limit for HTTP requests.
@@ -153,9 +191,17 @@ class Limit(object):
         @param verb: string http verb (POST, GET, etc.)
         @param url: string URL
         """
-        if self.verb != verb or not re.match(self.regex, url):
+        if self.verb != verb or not _regex_match(self.regex, url):
             return
+        return self.fill()
+
+    def fill(self):
+        """
+        Account for a request this limit applies to.
 
+        @return: Seconds to wait before the request would be allowed, or
+                 None if it is allowed now.
+        """
         now = self._get_time()
 
         if self.last_request is None:
@@ -191,6 +237,11 @@ class Limit(object):
         """Display the string name of the unit."""
         return self.UNITS.get(self.unit, "UNKNOWN")
 
+    def is_idle(self, now):
+        """Whether the bucket has drained since the last request."""
+        return (self.last_request is None or
+                now - self.last_request >= self.capacity)
+
     def display(self):
         """Return a useful representation of this class."""
         return {
@@ -272,7 +323,10 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
             retry = time.time() + delay
             return wsgi.OverLimitFault(msg, error, retry)
 
-        req.environ["nova.limits"] = self._limiter.get_limits(username)
+        # NOTE: only the limits API shows the limits, so they are only
+        # worked out when it asks for them.
+        req.environ["nova.limits"] = functools.partial(
+                self._limiter.get_limits, username)
 
         return self.application
 
@@ -280,8 +334,14 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
 class Limiter(object):
     """
     Rate-limit checking class which handles limits in memory.
+
+    The water levels of users who have not made a request for longer than
+    the longest limit unit are full again, so they are dropped at most
+    every EVICTION_INTERVAL seconds to keep the memory bounded.
     """
 
+    EVICTION_INTERVAL = 60
+
     def __init__(self, limits, **kwargs):
         """
         Initialize the new `Limiter`.
@@ -290,12 +350,25 @@ class Limiter(object):
         """
         self.limits = copy.deepcopy(limits)
         self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.next_eviction = None
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
             if key.startswith('user:'):
                 username = key[5:]
                 self.levels[username] = self.parse_limits(value)
+        self.configured_users = set(self.levels)
+
+    def _evict_idle_users(self, now):
+        """Forget the water levels of users whose buckets have drained."""
+        if self.next_eviction is not None and now < self.next_eviction:
+            return
+        self.next_eviction = now + self.EVICTION_INTERVAL
+        for username, limits in self.levels.items():
+            if username in self.configured_users:
+                continue
+            if all(limit.is_idle(now) for limit in limits):
+                del self.levels[username]
 
     def get_limits(self, username=None):
         """
@@ -311,8 +384,10 @@ class Limiter(object):
         """
         delays = []
 
-        for limit in self.levels[username]:
-            delay = limit(verb, url)
+        if self.limits:
+            self._evict_idle_users(self.limits[0]._get_time())
+        for limit in _matching_limits(self.levels[username], verb, url):
+            delay = limit.fill()
             if delay:
                 delays.append((delay, limit.error_message))
 
@@ -383,6 +458,109 @@ class Limiter(object):
         return result
 
 
+class MemcachedLimiter(Limiter):
+    """
+    Rate-limit checking class which keeps the water levels in memcached,
+    so all the API workers using the same memcached_servers enforce one
+    budget per user.
+
+    The level of each user and limit is stored as the time its bucket
+    will be empty again, updated with gets/cas so concurrent requests are
+    not lost, and expires from memcached once the bucket has drained.  If
+    memcached is unreachable, requests are let through.
+    """
+
+    CAS_RETRIES = 10
+
+    def __init__(self, limits, **kwargs):
+        """
+        Initialize the new `MemcachedLimiter`.
+
+        @param limits: List of `Limit` objects
+        """
+        super(MemcachedLimiter, self).__init__(limits, **kwargs)
+        if FLAGS.memcached_servers:
+            import memcache
+        else:
+            from nova.common import memorycache as memcache
+        self.mc = memcache.Client(FLAGS.memcached_servers, debug=0,
+                                  cache_cas=True)
+
+    def _limits_for(self, username):
+        # NOTE: get() so that unconfigured users are not added to levels
+        return self.levels.get(username, self.limits)
+
+    @staticmethod
+    def _key(username, limit):
+        key = "%s\n%s %s %d %d" % (username, limit.verb, limit.regex,
+                                    limit.value, limit.unit)
+        return "ratelimit-%s" % hashlib.md5(utils.utf8(key)).hexdigest()
+
+    def _fill(self, username, limit):
+        """Memcached version of `Limit.fill`."""
+        key = self._key(username, limit)
+        for _attempt in xrange(self.CAS_RETRIES):
+            now = limit._get_time()
+            empty_at = self.mc.gets(key)
+            water_level = max(float(empty_at or 0) - now, 0)
+            water_level += limit.request_value
+            difference = water_level - limit.capacity
+            if difference > 0:
+                return difference
+            value = repr(now + water_level)
+            expire = int(math.ceil(water_level))
+            if empty_at is None:
+                stored = self.mc.add(key, value, time=expire)
+            else:
+                stored = self.mc.cas(key, value, time=expire)
+            if stored:
+                return None
+        LOG.warn(_("Could not update the rate limit of %(username)s for "
+                   "%(uri)s, letting the request through"),
+                 {'username': username, 'uri': limit.uri})
+
+    def get_limits(self, username=None):
+        """
+        Return the limits for a given user.
+        """
+        limits = self._limits_for(username)
+        levels = self.mc.get_multi([self._key(username, limit)
+                                    for limit in limits])
+        result = []
+        for limit in limits:
+            now = limit._get_time()
+            empty_at = levels.get(self._key(username, limit))
+            water_level = max(float(empty_at or 0) - now, 0)
+            display = limit.display()
+            display["remaining"] = int(math.floor(
+                (limit.capacity - water_level) / limit.capacity *
+                limit.value))
+            display["resetTime"] = int(now + max(
+                water_level + limit.request_value - limit.capacity, 0))
+            result.append(display)
+        return result
+
+    def check_for_delay(self, verb, url, username=None):
+        """
+        Check the given verb/user/user triplet for limit.
+
+        @return: Tuple of delay (in seconds) and error message (or None, None)
+        """
+        delays = []
+
+        limits = self._limits_for(username)
+        for limit in _matching_limits(limits, verb, url):
+            delay = self._fill(username, limit)
+            if delay:
+                delays.append((delay, limit.error_message))
+
+        if delays:
+            delays.sort()
+            return delays[0]
+
+        return None, None
+
+
 class WsgiLimiter(object):
     """
     Rate-limit checking from a WSGI application. Uses an in-memory `Limiter`.
@@ -27,6 +27,10 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Incremented whenever a compiled template element is modified, so that
+# the templates are compiled again
+_generation = 0
+
 
 def validate_schema(xml, schema_name):
     if isinstance(xml, str):
@@ -172,6 +176,8 @@ class TemplateElement(object):
         self._text = None
         self._children = []
         self._childmap = {}
+        self._compiled = {}
+        self._was_compiled = False
 
         # Run the incoming attributes through set() so that they
         # become selectorized
@@ -219,6 +225,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        self._changed()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -240,6 +247,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        self._changed()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -253,6 +261,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        self._changed()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -266,6 +275,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        self._changed()
 
     def get(self, key):
         """Get an attribute.
@@ -296,6 +306,7 @@ class TemplateElement(object):
             value = Selector(value)
 
         self.attrib[key] = value
+        self._changed()
 
     def keys(self):
         """Return the attribute names."""
@@ -307,6 +318,13 @@ class TemplateElement(object):
 
         return self.attrib.items()
 
+    def _changed(self):
+        """Forget the templates compiled with this element."""
+
+        global _generation
+        if self._was_compiled:
+            _generation += 1
+
     def unwrap(self):
         """Unwraps a template to return a template element."""
 
@@ -437,6 +455,25 @@ class TemplateElement(object):
         # Don't render if datum is None
         return datum is not None
 
+    def compile(self, patches=[]):
+        """Compile the template element.
+
+        Returns a CompiledElement rendering this template element
+        with the other template elements applied, as render() and
+        Template._serialize() do.  The result is cached until a
+        template element is modified.
+
+        :param patches: A list of other template elements to apply
+                        when rendering this template element.
+        """
+
+        key = tuple(patches)
+        generation, compiled = self._compiled.get(key, (None, None))
+        if generation != _generation:
+            compiled = CompiledElement([self] + list(patches))
+            self._compiled[key] = (_generation, compiled)
+        return compiled
+
     def _text_get(self):
         """Template element text.
 
@@ -453,9 +490,11 @@ class TemplateElement(object):
             value = Selector(value)
 
         self._text = value
+        self._changed()
 
     def _text_del(self):
         self._text = None
+        self._changed()
 
     text = property(_text_get, _text_set, _text_del)
 
@@ -512,6 +551,145 @@ def SubTemplateElement(parent, tag, attrib=None, selector=None,
     return elem
 
 
+def compile_selector(selector):
+    """Compile a selector.
+
+    Returns a callable equivalent to the selector.  The chains of
+    plain Selector instances indexing by zero or one key are turned
+    into direct functions; other selectors are returned unchanged.
+    """
+
+    if type(selector) is not Selector or len(selector.chain) > 1:
+        return selector
+    elif not selector.chain:
+        return lambda obj, do_raise=False: obj
+
+    key = selector.chain[0]
+    if callable(key):
+        return lambda obj, do_raise=False: key(obj)
+
+    def select(obj, do_raise=False):
+        try:
+            return obj[key]
+        except (KeyError, IndexError):
+            if do_raise:
+                raise KeyError(key)
+            return None
+    return select
+
+
+class CompiledElement(object):
+    """Represent a compiled template element.
+
+    The template element is merged once with the elements applied to
+    it, and the merge of their children is compiled likewise.  The
+    text and attributes of all the elements are kept in the order in
+    which they are applied, so that the rendered elements are the same
+    as those of Template._serialize().
+    """
+
+    def __init__(self, siblings):
+        """Compile template elements.
+
+        :param siblings: The TemplateElement instance to compile,
+                         followed by the TemplateElement instances to
+                         apply to it.
+        """
+
+        master = siblings[0]
+        self.tag = master.tag
+        self.dyntag = callable(master.tag)
+        self.selector = compile_selector(master.selector)
+        self.subselector = master.subselector
+        if self.subselector is not None:
+            self.subselector = compile_selector(self.subselector)
+        self.will_render = master.will_render
+
+        # The text and attribute selectors, in the order applied; the
+        # key is None for the text
+        self.selectors = []
+        for sibling in siblings:
+            sibling._was_compiled = True
+            if sibling.text is not None:
+                self.selectors.append((None, compile_selector(sibling.text)))
+            self.selectors.extend((key, compile_selector(value))
+                                  for key, value in sibling.attrib.items())
+
+        # Merge the children of the siblings
+        self.children = []
+        seen = set()
+        for idx, sibling in enumerate(siblings):
+            for child in sibling:
+                if child.tag in seen:
+                    continue
+                seen.add(child.tag)
+
+                nieces = [child]
+                for sib in siblings[idx + 1:]:
+                    if child.tag in sib:
+                        nieces.append(sib[child.tag])
+                self.children.append(CompiledElement(nieces))
+
+    def _render(self, parent, datum, nsmap):
+        """Render one etree.Element instance and its children."""
+
+        if self.dyntag:
+            tagname = self.tag(datum)
+        else:
+            tagname = self.tag
+        elem = etree.Element(tagname, nsmap=nsmap)
+        if parent is not None:
+            parent.append(elem)
+
+        if datum is not None:
+            for key, selector in self.selectors:
+                if key is None:
+                    elem.text = unicode(selector(datum))
+                    continue
+                try:
+                    elem.set(key, unicode(selector(datum, True)))
+                except KeyError:
+                    # Attribute has no value, so don't include it
+                    pass
+
+        for child in self.children:
+            child.render(elem, datum)
+
+        return elem
+
+    def render(self, parent, obj, nsmap=None):
+        """Render an object.
+
+        Renders an object and its children against the compiled
+        template element.  Returns the first etree.Element instance
+        rendered, or None.
+
+        :param parent: The parent for the etree.Element instances.
+        :param obj: The object to render.
+        :param nsmap: An optional namespace dictionary to attach to
+                      the etree.Element instances.
+        """
+
+        data = None if obj is None else self.selector(obj)
+        if not self.will_render(data):
+            return None
+        elif data is None:
+            return self._render(parent, None, nsmap)
+
+        if not isinstance(data, list):
+            data = [data]
+        elif parent is None:
+            raise ValueError(_('root element selecting a list'))
+
+        elems = []
+        for datum in data:
+            if self.subselector is not None:
+                datum = self.subselector(datum)
+            elems.append(self._render(parent, datum, nsmap))
+        if elems:
+            return elems[0]
+
+
 class Template(object):
     """Represent a template."""
 
@@ -610,7 +788,7 @@ class Template(object):
         nsmap = self._nsmap()
 
         # Form the element tree
-        return self._serialize(None, obj, siblings, nsmap)
+        return siblings[0].compile(siblings[1:]).render(None, obj, nsmap)
 
     def _siblings(self):
         """Hook method for computing root siblings.
@@ -27,6 +27,7 @@ class Client(object):
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
         self.cache = {}
+        self.cas_ids = {}
 
     def get(self, key):
         """Retrieves the value for a key or None.
@@ -48,6 +49,29 @@ class Client(object):
         self.cache[key] = (timeout, value)
         return True
 
+    def get_multi(self, keys):
+        """Retrieves the values of the keys that are set, in a dict."""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def gets(self, key):
+        """Retrieves the value for a key and remembers it for cas()."""
+        value = self.get(key)
+        self.cas_ids[key] = self.cache.get(key)
+        return value
+
+    def cas(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key unless it changed since gets()."""
+        if key not in self.cas_ids:
+            return self.set(key, value, time, min_compress_len)
+        if self.cache.get(key) is not self.cas_ids.pop(key):
+            return False
+        return self.set(key, value, time, min_compress_len)
+
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
         if not self.get(key) is None:
@@ -522,11 +522,9 @@ class API(base.Base):
 
         return size
 
-    def _update_image_block_device_mapping(self, elevated_context,
-                                           instance_type, instance_uuid,
-                                           mappings):
-        """tell vm driver to create ephemeral/swap device at boot time by
-        updating BlockDeviceMapping
+    def _image_block_device_mapping_values(self, instance_type, mappings):
+        """Yields the BlockDeviceMapping values of the ephemeral and swap
+        devices of the image mappings, without the instance_uuid.
         """
         for bdm in block_device.mappings_prepend_dev(mappings):
             LOG.debug(_("bdm %s"), bdm)
@@ -542,25 +540,32 @@ class API(base.Base):
             if size == 0:
                 continue
 
-            values = {
-                'instance_uuid': instance_uuid,
-                'device_name': bdm['device'],
-                'virtual_name': virtual_name,
-                'volume_size': size}
+            yield {'device_name': bdm['device'],
+                   'virtual_name': virtual_name,
+                   'volume_size': size}
+
+    def _update_image_block_device_mapping(self, elevated_context,
+                                           instance_type, instance_uuid,
+                                           mappings):
+        """tell vm driver to create ephemeral/swap device at boot time by
+        updating BlockDeviceMapping
+        """
+        for values in self._image_block_device_mapping_values(instance_type,
+                                                              mappings):
+            values['instance_uuid'] = instance_uuid
             self.db.block_device_mapping_update_or_create(elevated_context,
                                                           values)
 
-    def _update_block_device_mapping(self, elevated_context,
-                                     instance_type, instance_uuid,
+    def _block_device_mapping_values(self, instance_type,
                                      block_device_mapping):
-        """tell vm driver to attach volume at boot time by updating
-        BlockDeviceMapping
+        """Yields the BlockDeviceMapping values of the requested block
+        device mapping, without the instance_uuid.
         """
         LOG.debug(_("block_device_mapping %s"), block_device_mapping)
         for bdm in block_device_mapping:
             assert 'device_name' in bdm
 
-            values = {'instance_uuid': instance_uuid}
+            values = {}
             for key in ('device_name', 'delete_on_termination', 'virtual_name',
                         'snapshot_id', 'volume_id', 'volume_size',
                         'no_device'):
@@ -583,6 +588,17 @@ class API(base.Base):
                           'snapshot_id', 'volume_id', 'volume_size'):
                     values[k] = None
 
+            yield values
+
+    def _update_block_device_mapping(self, elevated_context,
+                                     instance_type, instance_uuid,
+                                     block_device_mapping):
+        """tell vm driver to attach volume at boot time by updating
+        BlockDeviceMapping
+        """
+        for values in self._block_device_mapping_values(instance_type,
+                                                        block_device_mapping):
+            values['instance_uuid'] = instance_uuid
             self.db.block_device_mapping_update_or_create(elevated_context,
                                                           values)
 
@@ -605,6 +621,45 @@ class API(base.Base):
             self._update_block_device_mapping(elevated,
                     instance_type, instance_uuid, mapping)
 
+    def _new_instance_block_device_mapping(self, instance_type, image,
+                                           block_device_mapping):
+        """Returns the BlockDeviceMapping values _populate_instance_for_bdm
+        leaves a new instance with, without any DB call.
+
+        The mappings are applied in the same order, and merged the same way
+        as block_device_mapping_update_or_create does.
+        """
+        values_list = []
+        mappings = image['properties'].get('mappings', [])
+        if mappings:
+            values_list.extend(self._image_block_device_mapping_values(
+                    instance_type, mappings))
+
+        image_bdm = image['properties'].get('block_device_mapping', [])
+        for mapping in (image_bdm, block_device_mapping):
+            if not mapping:
+                continue
+            values_list.extend(self._block_device_mapping_values(
+                    instance_type, mapping))
+
+        bdms = []
+        for values in values_list:
+            for bdm in bdms:
+                if bdm['device_name'] == values['device_name']:
+                    break
+            else:
+                bdm = {}
+                bdms.append(bdm)
+            bdm.update(values)
+
+            # Only one device per swap or ephemeral virtual name is kept
+            virtual_name = values['virtual_name']
+            if (virtual_name is not None and
+                block_device.is_swap_or_ephemeral(virtual_name)):
+                bdms = [other for other in bdms if other is bdm or
+                        other.get('virtual_name') != virtual_name]
+        return bdms
+
     def _populate_instance_shutdown_terminate(self, instance, image,
                                               block_device_mapping):
         """Populate instance shutdown_terminate information."""
@@ -695,6 +750,49 @@ class API(base.Base):
 
         return instance
 
+    def create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options, security_group, block_device_mapping,
+            reservations, hosts):
+        """Create the DB entries for one new instance per host in a single
+        transaction.
+
+        The instances are created already assigned to their host, with
+        launch indexes in the order of hosts.  This is called by the
+        scheduler for requests of more than one instance.
+        """
+        # The fields the instances share are filled in on base_options
+        # itself, as create_db_entry_for_new_instance does, so they are
+        # in the request_spec the hosts get.
+        self._populate_instance_for_create(base_options, image,
+                                           security_group)
+        del base_options['uuid']
+
+        now = timeutils.utcnow()
+        values_list = []
+        for launch_index, host in enumerate(hosts):
+            instance = dict(base_options, uuid=str(utils.gen_uuid()),
+                            launch_index=launch_index, host=host,
+                            scheduled_at=now)
+
+            self._populate_instance_names(instance)
+
+            self._populate_instance_shutdown_terminate(instance, image,
+                                                       block_device_mapping)
+            values_list.append(instance)
+
+        instances = self.db.instance_create_bulk(context, values_list,
+                self._new_instance_block_device_mapping(instance_type, image,
+                                                        block_device_mapping))
+
+        for instance in instances:
+            notifications.send_update_with_states(context, instance, None,
+                    vm_states.BUILDING, None, None, service="api")
+
+        if reservations:
+            QUOTAS.commit(context, reservations)
+
+        return instances
+
     def _schedule_run_instance(self,
             use_call,
             context, base_options,
@@ -716,7 +814,7 @@ class API(base.Base):
                 locals())
 
         request_spec = {
-            'image': jsonutils.to_primitive(image),
+            'image': jsonutils.to_primitive_fast(image),
             'instance_properties': base_options,
             'instance_type': instance_type,
             'num_instances': num_instances,
@@ -1419,7 +1517,7 @@ class API(base.Base):
             "instance_type_id": new_instance_type['id'],
             "image": image,
             "update_db": False,
-            "request_spec": jsonutils.to_primitive(request_spec),
+            "request_spec": jsonutils.to_primitive_fast(request_spec),
             "filter_properties": filter_properties,
         }
         self.scheduler_rpcapi.prep_resize(context, **args)
@@ -1538,6 +1636,16 @@ class API(base.Base):
         return self.compute_rpcapi.get_console_output(context,
                 instance=instance, tail_length=tail_length)
 
+    @wrap_check_policy
+    def get_console_output_range(self, context, instance, offset=None,
+                                 tail_length=None):
+        """Get console output for an instance from offset.
+
+        Returns a dict with the output and the offset to ask for next.
+        """
+        return self.compute_rpcapi.get_console_output_range(context,
+                instance=instance, offset=offset, tail_length=tail_length)
+
     @wrap_check_policy
     def lock(self, context, instance):
         """Lock the given instance."""
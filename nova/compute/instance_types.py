@@ -20,20 +20,103 @@
 
 """Built-in instance properties."""
 
+import copy
 import re
+import time
 
 from nova import context
 from nova import db
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 
+instance_type_opts = [
+    cfg.IntOpt('instance_type_cache_ttl',
+               default=60,
+               help='Number of seconds all the instance types are cached '
+                    'for before they are read from the database again. '
+                    'Set to 0 to disable the cache'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(instance_type_opts)
 LOG = logging.getLogger(__name__)
 
 INVALID_NAME_REGEX = re.compile("[^\w\.\- ]")
 
 
+class InstanceTypeCache(object):
+    """Process wide cache of the instance types.
+
+    All the instance types, deleted ones included, are loaded with their
+    extra specs in one query and indexed by id, name and flavorid.  The
+    whole cache is reloaded once it is instance_type_cache_ttl seconds
+    old, and dropped when instance types are created, deleted or get new
+    extra specs through this process.  Lookups that miss go to the
+    database, so instance types created elsewhere are found right away.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._expires_at = 0
+        self._by_id = {}
+        self._by_name = {}
+        self._by_flavorid = {}
+        self._deleted_by_flavorid = {}
+
+    def _load(self):
+        ctxt = context.get_admin_context(read_deleted="yes")
+        inst_types = db.instance_type_get_all(ctxt, inactive=True)
+        self.clear()
+        for inst_type in inst_types:
+            if inst_type['deleted']:
+                self._deleted_by_flavorid.setdefault(inst_type['flavorid'],
+                                                     inst_type)
+                continue
+            self._by_id[inst_type['id']] = inst_type
+            self._by_name[inst_type['name']] = inst_type
+            self._by_flavorid[inst_type['flavorid']] = inst_type
+        self._expires_at = time.time() + FLAGS.instance_type_cache_ttl
+
+    def _get(self, index, key):
+        if FLAGS.instance_type_cache_ttl <= 0:
+            return None
+        if self._expires_at < time.time():
+            self._load()
+        inst_type = getattr(self, index).get(key)
+        if inst_type is None:
+            return None
+        return copy.deepcopy(inst_type)
+
+    def get_by_id(self, instance_type_id):
+        return self._get('_by_id', instance_type_id)
+
+    def get_by_name(self, name):
+        return self._get('_by_name', name)
+
+    def get_by_flavor_id(self, flavorid, read_deleted):
+        """Returns the active instance type with this flavorid, or with
+        read_deleted="yes" a deleted one when there is no active one."""
+        if read_deleted not in ("yes", "no"):
+            return None
+        inst_type = self._get('_by_flavorid', flavorid)
+        if inst_type is None and read_deleted == "yes":
+            inst_type = self._get('_deleted_by_flavorid', flavorid)
+        return inst_type
+
+
+_instance_type_cache = InstanceTypeCache()
+
+
+def invalidate_cache():
+    """Drops the cached instance types, e.g. after their extra specs
+    changed."""
+    _instance_type_cache.clear()
+
+
 def create(name, memory, vcpus, root_gb, ephemeral_gb, flavorid, swap=None,
            rxtx_factor=None):
     """Creates instance types."""
@@ -81,10 +164,13 @@ def create(name, memory, vcpus, root_gb, ephemeral_gb, flavorid, swap=None,
     kwargs['flavorid'] = unicode(flavorid)
 
     try:
-        return db.instance_type_create(context.get_admin_context(), kwargs)
+        inst_type = db.instance_type_create(context.get_admin_context(),
+                                            kwargs)
     except exception.DBError, e:
         LOG.exception(_('DB error: %s') % e)
         raise exception.InstanceTypeCreateFailed()
+    invalidate_cache()
+    return inst_type
 
 
 def destroy(name):
@@ -95,6 +181,7 @@ def destroy(name):
     except (AssertionError, exception.NotFound):
         LOG.exception(_('Instance type %s not found for deletion') % name)
         raise exception.InstanceTypeNotFoundByName(instance_type_name=name)
+    invalidate_cache()
 
 
 def get_all_types(inactive=False, filters=None):
@@ -125,6 +212,10 @@ def get_instance_type(instance_type_id):
     if instance_type_id is None:
         return get_default_instance_type()
 
+    inst_type = _instance_type_cache.get_by_id(instance_type_id)
+    if inst_type is not None:
+        return inst_type
+
     ctxt = context.get_admin_context()
     return db.instance_type_get(ctxt, instance_type_id)
 
@@ -134,6 +225,10 @@ def get_instance_type_by_name(name):
     if name is None:
         return get_default_instance_type()
 
+    inst_type = _instance_type_cache.get_by_name(name)
+    if inst_type is not None:
+        return inst_type
+
     ctxt = context.get_admin_context()
     return db.instance_type_get_by_name(ctxt, name)
 
@@ -145,5 +240,9 @@ def get_instance_type_by_flavor_id(flavorid, read_deleted="yes"):
 
     :raises: FlavorNotFound
     """
+    inst_type = _instance_type_cache.get_by_flavor_id(flavorid, read_deleted)
+    if inst_type is not None:
+        return inst_type
+
     ctxt = context.get_admin_context(read_deleted=read_deleted)
     return db.instance_type_get_by_flavor_id(ctxt, flavorid)
@@ -141,6 +141,11 @@ compute_opts = [
                default=60,
                help="Number of seconds between instance info_cache self "
                         "healing updates"),
+    cfg.IntOpt("heal_instance_info_cache_batch_size",
+               default=10,
+               help="Number of instances whose info_cache is updated by "
+                    "each self healing update, with one call to the "
+                    "network API"),
     cfg.ListOpt('additional_compute_capabilities',
                default=[],
                help='a list of additional capabilities for this compute '
@@ -151,6 +156,10 @@ compute_opts = [
     cfg.BoolOpt('instance_usage_audit',
                default=False,
                help="Generate periodic compute.instance.exists notifications"),
+    cfg.IntOpt('console_output_max_bytes',
+               default=1024 * 1024,
+               help='Maximum number of bytes of console output returned '
+                    'when reading from an offset'),
 
     ]
 
@@ -298,7 +307,7 @@ def _get_additional_capabilities():
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
-    RPC_API_VERSION = '1.14'
+    RPC_API_VERSION = '1.15'
 
     def __init__(self, compute_driver=None, *args, **kwargs):
         """Load configuration options and connect to the hypervisor."""
@@ -319,9 +328,6 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_api = network.API()
         self.volume_api = volume.API()
         self.network_manager = importutils.import_object(FLAGS.network_manager)
-        self._last_host_check = 0
-        self._last_bw_usage_poll = 0
-        self._last_info_cache_heal = 0
         self.compute_api = compute.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
@@ -637,7 +643,8 @@ class ComputeManager(manager.SchedulerDependentManager):
             return
 
         filters = {'vm_state': vm_states.BUILDING}
-        building_insts = self.db.instance_get_all_by_filters(context, filters)
+        building_insts = self.db.instance_get_all_by_filters(context, filters,
+                                                             use_slave=False)
 
         for instance in building_insts:
             if timeutils.is_older_than(instance['created_at'], timeout):
@@ -717,7 +724,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         image_id = image_meta['id']
         LOG.debug(_("image_id=%(image_id)s, image_size_bytes="
                     "%(size_bytes)d, allowed_size_bytes="
-                    "%(allowed_size_bytes)d") % locals(),
+                    "%(allowed_size_bytes)d"), locals(),
                   instance=instance)
 
         if size_bytes > allowed_size_bytes:
@@ -897,7 +904,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         bdms = self.db.block_device_mapping_get_all_by_instance(context,
                                                                 instance_uuid)
         for bdm in bdms:
-            LOG.debug(_("terminating bdm %s") % bdm,
+            LOG.debug(_("terminating bdm %s"), bdm,
                       instance_uuid=instance_uuid)
             if bdm['volume_id'] and bdm['delete_on_termination']:
                 volume = self.volume_api.get(context, bdm['volume_id'])
@@ -1223,18 +1230,18 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         images = fetch_images()
         num_images = len(images)
-        LOG.debug(_("Found %(num_images)d images (rotation: %(rotation)d)")
-                  % locals(), instance_uuid=instance_uuid)
+        LOG.debug(_("Found %(num_images)d images (rotation: %(rotation)d)"),
+                  locals(), instance_uuid=instance_uuid)
         if num_images > rotation:
             # NOTE(sirp): this deletes all backups that exceed the rotation
             # limit
             excess = len(images) - rotation
-            LOG.debug(_("Rotating out %d backups") % excess,
+            LOG.debug(_("Rotating out %d backups"), excess,
                       instance_uuid=instance_uuid)
             for i in xrange(excess):
                 image = images.pop()
                 image_id = image['id']
-                LOG.debug(_("Deleting image %s") % image_id,
+                LOG.debug(_("Deleting image %s"), image_id,
                           instance_uuid=instance_uuid)
                 image_service.delete(context, image_id)
 
@@ -1393,7 +1400,7 @@ class ComputeManager(manager.SchedulerDependentManager):
     def change_instance_metadata(self, context, instance_uuid, diff):
         """Update the metadata published to the instance."""
         instance_ref = self.db.instance_get_by_uuid(context, instance_uuid)
-        LOG.debug(_("Changing instance metadata according to %(diff)r") %
+        LOG.debug(_("Changing instance metadata according to %(diff)r"),
                   locals(), instance=instance_ref)
         self.driver.change_instance_metadata(context, instance_ref, diff)
 
@@ -1903,23 +1910,41 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         LOG.audit(_("Get console output"), context=context,
                   instance=instance)
-        output = self.driver.get_console_output(instance)
+        if tail_length is None:
+            output = self.driver.get_console_output(instance)
+        else:
+            output, _offset = self.driver.get_console_output_range(
+                    instance, tail_length=self._tail_length(tail_length))
+
+        return output.decode('utf-8', 'replace').encode('ascii', 'replace')
+
+    @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
+    @wrap_instance_fault
+    def get_console_output_range(self, context, instance, offset=None,
+                                 tail_length=None):
+        """Send console output from offset, or its last tail_length lines.
 
+        At most console_output_max_bytes are read from an offset.  The
+        offset to read from next time is sent with the output so that
+        callers can follow the console without getting it all again.
+        """
+        context = context.elevated()
+        LOG.audit(_("Get console output from offset %s"), offset,
+                  context=context, instance=instance)
         if tail_length is not None:
-            output = self._tail_log(output, tail_length)
+            tail_length = self._tail_length(tail_length)
+        output, next_offset = self.driver.get_console_output_range(
+                instance, offset=offset, tail_length=tail_length,
+                max_bytes=FLAGS.console_output_max_bytes)
 
-        return output.decode('utf-8', 'replace').encode('ascii', 'replace')
+        output = output.decode('utf-8', 'replace').encode('ascii', 'replace')
+        return {'output': output, 'offset': next_offset}
 
-    def _tail_log(self, log, length):
+    def _tail_length(self, length):
         try:
-            length = int(length)
+            return int(length)
         except ValueError:
-            length = 0
-
-        if length == 0:
-            return ''
-        else:
-            return '\n'.join(log.split('\n')[-int(length):])
+            return 0
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @wrap_instance_fault
@@ -2421,30 +2446,25 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.driver.destroy(instance_ref, self._legacy_nw_info(network_info),
                             block_device_info)
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='heal_instance_info_cache_interval')
     def _heal_instance_info_cache(self, context):
         """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
-        calling to the network manager.
+        info_cache's network information for a batch of other instances
+        by calling to the network manager.
 
         This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
+        that live on this host.  On each call, we pop some off of a
+        list, pull the DB records, and try the call to the network API.
         If anything errors, we don't care.  It's possible the instance
         has been deleted, etc.
         """
-        heal_interval = FLAGS.heal_instance_info_cache_interval
-        if not heal_interval:
-            return
-        curr_time = time.time()
-        if self._last_info_cache_heal + heal_interval > curr_time:
+        if not FLAGS.heal_instance_info_cache_interval:
             return
-        self._last_info_cache_heal = curr_time
 
         instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
-        instance = None
+        instances = []
 
-        while not instance or instance['host'] != self.host:
+        while len(instances) < FLAGS.heal_instance_info_cache_batch_size:
             if instance_uuids:
                 try:
                     instance = self.db.instance_get_by_uuid(context,
@@ -2452,6 +2472,10 @@ class ComputeManager(manager.SchedulerDependentManager):
                 except exception.InstanceNotFound:
                     # Instance is gone.  Try to grab another.
                     continue
+            elif instances:
+                # No more in our copy of uuids.  Heal what we have and
+                # pull from the DB next time.
+                break
             else:
                 # No more in our copy of uuids.  Pull from the DB.
                 db_instances = self.db.instance_get_all_by_host(
@@ -2462,14 +2486,17 @@ class ComputeManager(manager.SchedulerDependentManager):
                 instance = db_instances.pop(0)
                 instance_uuids = [inst['uuid'] for inst in db_instances]
                 self._instance_uuids_to_heal = instance_uuids
+            if instance['host'] == self.host:
+                instances.append(instance)
 
-        # We have an instance now and it's ours
+        # We have instances now and they are ours
         try:
-            # Call to network API to get instance info.. this will
-            # force an update to the instance's info_cache
-            self.network_api.get_instance_nw_info(context, instance)
-            LOG.debug(_('Updated the info_cache for instance'),
-                    instance=instance)
+            # Call to network API to get the instances info.. this will
+            # force an update to their info_caches
+            self.network_api.get_instances_nw_info(context, instances)
+            for instance in instances:
+                LOG.debug(_('Updated the info_cache for instance'),
+                          instance=instance)
         except Exception:
             # We don't care about any failures
             pass
@@ -2586,45 +2613,35 @@ class ComputeManager(manager.SchedulerDependentManager):
                                               num_instances,
                                               time.time() - start_time))
 
-    @manager.periodic_task
+    @manager.periodic_task(spacing='bandwith_poll_interval')
     def _poll_bandwidth_usage(self, context, start_time=None, stop_time=None):
         if not start_time:
             start_time = utils.last_completed_audit_period()[1]
 
-        curr_time = time.time()
-        if curr_time - self._last_bw_usage_poll > FLAGS.bandwith_poll_interval:
-            self._last_bw_usage_poll = curr_time
-            LOG.info(_("Updating bandwidth usage cache"))
+        LOG.info(_("Updating bandwidth usage cache"))
 
-            instances = self.db.instance_get_all_by_host(context, self.host)
-            try:
-                bw_usage = self.driver.get_all_bw_usage(instances, start_time,
-                        stop_time)
-            except NotImplementedError:
-                # NOTE(mdragon): Not all hypervisors have bandwidth polling
-                # implemented yet.  If they don't it doesn't break anything,
-                # they just don't get the info in the usage events.
-                return
-
-            for usage in bw_usage:
-                self.db.bw_usage_update(context,
-                                        usage['uuid'],
-                                        usage['mac_address'],
-                                        start_time,
-                                        usage['bw_in'], usage['bw_out'])
+        instances = self.db.instance_get_all_by_host(context, self.host)
+        try:
+            bw_usage = self.driver.get_all_bw_usage(instances, start_time,
+                    stop_time)
+        except NotImplementedError:
+            # NOTE(mdragon): Not all hypervisors have bandwidth polling
+            # implemented yet.  If they don't it doesn't break anything,
+            # they just don't get the info in the usage events.
+            return
 
-    @manager.periodic_task
+        self.db.bw_usage_bulk_update(context, bw_usage, start_time)
+
+    @manager.periodic_task(spacing='host_state_interval',
+                           run_immediately=True)
     def _report_driver_status(self, context):
-        curr_time = time.time()
-        if curr_time - self._last_host_check > FLAGS.host_state_interval:
-            self._last_host_check = curr_time
-            LOG.info(_("Updating host status"))
-            # This will grab info about the host and queue it
-            # to be sent to the Schedulers.
-            capabilities = _get_additional_capabilities()
-            capabilities['host_ip'] = FLAGS.my_ip
-            capabilities.update(self.driver.get_host_stats(refresh=True))
-            self.update_service_capabilities(capabilities)
+        LOG.info(_("Updating host status"))
+        # This will grab info about the host and queue it
+        # to be sent to the Schedulers.
+        capabilities = _get_additional_capabilities()
+        capabilities['host_ip'] = FLAGS.my_ip
+        capabilities.update(self.driver.get_host_stats(refresh=True))
+        self.update_service_capabilities(capabilities)
 
     @manager.periodic_task(ticks_between_runs=10)
     def _sync_power_states(self, context):
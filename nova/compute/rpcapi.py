@@ -75,6 +75,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         1.12 - Remove instance_uuid, add instance argument to confirm_resize()
         1.13 - Remove instance_uuid, add instance argument to detach_volume()
         1.14 - Remove instance_uuid, add instance argument to finish_resize()
+        1.15 - Adds get_console_output_range()
     '''
 
     BASE_RPC_API_VERSION = '1.0'
@@ -98,14 +99,14 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def add_fixed_ip_to_instance(self, ctxt, instance, network_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('add_fixed_ip_to_instance',
                 instance=instance_p, network_id=network_id),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
                 version='1.8')
 
     def attach_volume(self, ctxt, instance, volume_id, mountpoint):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('attach_volume',
                 instance=instance_p, volume_id=volume_id,
                 mountpoint=mountpoint),
@@ -114,7 +115,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def check_can_live_migrate_destination(self, ctxt, instance, destination,
             block_migration, disk_over_commit):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.call(ctxt, self.make_msg('check_can_live_migrate_destination',
                            instance=instance_p,
                            block_migration=block_migration,
@@ -123,7 +124,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                   version='1.10')
 
     def check_can_live_migrate_source(self, ctxt, instance, dest_check_data):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.call(ctxt, self.make_msg('check_can_live_migrate_source',
                            instance=instance_p,
                            dest_check_data=dest_check_data),
@@ -133,14 +134,14 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def confirm_resize(self, ctxt, instance, migration_id, host,
             cast=True):
         rpc_method = self.cast if cast else self.call
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         return rpc_method(ctxt, self.make_msg('confirm_resize',
                 instance=instance_p, migration_id=migration_id),
                 topic=_compute_topic(self.topic, ctxt, host, instance),
                 version='1.12')
 
     def detach_volume(self, ctxt, instance, volume_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('detach_volume',
                 instance=instance_p, volume_id=volume_id),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -148,7 +149,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def finish_resize(self, ctxt, instance, migration_id, image, disk_info,
             host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('finish_resize',
                 instance=instance_p, migration_id=migration_id,
                 image=image, disk_info=disk_info),
@@ -161,12 +162,19 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def get_console_output(self, ctxt, instance, tail_length):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         return self.call(ctxt, self.make_msg('get_console_output',
                 instance=instance_p, tail_length=tail_length),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
                 version='1.7')
 
+    def get_console_output_range(self, ctxt, instance, offset, tail_length):
+        instance_p = jsonutils.to_primitive_fast(instance)
+        return self.call(ctxt, self.make_msg('get_console_output_range',
+                instance=instance_p, offset=offset, tail_length=tail_length),
+                topic=_compute_topic(self.topic, ctxt, None, instance),
+                version='1.15')
+
     def get_console_pool_info(self, ctxt, console_type, host):
         return self.call(ctxt, self.make_msg('get_console_pool_info',
                 console_type=console_type),
@@ -228,7 +236,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 _compute_topic(self.topic, ctxt, host, None))
 
     def pause_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('pause_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -251,7 +259,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 disk=disk), _compute_topic(self.topic, ctxt, host, None))
 
     def reboot_instance(self, ctxt, instance, reboot_type):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('reboot_instance',
                 instance=instance_p, reboot_type=reboot_type),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -370,7 +378,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def suspend_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('suspend_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -382,7 +390,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def unpause_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = jsonutils.to_primitive_fast(instance)
         self.cast(ctxt, self.make_msg('unpause_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
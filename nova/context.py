@@ -107,10 +107,27 @@ class RequestContext(object):
     read_deleted = property(_get_read_deleted, _set_read_deleted,
                             _del_read_deleted)
 
+    def __setattr__(self, name, value):
+        # Any change invalidates the dict cached by to_dict()
+        self.__dict__.pop('_dict_cache', None)
+        super(RequestContext, self).__setattr__(name, value)
+
     def update_store(self):
         local.store.context = self
 
     def to_dict(self):
+        """Return the context as a dict.
+
+        The result is cached until an attribute is set, since it is needed
+        for every RPC message and every log call made with this context.
+        """
+        context_dict = self.__dict__.get('_dict_cache')
+        if context_dict is None:
+            context_dict = self._to_dict()
+            self.__dict__['_dict_cache'] = context_dict
+        return dict(context_dict)
+
+    def _to_dict(self):
         return {'user_id': self.user_id,
                 'project_id': self.project_id,
                 'is_admin': self.is_admin,
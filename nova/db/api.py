@@ -38,11 +38,19 @@ these objects be simple dictionaries.
 :sql_connection:  string specifying the sqlalchemy connection to use, like:
                   `sqlite:///var/lib/nova/nova.sqlite`.
 
+:slave_connection:  optional sqlalchemy connection to a read-only slave of
+                    the database.  The functions taking a `use_slave`
+                    argument read from it unless use_slave is False.
+
+:db_call_stats:  record the count, latency and rows returned of the calls
+                 to each function, see :mod:`nova.db.instrumentation`.
+
 :enable_new_services:  when adding a new service to the database, is it in the
                        pool of available hardware (Default: True)
 
 """
 
+from nova.db import instrumentation
 from nova import exception
 from nova import flags
 from nova.openstack.common import cfg
@@ -65,13 +73,21 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%s',
                help='Template string to be used to generate snapshot names'),
+    cfg.IntOpt('archive_batch_size',
+               default=500,
+               help='Number of deleted rows moved to the shadow tables in '
+                    'each transaction when archiving'),
+    cfg.FloatOpt('archive_batch_delay',
+                 default=0.1,
+                 help='Seconds to wait between the archive transactions, '
+                      'so that other work gets the tables in between'),
     ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(db_opts)
 
-IMPL = utils.LazyPluggable('db_backend',
-                           sqlalchemy='nova.db.sqlalchemy.api')
+IMPL = instrumentation.InstrumentedBackend(
+    utils.LazyPluggable('db_backend', sqlalchemy='nova.db.sqlalchemy.api'))
 
 
 class NoMoreNetworks(exception.NovaException):
@@ -185,6 +201,18 @@ def service_update(context, service_id, values):
     return IMPL.service_update(context, service_id, values)
 
 
+def service_heartbeat_bulk_update(context, heartbeats):
+    """Record heartbeats for many services in one transaction.
+
+    :param heartbeats: dict of service id to a dict with the
+                       'updated_at' and 'report_count' to store.  Values
+                       older than the ones stored are ignored and unknown
+                       services are skipped.
+
+    """
+    return IMPL.service_heartbeat_bulk_update(context, heartbeats)
+
+
 ###################
 
 
@@ -193,9 +221,9 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
+def compute_node_get_all(context, use_slave=True):
     """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+    return IMPL.compute_node_get_all(context, use_slave=use_slave)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -331,9 +359,10 @@ def floating_ip_get_all_by_host(context, host):
     return IMPL.floating_ip_get_all_by_host(context, host)
 
 
-def floating_ip_get_all_by_project(context, project_id):
+def floating_ip_get_all_by_project(context, project_id, use_slave=True):
     """Get all floating ips by project."""
-    return IMPL.floating_ip_get_all_by_project(context, project_id)
+    return IMPL.floating_ip_get_all_by_project(context, project_id,
+                                               use_slave=use_slave)
 
 
 def floating_ip_get_by_address(context, address):
@@ -351,6 +380,11 @@ def floating_ip_get_by_fixed_ip_id(context, fixed_ip_id):
     return IMPL.floating_ip_get_by_fixed_ip_id(context, fixed_ip_id)
 
 
+def floating_ip_get_by_fixed_ip_ids(context, fixed_ip_ids):
+    """Get the floating ips of several fixed ips."""
+    return IMPL.floating_ip_get_by_fixed_ip_ids(context, fixed_ip_ids)
+
+
 def floating_ip_update(context, address, values):
     """Update a floating ip by address or raise if it doesn't exist."""
     return IMPL.floating_ip_update(context, address, values)
@@ -490,6 +524,11 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ips_by_virtual_interfaces(context, vif_ids):
+    """Get the fixed ips of several virtual interfaces."""
+    return IMPL.fixed_ips_by_virtual_interfaces(context, vif_ids)
+
+
 def fixed_ip_get_network(context, address):
     """Get a network for a fixed ip by address."""
     return IMPL.fixed_ip_get_network(context, address)
@@ -527,6 +566,11 @@ def virtual_interface_get_by_instance(context, instance_id):
     return IMPL.virtual_interface_get_by_instance(context, instance_id)
 
 
+def virtual_interface_get_by_instances(context, instance_ids):
+    """Gets all virtual_interfaces of several instances."""
+    return IMPL.virtual_interface_get_by_instances(context, instance_ids)
+
+
 def virtual_interface_get_by_instance_and_network(context, instance_id,
                                                            network_id):
     """Gets all virtual interfaces for instance."""
@@ -558,6 +602,13 @@ def instance_create(context, values):
     return IMPL.instance_create(context, values)
 
 
+def instance_create_bulk(context, values_list, block_device_mapping=None):
+    """Create instances from a list of values dictionaries in one
+    transaction, each with the given block device mappings."""
+    return IMPL.instance_create_bulk(context, values_list,
+                                     block_device_mapping)
+
+
 def instance_data_get_for_project(context, project_id, session=None):
     """Get (instance_count, total_cores, total_ram) for project."""
     return IMPL.instance_data_get_for_project(context, project_id,
@@ -585,32 +636,35 @@ def instance_get_all(context, columns_to_join=None):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc'):
+                                sort_dir='desc', use_slave=True):
     """Get all instances that match all filters."""
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
-                                            sort_dir)
+                                            sort_dir, use_slave=use_slave)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None,
-                                  host=None):
+                                  host=None, use_slave=True):
     """Get instances active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
     """
     return IMPL.instance_get_active_by_window(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=True):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave)
 
 
 def instance_get_all_by_project(context, project_id):
@@ -724,6 +778,15 @@ def instance_info_cache_update(context, instance_uuid, values):
     return IMPL.instance_info_cache_update(context, instance_uuid, values)
 
 
+def instance_info_cache_update_many(context, values_by_uuid):
+    """Update the info cache records of several instances at once.
+
+    :param values_by_uuid: = dict of the column values to update by
+                             instance uuid
+    """
+    return IMPL.instance_info_cache_update_many(context, values_by_uuid)
+
+
 def instance_info_cache_delete(context, instance_uuid):
     """Deletes an existing instance_info_cache record
 
@@ -755,9 +818,10 @@ def key_pair_get(context, user_id, name):
     return IMPL.key_pair_get(context, user_id, name)
 
 
-def key_pair_get_all_by_user(context, user_id):
+def key_pair_get_all_by_user(context, user_id, use_slave=True):
     """Get all key_pairs by user."""
-    return IMPL.key_pair_get_all_by_user(context, user_id)
+    return IMPL.key_pair_get_all_by_user(context, user_id,
+                                         use_slave=use_slave)
 
 
 def key_pair_count_by_user(context, user_id):
@@ -817,6 +881,11 @@ def network_get(context, network_id):
     return IMPL.network_get(context, network_id)
 
 
+def network_get_all_by_ids(context, network_ids):
+    """Return the networks with the given ids which exist."""
+    return IMPL.network_get_all_by_ids(context, network_ids)
+
+
 def network_get_all(context):
     """Return all defined networks."""
     return IMPL.network_get_all(context)
@@ -972,6 +1041,12 @@ def quota_class_destroy_all_by_name(context, class_name):
 ###################
 
 
+def quota_usage_data_get_for_project(context, project_id, session=None):
+    """Get the in_use counts of every reservable quota for a project."""
+    return IMPL.quota_usage_data_get_for_project(context, project_id,
+                                                 session=session)
+
+
 def quota_usage_create(context, project_id, resource, in_use, reserved,
                        until_refresh):
     """Create a quota usage for the given project and resource."""
@@ -1110,9 +1185,10 @@ def volume_get_all_by_instance_uuid(context, instance_uuid):
     return IMPL.volume_get_all_by_instance_uuid(context, instance_uuid)
 
 
-def volume_get_all_by_project(context, project_id):
+def volume_get_all_by_project(context, project_id, use_slave=True):
     """Get all volumes belonging to a project."""
-    return IMPL.volume_get_all_by_project(context, project_id)
+    return IMPL.volume_get_all_by_project(context, project_id,
+                                          use_slave=use_slave)
 
 
 def volume_get_by_ec2_id(context, ec2_id):
@@ -1255,9 +1331,10 @@ def security_group_get_by_name(context, project_id, group_name):
     return IMPL.security_group_get_by_name(context, project_id, group_name)
 
 
-def security_group_get_by_project(context, project_id):
+def security_group_get_by_project(context, project_id, use_slave=True):
     """Get all security groups belonging to a project."""
-    return IMPL.security_group_get_by_project(context, project_id)
+    return IMPL.security_group_get_by_project(context, project_id,
+                                              use_slave=use_slave)
 
 
 def security_group_get_by_instance(context, instance_id):
@@ -1534,6 +1611,13 @@ def bw_usage_update(context,
                                 bw_in, bw_out)
 
 
+def bw_usage_bulk_update(context, usages, start_period):
+    """Update cached bw usage for several instances and networks at once.
+       usages is a list of dicts with uuid, mac_address, bw_in and bw_out.
+       Creates new records if needed."""
+    return IMPL.bw_usage_bulk_update(context, usages, start_period)
+
+
 ####################
 
 
@@ -1883,3 +1967,28 @@ def task_log_get(context, task_name, period_beginning,
                  period_ending, host, state=None, session=None):
     return IMPL.task_log_get(context, task_name, period_beginning,
                  period_ending, host, state, session)
+
+
+####################
+
+
+def archive_deleted_rows(context, max_rows=None, older_than=None):
+    """Move soft-deleted rows into the shadow tables.
+
+    :param max_rows: Archive at most this many rows in all.
+    :param older_than: Only archive rows deleted before this datetime.
+    :returns: Dict of the number of rows archived for each table.
+    """
+    return IMPL.archive_deleted_rows(context, max_rows=max_rows,
+                                     older_than=older_than)
+
+
+def archive_deleted_rows_for_table(context, tablename, max_rows=None,
+                                   older_than=None):
+    """Move the soft-deleted rows of one table into its shadow table.
+
+    :returns: The number of rows archived.
+    """
+    return IMPL.archive_deleted_rows_for_table(context, tablename,
+                                               max_rows=max_rows,
+                                               older_than=older_than)
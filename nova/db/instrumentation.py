@@ -0,0 +1,219 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Statistics of the calls made through the DB API.
+
+When db_call_stats is set, every call to the DB backend is counted per
+function, with its latency and the number of rows it returned.  A function
+called more than db_call_repeat_threshold times for the same request id,
+which is usually an N+1 query pattern, is logged as a warning.  The
+statistics of the functions taking the most time are logged every
+db_call_stats_log_interval seconds, and get_stats() returns them all.
+"""
+
+import collections
+import functools
+import time
+
+from nova import flags
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+
+
+instrumentation_opts = [
+    cfg.BoolOpt('db_call_stats',
+                default=False,
+                help='Record the count, latency and rows returned of the '
+                     'calls to each DB API function'),
+    cfg.IntOpt('db_call_repeat_threshold',
+               default=50,
+               help='Warn when one request or RPC calls the same DB API '
+                    'function more than this many times. 0 disables it'),
+    cfg.IntOpt('db_call_stats_log_interval',
+               default=600,
+               help='Seconds between logs of the DB API functions taking '
+                    'the most time. 0 disables it'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(instrumentation_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets, the last one
+# counts the slower calls
+LATENCY_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+# Number of recent request ids whose calls are counted for repeats
+TRACKED_REQUESTS = 1000
+
+# Number of functions in the periodic log
+LOG_TOP = 20
+
+
+class FunctionStats(object):
+    """Counters of the calls to one DB API function."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.max_rows = 0
+        self.repeats = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed, rows, failed):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.rows += rows
+        self.max_rows = max(self.max_rows, rows)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed < bound:
+                self.latency[i] += 1
+                break
+        else:
+            self.latency[-1] += 1
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'errors': self.errors,
+                'total_time': self.total_time,
+                'avg_time': self.total_time / self.calls,
+                'max_time': self.max_time,
+                'rows': self.rows,
+                'max_rows': self.max_rows,
+                'repeats': self.repeats,
+                'latency': dict(zip(LATENCY_BUCKETS + (None,),
+                                    self.latency))}
+
+
+class CallStats(object):
+    """Statistics of the DB API functions, by function name."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._functions = collections.defaultdict(FunctionStats)
+        # Call counts of the tracked request ids, oldest id first in order
+        self._requests = {}
+        self._request_order = collections.deque()
+        self._last_log = time.time()
+
+    @staticmethod
+    def _count_rows(result):
+        if result is None:
+            return 0
+        if isinstance(result, (list, tuple)):
+            return len(result)
+        return 1
+
+    def _count_request_call(self, name, request_id):
+        """Returns how many times the request called the function."""
+        counts = self._requests.get(request_id)
+        if counts is None:
+            if len(self._request_order) >= TRACKED_REQUESTS:
+                del self._requests[self._request_order.popleft()]
+            counts = self._requests[request_id] = collections.defaultdict(int)
+            self._request_order.append(request_id)
+        counts[name] += 1
+        return counts[name]
+
+    def record(self, name, context, elapsed, result, failed):
+        stats = self._functions[name]
+        stats.add(elapsed, self._count_rows(result), failed)
+
+        threshold = FLAGS.db_call_repeat_threshold
+        request_id = getattr(context, 'request_id', None)
+        if threshold > 0 and request_id:
+            if self._count_request_call(name, request_id) == threshold + 1:
+                stats.repeats += 1
+                LOG.warn(_('%(name)s called more than %(threshold)d times '
+                           'for request %(request_id)s'), locals())
+
+        interval = FLAGS.db_call_stats_log_interval
+        if interval > 0 and time.time() - self._last_log >= interval:
+            self.log()
+
+    def get(self):
+        return dict((name, stats.to_dict())
+                    for name, stats in self._functions.iteritems())
+
+    def log(self):
+        self._last_log = time.time()
+        functions = sorted(self._functions.iteritems(),
+                           key=lambda item: item[1].total_time,
+                           reverse=True)
+        for name, stats in functions[:LOG_TOP]:
+            LOG.info(_('%(name)s: %(calls)d calls, %(errors)d errors, '
+                       '%(total_time).3fs total, %(avg_ms).1fms avg, '
+                       '%(max_ms).1fms max, %(rows)d rows, '
+                       '%(repeats)d repeated requests'),
+                     {'name': name, 'calls': stats.calls,
+                      'errors': stats.errors,
+                      'total_time': stats.total_time,
+                      'avg_ms': stats.total_time / stats.calls * 1000,
+                      'max_ms': stats.max_time * 1000,
+                      'rows': stats.rows, 'repeats': stats.repeats})
+
+
+_call_stats = CallStats()
+
+
+def get_stats():
+    """Returns the call statistics of each DB API function by name."""
+    return _call_stats.get()
+
+
+def log_stats():
+    """Logs the statistics of the DB API functions taking the most time."""
+    _call_stats.log()
+
+
+def reset_stats():
+    """Used by unit tests to forget about the calls made so far."""
+    _call_stats.clear()
+
+
+class InstrumentedBackend(object):
+    """Records the statistics of the calls made to a DB backend."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def _call(self, name, func, *args, **kwargs):
+        failed = True
+        result = None
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+        finally:
+            _call_stats.record(name, args[0] if args else None,
+                               time.time() - start, result, failed)
+        return result
+
+    def __getattr__(self, key):
+        func = getattr(self._backend, key)
+        if not FLAGS.db_call_stats or not callable(func):
+            return func
+        return functools.partial(self._call, key, func)
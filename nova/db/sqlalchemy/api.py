@@ -23,12 +23,15 @@ import copy
 import datetime
 import functools
 import re
+import time
 import warnings
 
 from nova import block_device
 from nova.compute import vm_states
 from nova import db
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session as db_session
+from nova.db.sqlalchemy.session import get_engine
 from nova.db.sqlalchemy.session import get_session
 from nova import exception
 from nova import flags
@@ -37,14 +40,19 @@ from nova.openstack.common import timeutils
 from nova import utils
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import OperationalError
+from sqlalchemy import MetaData
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
+from sqlalchemy.sql.expression import exists
 from sqlalchemy.sql.expression import literal_column
 from sqlalchemy.sql.expression import or_
+from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
+from sqlalchemy import Table
 
 FLAGS = flags.FLAGS
 flags.DECLARE('reserved_host_disk_mb', 'nova.scheduler.host_manager')
@@ -132,6 +140,32 @@ def require_context(f):
     return wrapper
 
 
+def replica_safe(f):
+    """Decorator for read-only calls that may be served by the slave.
+
+    When slave_connection is set, the sessions the call creates come from
+    the slave database, which may lag behind the master.  Callers that
+    must see their own writes pass use_slave=False.  A call that fails
+    on the slave is run again on the master.
+
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        use_slave = kwargs.pop('use_slave', True)
+        if not use_slave or not FLAGS.slave_connection:
+            return f(*args, **kwargs)
+        try:
+            with db_session.use_slave():
+                return f(*args, **kwargs)
+        except (exception.DBError, OperationalError), e:
+            LOG.warn(_('%(name)s failed on the slave database, retrying on '
+                       'the master: %(e)s'), {'name': f.__name__, 'e': e})
+            db_session.record_slave_error()
+        return f(*args, **kwargs)
+    return wrapper
+
+
 def require_instance_exists(f):
     """Decorator to require the specified instance to exist.
 
@@ -469,6 +503,26 @@ def service_update(context, service_id, values):
         service_ref.save(session=session)
 
 
+@require_admin_context
+def service_heartbeat_bulk_update(context, heartbeats):
+    if not heartbeats:
+        return
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.Service, session=session).\
+                       filter(models.Service.id.in_(heartbeats.keys())).\
+                       all()
+        for service_ref in rows:
+            values = heartbeats[service_ref.id]
+            # NOTE: assigning updated_at keeps the column's onupdate from
+            # replacing it with the time of the flush.
+            if (service_ref.updated_at is None or
+                service_ref.updated_at < values['updated_at']):
+                service_ref.updated_at = values['updated_at']
+            service_ref.report_count = max(service_ref.report_count,
+                                           values['report_count'])
+
+
 ###################
 
 def compute_node_get(context, compute_id, session=None):
@@ -483,6 +537,7 @@ def compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
+@replica_safe
 def compute_node_get_all(context, session=None):
     return model_query(context, models.ComputeNode, session=session).\
                     options(joinedload('service')).\
@@ -857,6 +912,7 @@ def floating_ip_get_all_by_host(context, host):
 
 
 @require_context
+@replica_safe
 def floating_ip_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
     # TODO(tr3buchet): why do we not want auto_assigned floating IPs here?
@@ -908,6 +964,15 @@ def floating_ip_get_by_fixed_ip_id(context, fixed_ip_id, session=None):
                    all()
 
 
+@require_context
+def floating_ip_get_by_fixed_ip_ids(context, fixed_ip_ids):
+    if not fixed_ip_ids:
+        return []
+    return model_query(context, models.FloatingIp).\
+                   filter(models.FloatingIp.fixed_ip_id.in_(fixed_ip_ids)).\
+                   all()
+
+
 @require_context
 def floating_ip_update(context, address, values):
     session = get_session()
@@ -1209,6 +1274,15 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+@require_context
+def fixed_ips_by_virtual_interfaces(context, vif_ids):
+    if not vif_ids:
+        return []
+    return model_query(context, models.FixedIp, read_deleted="no").\
+                 filter(models.FixedIp.virtual_interface_id.in_(vif_ids)).\
+                 all()
+
+
 @require_admin_context
 def fixed_ip_get_network(context, address):
     fixed_ip_ref = fixed_ip_get_by_address(context, address)
@@ -1300,6 +1374,20 @@ def virtual_interface_get_by_instance(context, instance_id):
     return vif_refs
 
 
+@require_context
+def virtual_interface_get_by_instances(context, instance_ids):
+    """Gets all virtual interfaces of several instances.
+
+    :param instance_ids: = ids of the instances to retrieve vifs for
+    """
+    if not instance_ids:
+        return []
+    return _virtual_interface_query(context).\
+                   filter(models.VirtualInterface.instance_id.in_(
+                          instance_ids)).\
+                   all()
+
+
 @require_context
 def virtual_interface_get_by_instance_and_network(context, instance_id,
                                                            network_id):
@@ -1356,13 +1444,8 @@ def _metadata_refs(metadata_dict, meta_class):
     return metadata_refs
 
 
-@require_context
-def instance_create(context, values):
-    """Create a new Instance record in the database.
-
-    context - request context object
-    values - dict containing column values.
-    """
+def _instance_ref_for_create(values):
+    """Build an unsaved Instance and return it with its security groups."""
     values = values.copy()
     values['metadata'] = _metadata_refs(
             values.get('metadata'), models.InstanceMetadata)
@@ -1379,24 +1462,36 @@ def instance_create(context, values):
         instance_ref['info_cache'].update(info_cache)
     security_groups = values.pop('security_groups', [])
     instance_ref.update(values)
+    return instance_ref, security_groups
 
-    def _get_sec_group_models(session, security_groups):
-        models = []
-        default_group = security_group_ensure_default(context,
-                session=session)
-        if 'default' in security_groups:
-            models.append(default_group)
-            # Generate a new list, so we don't modify the original
-            security_groups = [x for x in security_groups if x != 'default']
-        if security_groups:
-            models.extend(_security_group_get_by_names(context,
-                    session, context.project_id, security_groups))
-        return models
+
+def _instance_security_group_models(context, session, security_groups):
+    models = []
+    default_group = security_group_ensure_default(context,
+            session=session)
+    if 'default' in security_groups:
+        models.append(default_group)
+        # Generate a new list, so we don't modify the original
+        security_groups = [x for x in security_groups if x != 'default']
+    if security_groups:
+        models.extend(_security_group_get_by_names(context,
+                session, context.project_id, security_groups))
+    return models
+
+
+@require_context
+def instance_create(context, values):
+    """Create a new Instance record in the database.
+
+    context - request context object
+    values - dict containing column values.
+    """
+    instance_ref, security_groups = _instance_ref_for_create(values)
 
     session = get_session()
     with session.begin():
-        instance_ref.security_groups = _get_sec_group_models(session,
-                security_groups)
+        instance_ref.security_groups = _instance_security_group_models(
+                context, session, security_groups)
         instance_ref.save(session=session)
         # NOTE(comstud): This forces instance_type to be loaded so it
         # exists in the ref when we return.  Fixes lazy loading issues.
@@ -1408,6 +1503,95 @@ def instance_create(context, values):
     return instance_ref
 
 
+def _insert_many(session, model, rows):
+    """Inserts rows of a model with one executemany per set of columns.
+
+    As on an ORM flush, a None value leaves a column to its default.
+    """
+    table = model.__table__
+    groups = {}
+    for row in rows:
+        row = dict((key, value) for key, value in row.iteritems()
+                   if key in table.c and
+                   (value is not None or table.c[key].default is None))
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.itervalues():
+        session.execute(table.insert(), group)
+
+
+@require_context
+def instance_create_bulk(context, values_list, block_device_mapping=None):
+    """Create many Instance records in one transaction.
+
+    The rows of each table are inserted with one executemany, whatever the
+    number of instances, and the instances are then read back together.
+
+    context - request context object
+    values_list - list of dicts of column values, as for instance_create
+    block_device_mapping - list of dicts of block device mapping values
+                           created for every instance
+    """
+    rows = dict((model, []) for model in (
+            models.Instance, models.InstanceMetadata,
+            models.InstanceSystemMetadata, models.InstanceInfoCache,
+            models.SecurityGroupInstanceAssociation,
+            models.InstanceIdMapping, models.BlockDeviceMapping))
+    uuids = []
+    session = get_session()
+    with session.begin():
+        # Requests for many instances name the same security groups.
+        group_ids = {}
+        for values in values_list:
+            values = values.copy()
+            metadata = values.pop('metadata', None) or {}
+            system_metadata = values.pop('system_metadata', None) or {}
+            info_cache = values.pop('info_cache', None) or {}
+            security_groups = values.pop('security_groups', [])
+            if not values.get('uuid'):
+                values['uuid'] = str(utils.gen_uuid())
+            uuid = values['uuid']
+            uuids.append(uuid)
+
+            key = tuple(sorted(security_groups))
+            if key not in group_ids:
+                group_ids[key] = [group.id for group in
+                                  _instance_security_group_models(
+                                        context, session, security_groups)]
+
+            rows[models.Instance].append(values)
+            for k, v in metadata.iteritems():
+                rows[models.InstanceMetadata].append(
+                        {'key': k, 'value': v, 'instance_uuid': uuid})
+            for k, v in system_metadata.iteritems():
+                rows[models.InstanceSystemMetadata].append(
+                        {'key': k, 'value': v, 'instance_uuid': uuid})
+            rows[models.InstanceInfoCache].append(
+                    dict(info_cache, instance_uuid=uuid))
+            for group_id in group_ids[key]:
+                rows[models.SecurityGroupInstanceAssociation].append(
+                        {'security_group_id': group_id,
+                         'instance_uuid': uuid})
+            rows[models.InstanceIdMapping].append({'uuid': uuid})
+            for bdm in block_device_mapping or []:
+                rows[models.BlockDeviceMapping].append(
+                        dict(bdm, instance_uuid=uuid))
+
+        # The instances go first, the other rows reference them
+        _insert_many(session, models.Instance, rows.pop(models.Instance))
+        for model, model_rows in rows.iteritems():
+            _insert_many(session, model, model_rows)
+
+        instance_refs = {}
+        # Stay below the number of bind parameters sqlite allows
+        for i in xrange(0, len(uuids), 500):
+            query = _build_instance_get(context, session=session).\
+                    filter(models.Instance.uuid.in_(uuids[i:i + 500]))
+            for instance_ref in query:
+                instance_refs[instance_ref['uuid']] = instance_ref
+
+    return [instance_refs[uuid] for uuid in uuids]
+
+
 @require_admin_context
 def instance_data_get_for_project(context, project_id, session=None):
     result = model_query(context,
@@ -1499,6 +1683,7 @@ def instance_get_all(context, columns_to_join=None):
 
 
 @require_context
+@replica_safe
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
@@ -1601,6 +1786,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
 
 
 @require_context
+@replica_safe
 def instance_get_active_by_window(context, begin, end=None,
                                   project_id=None, host=None):
     """Return instances that were active during window."""
@@ -1620,6 +1806,7 @@ def instance_get_active_by_window(context, begin, end=None,
 
 
 @require_admin_context
+@replica_safe
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Return instances and joins that were active during window."""
@@ -1903,6 +2090,32 @@ def instance_info_cache_update(context, instance_uuid, values,
     return info_cache
 
 
+@require_context
+def instance_info_cache_update_many(context, values_by_uuid):
+    """Update the info cache records of several instances at once.
+
+    :param values_by_uuid: = dict of the column values to update by
+                             instance uuid
+    """
+    if not values_by_uuid:
+        return
+    session = get_session()
+    with session.begin():
+        info_caches = session.query(models.InstanceInfoCache).\
+                              filter(models.InstanceInfoCache.instance_uuid.\
+                                     in_(values_by_uuid.keys())).\
+                              all()
+        missing = set(values_by_uuid)
+        for info_cache in info_caches:
+            info_cache.update(values_by_uuid[info_cache.instance_uuid])
+            missing.discard(info_cache.instance_uuid)
+        for instance_uuid in missing:
+            info_cache = models.InstanceInfoCache()
+            info_cache.update(values_by_uuid[instance_uuid])
+            info_cache.instance_uuid = instance_uuid
+            session.add(info_cache)
+
+
 @require_context
 def instance_info_cache_delete(context, instance_uuid, session=None):
     """Deletes an existing instance_info_cache record
@@ -1962,6 +2175,7 @@ def key_pair_get(context, user_id, name, session=None):
 
 
 @require_context
+@replica_safe
 def key_pair_get_all_by_user(context, user_id):
     authorize_user_context(context, user_id)
     return model_query(context, models.KeyPair, read_deleted="no").\
@@ -2093,6 +2307,15 @@ def network_get(context, network_id, session=None):
     return result
 
 
+@require_context
+def network_get_all_by_ids(context, network_ids):
+    if not network_ids:
+        return []
+    return model_query(context, models.Network, project_only=True).\
+                   filter(models.Network.id.in_(network_ids)).\
+                   all()
+
+
 @require_context
 def network_get_all(context):
     result = model_query(context, models.Network, read_deleted="no").all()
@@ -2487,6 +2710,47 @@ def quota_usage_get_all_by_project(context, project_id):
     return result
 
 
+@require_context
+def quota_usage_data_get_for_project(context, project_id, session=None):
+    """Count everything the reservable quotas cover in one statement.
+
+    Each table is aggregated in a single-row subquery and the subqueries
+    are cross joined, so the usage refresh done under the quota_usages
+    row locks costs one round trip.
+    """
+    authorize_project_context(context, project_id)
+    if not session:
+        session = get_session()
+
+    def _aggregate(*columns, **filters):
+        return model_query(context, *columns, read_deleted="no",
+                           session=session).\
+                       filter_by(project_id=project_id, **filters).\
+                       subquery()
+
+    instances = _aggregate(func.count(models.Instance.id).label('instances'),
+                           func.sum(models.Instance.vcpus).label('cores'),
+                           func.sum(models.Instance.memory_mb).label('ram'))
+    volumes = _aggregate(func.count(models.Volume.id).label('volumes'),
+                         func.sum(models.Volume.size).label('gigabytes'))
+    # TODO(tr3buchet): why leave auto_assigned floating IPs out?
+    floating_ips = _aggregate(
+            func.count(models.FloatingIp.id).label('floating_ips'),
+            auto_assigned=False)
+    security_groups = _aggregate(
+            func.count(models.SecurityGroup.id).label('security_groups'))
+
+    columns = (instances.c.instances, instances.c.cores, instances.c.ram,
+               volumes.c.volumes, volumes.c.gigabytes,
+               floating_ips.c.floating_ips,
+               security_groups.c.security_groups)
+    result = session.query(*columns).first()
+
+    # NOTE(vish): convert None to 0
+    return dict((column.name, value or 0)
+                for column, value in zip(columns, result))
+
+
 @require_admin_context
 def quota_usage_create(context, project_id, resource, in_use, reserved,
                        until_refresh, session=None):
@@ -2989,6 +3253,7 @@ def volume_get_all_by_instance_uuid(context, instance_uuid):
 
 
 @require_context
+@replica_safe
 def volume_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
     return _volume_get_query(context).filter_by(project_id=project_id).all()
@@ -3410,6 +3675,7 @@ def security_group_get_by_name(context, project_id, group_name,
 
 
 @require_context
+@replica_safe
 def security_group_get_by_project(context, project_id):
     return _security_group_get_query(context, read_deleted="no").\
                         filter_by(project_id=project_id).\
@@ -4186,6 +4452,39 @@ def bw_usage_update(context,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_bulk_update(context, usages, start_period, session=None):
+    if not session:
+        session = get_session()
+
+    with session.begin():
+        uuids = set(usage['uuid'] for usage in usages)
+        existing = {}
+        if uuids:
+            rows = model_query(context, models.BandwidthUsage,
+                               session=session, read_deleted="yes").\
+                           filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                           filter_by(start_period=start_period).\
+                           all()
+            existing = dict(((row.uuid, row.mac), row) for row in rows)
+
+        now = timeutils.utcnow()
+        for usage in usages:
+            key = (usage['uuid'], usage['mac_address'])
+            bwusage = existing.get(key)
+            if not bwusage:
+                bwusage = models.BandwidthUsage()
+                bwusage.start_period = start_period
+                bwusage.uuid = usage['uuid']
+                bwusage.mac = usage['mac_address']
+                existing[key] = bwusage
+
+            bwusage.last_refreshed = now
+            bwusage.bw_in = usage['bw_in']
+            bwusage.bw_out = usage['bw_out']
+            session.add(bwusage)
+
+
 ####################
 
 
@@ -5070,3 +5369,172 @@ def task_log_end_task(context, task_name,
         task.errors = errors
         task.save(session=session)
     return task
+
+
+####################
+
+
+# Tables which have shadow tables, in the order they are archived: the rows
+# referencing an instance go before it.
+ARCHIVED_TABLES = ['block_device_mapping',
+                   'fixed_ips',
+                   'instance_faults',
+                   'instance_info_caches',
+                   'instance_metadata',
+                   'instance_system_metadata',
+                   'migrations',
+                   'reservations',
+                   'security_group_instance_association',
+                   'instances']
+
+# Tables whose rows belong to a single instance.  They are archived along
+# with a deleted instance even when they were not soft-deleted themselves,
+# as instance_destroy() leaves most of them as they are.
+_INSTANCE_OWNED_TABLES = ['block_device_mapping',
+                          'instance_faults',
+                          'instance_info_caches',
+                          'instance_metadata',
+                          'instance_system_metadata',
+                          'migrations',
+                          'security_group_instance_association']
+
+# Tables with a foreign key to instances.uuid.  An instance is archived
+# only once none of their rows reference it any more.
+_INSTANCE_CHILD_MODELS = [models.BlockDeviceMapping,
+                          models.Console,
+                          models.FixedIp,
+                          models.InstanceFault,
+                          models.InstanceInfoCache,
+                          models.InstanceMetadata,
+                          models.InstanceSystemMetadata,
+                          models.Migration,
+                          models.SecurityGroupInstanceAssociation]
+
+_shadow_tables = {}
+
+
+def _get_shadow_table(tablename):
+    shadow_table = _shadow_tables.get(tablename)
+    if shadow_table is None:
+        shadow_table = Table('shadow_' + tablename, MetaData(),
+                             autoload=True, autoload_with=get_engine())
+        _shadow_tables[tablename] = shadow_table
+    return shadow_table
+
+
+def _archive_query(tablename, older_than):
+    """Selects the rows of a table which can be archived, by id."""
+    table = models.BASE.metadata.tables[tablename]
+    deleted = table.c.deleted == True
+    if older_than is not None:
+        deleted = and_(deleted, table.c.deleted_at < older_than)
+    if tablename in _INSTANCE_OWNED_TABLES:
+        instances = models.Instance.__table__
+        deleted_instances = select([instances.c.uuid],
+                                   instances.c.deleted == True)
+        if older_than is not None:
+            deleted_instances = deleted_instances.where(
+                    instances.c.deleted_at < older_than)
+        deleted = or_(deleted, table.c.instance_uuid.in_(deleted_instances))
+
+    query = select([table], deleted, for_update=True)
+    if tablename == 'instances':
+        for model in _INSTANCE_CHILD_MODELS:
+            child = model.__table__
+            query = query.where(
+                    ~exists([child.c.id],
+                            child.c.instance_uuid == table.c.uuid))
+    return query.order_by(table.c.id)
+
+
+def _move_rows(connection, table, shadow_table, rows):
+    connection.execute(shadow_table.insert(), [dict(row) for row in rows])
+    connection.execute(table.delete().
+                       where(table.c.id.in_([row['id'] for row in rows])))
+
+
+@require_admin_context
+def archive_deleted_rows_for_table(context, tablename, max_rows=None,
+                                   older_than=None):
+    """Move the soft-deleted rows of a table into its shadow table.
+
+    Rows are copied and deleted in batches of archive_batch_size, each in
+    its own short transaction which only locks the rows of the batch, with
+    archive_batch_delay seconds between the batches.  When a batch fails
+    with an integrity error its rows are archived one at a time, and the
+    rows which still fail are skipped.
+    """
+    if tablename not in ARCHIVED_TABLES:
+        raise exception.InvalidInput(
+                reason=_("Table %s has no shadow table") % tablename)
+    table = models.BASE.metadata.tables[tablename]
+    shadow_table = _get_shadow_table(tablename)
+    query = _archive_query(tablename, older_than)
+
+    connection = get_engine().connect()
+    archived = 0
+    last_id = None
+    try:
+        while max_rows is None or archived < max_rows:
+            batch_size = FLAGS.archive_batch_size
+            if max_rows is not None:
+                batch_size = min(batch_size, max_rows - archived)
+            batch_query = query
+            if last_id is not None:
+                # Skipped rows are not selected again
+                batch_query = query.where(table.c.id > last_id)
+            rows = []
+            try:
+                with connection.begin():
+                    rows = connection.execute(
+                            batch_query.limit(batch_size)).fetchall()
+                    if rows:
+                        _move_rows(connection, table, shadow_table, rows)
+                count = len(rows)
+            except IntegrityError:
+                count = 0
+                for row in rows:
+                    try:
+                        with connection.begin():
+                            row_query = query.where(table.c.id == row['id'])
+                            row_rows = connection.execute(row_query).\
+                                    fetchall()
+                            if row_rows:
+                                _move_rows(connection, table, shadow_table,
+                                           row_rows)
+                        count += len(row_rows)
+                    except IntegrityError:
+                        LOG.warn(_("Could not archive deleted row %(id)s of "
+                                   "%(tablename)s, skipping it"),
+                                 {'id': row['id'], 'tablename': tablename})
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            archived += count
+            LOG.info(_("Archived %(count)d deleted rows of %(tablename)s, "
+                       "%(archived)d so far"),
+                     {'count': count, 'tablename': tablename,
+                      'archived': archived})
+            if len(rows) < batch_size:
+                break
+            time.sleep(FLAGS.archive_batch_delay)
+    finally:
+        connection.close()
+    return archived
+
+
+@require_admin_context
+def archive_deleted_rows(context, max_rows=None, older_than=None):
+    """Move soft-deleted rows of all the ARCHIVED_TABLES into their shadow
+    tables, children before their instances."""
+    result = {}
+    for tablename in ARCHIVED_TABLES:
+        remaining = None
+        if max_rows is not None:
+            remaining = max_rows - sum(result.values())
+            if remaining <= 0:
+                break
+        result[tablename] = archive_deleted_rows_for_table(
+                context, tablename, max_rows=remaining,
+                older_than=older_than)
+    return result
@@ -0,0 +1,71 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, MetaData, Table
+
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# NOTE: keep in sync with ARCHIVED_TABLES in nova/db/sqlalchemy/api.py
+TABLES = ['block_device_mapping',
+          'fixed_ips',
+          'instance_faults',
+          'instance_info_caches',
+          'instance_metadata',
+          'instance_system_metadata',
+          'instances',
+          'migrations',
+          'reservations',
+          'security_group_instance_association']
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # Shadow tables have the columns of their table, without the indexes
+    # and foreign keys, and receive the rows archived from it.
+    shadow_tables = []
+    for table_name in TABLES:
+        table = Table(table_name, meta, autoload=True)
+        columns = [Column(column.name, column.type,
+                          primary_key=column.primary_key,
+                          nullable=column.nullable)
+                   for column in table.columns]
+        shadow_tables.append(Table('shadow_' + table_name, meta, *columns))
+
+    for shadow_table in shadow_tables:
+        try:
+            shadow_table.create()
+        except Exception:
+            LOG.exception(_('Exception while creating table %s.'),
+                          shadow_table.name)
+            meta.drop_all(tables=shadow_tables)
+            raise
+
+        if migrate_engine.name == "mysql":
+            migrate_engine.execute("ALTER TABLE %s Engine=InnoDB" %
+                                   shadow_table.name)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name in TABLES:
+        Table('shadow_' + table_name, meta, autoload=True).drop()
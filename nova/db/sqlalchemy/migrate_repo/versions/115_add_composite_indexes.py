@@ -0,0 +1,66 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+# Index name, table and columns, for the filters of the queries run most:
+# the compute periodic tasks, service lookups, fixed ip allocation, quota
+# reservations and resize confirmation.
+INDEXES = [
+    ('instances_host_deleted_idx', 'instances', ['host', 'deleted']),
+    ('instances_reservation_id_idx', 'instances', ['reservation_id']),
+    ('instances_updated_at_idx', 'instances', ['updated_at']),
+    ('services_host_topic_idx', 'services', ['host', 'topic']),
+    ('services_topic_idx', 'services', ['topic']),
+    ('compute_nodes_service_id_idx', 'compute_nodes', ['service_id']),
+    ('fixed_ips_host_reserved_instance_uuid_idx', 'fixed_ips',
+     ['host', 'reserved', 'instance_uuid']),
+    ('fixed_ips_instance_uuid_idx', 'fixed_ips', ['instance_uuid']),
+    ('reservations_uuid_idx', 'reservations', ['uuid']),
+    ('reservations_expire_idx', 'reservations', ['expire']),
+    ('migrations_status_updated_at_idx', 'migrations',
+     ['status', 'updated_at']),
+    ('migrations_instance_uuid_status_idx', 'migrations',
+     ['instance_uuid', 'status']),
+    ('block_device_mapping_instance_uuid_volume_id_idx',
+     'block_device_mapping', ['instance_uuid', 'volume_id']),
+    ]
+
+
+def _indexes(meta):
+    tables = {}
+    for name, table_name, columns in INDEXES:
+        if table_name not in tables:
+            tables[table_name] = Table(table_name, meta, autoload=True)
+        table = tables[table_name]
+        yield Index(name, *[table.c[column] for column in columns])
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for index in _indexes(meta):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for index in _indexes(meta):
+        index.drop(migrate_engine)
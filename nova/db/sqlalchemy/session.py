@@ -18,6 +18,8 @@
 
 """Session Handling for SQLAlchemy backend."""
 
+import contextlib
+import threading
 import time
 
 from sqlalchemy.exc import DisconnectionError, OperationalError
@@ -35,17 +37,41 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
 
+# Whether the sessions created by the current (green)thread go to the slave
+_routing = threading.local()
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Return a SQLAlchemy session."""
-    global _MAKER
+# Sessions created on the master and on the slave, and slave failures
+_routing_stats = {'master': 0, 'slave': 0, 'slave_errors': 0}
 
-    if _MAKER is None:
-        engine = get_engine()
-        _MAKER = get_maker(engine, autocommit, expire_on_commit)
 
-    session = _MAKER()
+def get_session(autocommit=True, expire_on_commit=False, slave=None):
+    """Return a SQLAlchemy session.
+
+    The session is bound to the slave database when slave is True, or
+    when it is None and the call runs inside use_slave(), provided the
+    slave_connection flag is set.
+    """
+    global _MAKER, _SLAVE_MAKER
+
+    if slave is None:
+        slave = getattr(_routing, 'use_slave', False)
+    if slave and FLAGS.slave_connection:
+        if _SLAVE_MAKER is None:
+            engine = get_engine(slave=True)
+            _SLAVE_MAKER = get_maker(engine, autocommit, expire_on_commit)
+        maker = _SLAVE_MAKER
+        _routing_stats['slave'] += 1
+    else:
+        if _MAKER is None:
+            engine = get_engine()
+            _MAKER = get_maker(engine, autocommit, expire_on_commit)
+        maker = _MAKER
+        _routing_stats['master'] += 1
+
+    session = maker()
     session.query = nova.exception.wrap_db_error(session.query)
     session.flush = nova.exception.wrap_db_error(session.flush)
     return session
@@ -91,68 +117,122 @@ def is_db_connection_error(args):
     return False
 
 
-def get_engine():
-    """Return a SQLAlchemy engine."""
-    global _ENGINE
-    if _ENGINE is None:
-        connection_dict = sqlalchemy.engine.url.make_url(FLAGS.sql_connection)
+@contextlib.contextmanager
+def use_slave():
+    """Bind the sessions created in the block to the slave database."""
+    previous = getattr(_routing, 'use_slave', False)
+    _routing.use_slave = True
+    try:
+        yield
+    finally:
+        _routing.use_slave = previous
 
-        engine_args = {
-            "pool_recycle": FLAGS.sql_idle_timeout,
-            "echo": False,
-            'convert_unicode': True,
-        }
 
-        # Map our SQL debug level to SQLAlchemy's options
-        if FLAGS.sql_connection_debug >= 100:
-            engine_args['echo'] = 'debug'
-        elif FLAGS.sql_connection_debug >= 50:
-            engine_args['echo'] = True
+def record_slave_error():
+    """Count a call that failed on the slave and was sent to the master."""
+    _routing_stats['slave_errors'] += 1
 
-        if "sqlite" in connection_dict.drivername:
-            engine_args["poolclass"] = NullPool
 
-            if FLAGS.sql_connection == "sqlite://":
-                engine_args["poolclass"] = StaticPool
-                engine_args["connect_args"] = {'check_same_thread': False}
+def get_routing_stats():
+    """Returns how many sessions went to the master and to the slave."""
+    stats = dict(_routing_stats)
+    sessions = stats['master'] + stats['slave']
+    stats['slave_ratio'] = (float(stats['slave']) / sessions
+                            if sessions else 0.0)
+    return stats
 
-            if not FLAGS.sqlite_synchronous:
-                engine_args["listeners"] = [SynchronousSwitchListener()]
 
-        if 'mysql' in connection_dict.drivername:
-            engine_args['listeners'] = [MySQLPingListener()]
+def get_engine(slave=False):
+    """Return a SQLAlchemy engine.
 
-        _ENGINE = sqlalchemy.create_engine(FLAGS.sql_connection, **engine_args)
+    The slave engine, used when slave_connection is set, has its own
+    connection pool.
+    """
+    global _ENGINE, _SLAVE_ENGINE
+    if slave and FLAGS.slave_connection:
+        if _SLAVE_ENGINE is None:
+            # Connection errors surface in the queries instead, which then
+            # go to the master
+            _SLAVE_ENGINE = _create_engine(FLAGS.slave_connection,
+                                           connect=False)
+        return _SLAVE_ENGINE
+    if _ENGINE is None:
+        _ENGINE = _create_engine(FLAGS.sql_connection)
+    return _ENGINE
 
-        if (FLAGS.sql_connection_trace and
-                _ENGINE.dialect.dbapi.__name__ == 'MySQLdb'):
-            import MySQLdb.cursors
-            _do_query = debug_mysql_do_query()
-            setattr(MySQLdb.cursors.BaseCursor, '_do_query', _do_query)
 
-        try:
-            _ENGINE.connect()
-        except OperationalError, e:
-            if not is_db_connection_error(e.args[0]):
-                raise
+def _create_engine(sql_connection, connect=True):
+    """Create an engine for sql_connection.
 
-            remaining = FLAGS.sql_max_retries
-            if remaining == -1:
-                remaining = 'infinite'
-            while True:
-                msg = _('SQL connection failed. %s attempts left.')
-                LOG.warn(msg % remaining)
-                if remaining != 'infinite':
-                    remaining -= 1
-                time.sleep(FLAGS.sql_retry_interval)
-                try:
-                    _ENGINE.connect()
-                    break
-                except OperationalError, e:
-                    if (remaining != 'infinite' and remaining == 0) or \
-                       not is_db_connection_error(e.args[0]):
-                        raise
-    return _ENGINE
+    With connect, the first connection is retried sql_max_retries times.
+    """
+    connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
+
+    engine_args = {
+        "pool_recycle": FLAGS.sql_idle_timeout,
+        "echo": False,
+        'convert_unicode': True,
+    }
+
+    # Map our SQL debug level to SQLAlchemy's options
+    if FLAGS.sql_connection_debug >= 100:
+        engine_args['echo'] = 'debug'
+    elif FLAGS.sql_connection_debug >= 50:
+        engine_args['echo'] = True
+
+    if "sqlite" in connection_dict.drivername:
+        engine_args["poolclass"] = NullPool
+
+        if sql_connection == "sqlite://":
+            engine_args["poolclass"] = StaticPool
+            engine_args["connect_args"] = {'check_same_thread': False}
+
+        if not FLAGS.sqlite_synchronous:
+            engine_args["listeners"] = [SynchronousSwitchListener()]
+    else:
+        for arg, value in (('pool_size', FLAGS.sql_max_pool_size),
+                           ('max_overflow', FLAGS.sql_max_overflow),
+                           ('pool_timeout', FLAGS.sql_pool_timeout)):
+            if value is not None:
+                engine_args[arg] = value
+
+    if 'mysql' in connection_dict.drivername:
+        engine_args['listeners'] = [MySQLPingListener()]
+
+    engine = sqlalchemy.create_engine(sql_connection, **engine_args)
+
+    if (FLAGS.sql_connection_trace and
+            engine.dialect.dbapi.__name__ == 'MySQLdb'):
+        import MySQLdb.cursors
+        _do_query = debug_mysql_do_query()
+        setattr(MySQLdb.cursors.BaseCursor, '_do_query', _do_query)
+
+    if not connect:
+        return engine
+
+    try:
+        engine.connect()
+    except OperationalError, e:
+        if not is_db_connection_error(e.args[0]):
+            raise
+
+        remaining = FLAGS.sql_max_retries
+        if remaining == -1:
+            remaining = 'infinite'
+        while True:
+            msg = _('SQL connection failed. %s attempts left.')
+            LOG.warn(msg % remaining)
+            if remaining != 'infinite':
+                remaining -= 1
+            time.sleep(FLAGS.sql_retry_interval)
+            try:
+                engine.connect()
+                break
+            except OperationalError, e:
+                if (remaining != 'infinite' and remaining == 0) or \
+                   not is_db_connection_error(e.args[0]):
+                    raise
+    return engine
 
 
 def get_maker(engine, autocommit=True, expire_on_commit=False):
@@ -82,6 +82,11 @@ core_opts = [
                default='sqlite:///$state_path/$sqlite_db',
                help='The SQLAlchemy connection string used to connect to the '
                     'database'),
+    cfg.StrOpt('slave_connection',
+               default=None,
+               help='The SQLAlchemy connection string of a read-only slave '
+                    'of the database, used by the DB API calls which can '
+                    'read stale data'),
     cfg.StrOpt('api_paste_config',
                default="api-paste.ini",
                help='File name for the paste.deploy config for nova-api'),
@@ -276,6 +281,19 @@ global_opts = [
     cfg.IntOpt('sql_retry_interval',
                default=10,
                help='interval between retries of opening a sql connection'),
+    cfg.IntOpt('sql_max_pool_size',
+               default=None,
+               help='Maximum number of SQL connections kept open in the '
+                    'pool. Not used with sqlite'),
+    cfg.IntOpt('sql_max_overflow',
+               default=None,
+               help='Number of SQL connections opened beyond '
+                    'sql_max_pool_size when all of them are in use. Not '
+                    'used with sqlite'),
+    cfg.IntOpt('sql_pool_timeout',
+               default=None,
+               help='Seconds to wait for a SQL connection from the pool '
+                    'before giving up. Not used with sqlite'),
     cfg.StrOpt('compute_manager',
                default='nova.compute.manager.ComputeManager',
                help='full class name for the Manager for compute'),
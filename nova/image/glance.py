@@ -19,6 +19,7 @@
 
 from __future__ import absolute_import
 
+import collections
 import copy
 import itertools
 import random
@@ -31,13 +32,32 @@ from glance.common import exception as glance_exception
 
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 
 
+glance_opts = [
+    cfg.IntOpt('glance_api_server_dead_time',
+               default=60,
+               help='Number of seconds a glance api server that failed to '
+                    'answer is skipped when picking a server'),
+    cfg.IntOpt('glance_image_meta_cache_ttl',
+               default=30,
+               help='Number of seconds the metadata of active images is '
+                    'cached for. Set to 0 to disable the cache'),
+    cfg.IntOpt('glance_image_meta_cache_size',
+               default=1000,
+               help='Maximum number of images whose metadata is cached'),
+    ]
+
 LOG = logging.getLogger(__name__)
 FLAGS = flags.FLAGS
+FLAGS.register_opts(glance_opts)
+
+# (host, port) -> time the glance api server last failed to answer
+_api_server_failures = {}
 
 
 def _parse_image_ref(image_href):
@@ -82,6 +102,97 @@ def get_api_servers():
     return itertools.cycle(api_servers)
 
 
+def _api_server_is_up(host, port):
+    failed_at = _api_server_failures.get((host, port))
+    if failed_at is None:
+        return True
+    return time.time() - failed_at >= FLAGS.glance_api_server_dead_time
+
+
+def _reset_api_server_failures():
+    """Used by unit tests to forget about failed api servers."""
+    _api_server_failures.clear()
+
+
+class ImageMetaCache(object):
+    """Bounded cache of image metadata with a time to live.
+
+    Entries are keyed by image id and by the identity of the context that
+    fetched them, since what glance returns depends on who asks.  All the
+    entries of an image are dropped together when it is updated or
+    deleted, and the least recently cached images are evicted first.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._images = {}
+        # Ids of the cached images, least recently cached first
+        self._order = collections.deque()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _context_key(context):
+        return (getattr(context, 'auth_token', None),
+                getattr(context, 'user_id', None),
+                getattr(context, 'project_id', None),
+                getattr(context, 'is_admin', False))
+
+    def get(self, context, image_id):
+        """Returns a copy of the cached metadata or None."""
+        if FLAGS.glance_image_meta_cache_ttl <= 0:
+            return None
+        entry = self._images.get(image_id, {}).get(self._context_key(context))
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, context, image_id, image_meta):
+        if FLAGS.glance_image_meta_cache_ttl <= 0:
+            return
+        entries = self._images.pop(image_id, None)
+        if entries is None:
+            entries = {}
+        else:
+            self._order.remove(image_id)
+        expires_at = time.time() + FLAGS.glance_image_meta_cache_ttl
+        entries[self._context_key(context)] = (expires_at,
+                                               copy.deepcopy(image_meta))
+        self._images[image_id] = entries
+        self._order.append(image_id)
+        while len(self._images) > FLAGS.glance_image_meta_cache_size:
+            del self._images[self._order.popleft()]
+            self.evictions += 1
+
+    def invalidate(self, image_id):
+        if self._images.pop(image_id, None) is not None:
+            self._order.remove(image_id)
+            self.invalidations += 1
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'images': len(self._images)}
+
+
+_image_meta_cache = ImageMetaCache()
+
+
+def get_image_meta_cache_stats():
+    """Returns the hit, miss and eviction counters of the metadata cache."""
+    return _image_meta_cache.get_stats()
+
+
 class GlanceClientWrapper(object):
     """Glance client wrapper class that implements retries."""
 
@@ -99,10 +210,17 @@ class GlanceClientWrapper(object):
         self.client = _create_glance_client(context, self.host, self.port)
 
     def _create_onetime_client(self, context):
-        """Create a client that will be used for one call."""
+        """Create a client that will be used for one call.
+
+        Servers that recently failed to answer are skipped, unless all of
+        them did.
+        """
         if self.api_servers is None:
             self.api_servers = get_api_servers()
-        self.host, self.port = self.api_servers.next()
+        for _i in xrange(len(FLAGS.glance_api_servers)):
+            self.host, self.port = self.api_servers.next()
+            if _api_server_is_up(self.host, self.port):
+                break
         return _create_glance_client(context, self.host, self.port)
 
     def call(self, context, method, *args, **kwargs):
@@ -122,10 +240,13 @@ class GlanceClientWrapper(object):
             else:
                 client = self._create_onetime_client(context)
             try:
-                return getattr(client, method)(*args, **kwargs)
+                result = getattr(client, method)(*args, **kwargs)
+                _api_server_failures.pop((self.host, self.port), None)
+                return result
             except retry_excs as e:
                 host = self.host
                 port = self.port
+                _api_server_failures[(host, port)] = time.time()
                 extra = "retrying"
                 error_msg = _("Error contacting glance server "
                         "'%(host)s:%(port)s' for '%(method)s', %(extra)s.")
@@ -212,7 +333,16 @@ class GlanceImageService(object):
             yield image
 
     def show(self, context, image_id):
-        """Returns a dict with image data for the given opaque image id."""
+        """Returns a dict with image data for the given opaque image id.
+
+        The metadata of active images is cached for
+        glance_image_meta_cache_ttl seconds per image and context, since
+        booting an instance looks the image up several times.
+        """
+        base_image_meta = _image_meta_cache.get(context, image_id)
+        if base_image_meta is not None:
+            return base_image_meta
+
         try:
             image_meta = self._client.call(context, 'get_image_meta',
                     image_id)
@@ -223,6 +353,8 @@ class GlanceImageService(object):
             raise exception.ImageNotFound(image_id=image_id)
 
         base_image_meta = self._translate_from_glance(image_meta)
+        if base_image_meta['status'] == 'active':
+            _image_meta_cache.put(context, image_id, base_image_meta)
         return base_image_meta
 
     def download(self, context, image_id, data):
@@ -272,6 +404,8 @@ class GlanceImageService(object):
                     image_id, image_meta, data, features)
         except Exception:
             _reraise_translated_image_exception(image_id)
+        finally:
+            _image_meta_cache.invalidate(image_id)
 
         base_image_meta = self._translate_from_glance(image_meta)
         return base_image_meta
@@ -289,6 +423,8 @@ class GlanceImageService(object):
             result = self._client.call(context, 'delete_image', image_id)
         except glance_exception.NotFound:
             raise exception.ImageNotFound(image_id=image_id)
+        finally:
+            _image_meta_cache.invalidate(image_id)
         return result
 
     def delete_all(self):
@@ -20,12 +20,13 @@
 
 import base64
 import binascii
+import collections
+import itertools
 import os
-import shutil
 import tarfile
-import tempfile
 
 import boto.s3.connection
+import Crypto.Cipher.AES
 import eventlet
 from lxml import etree
 
@@ -42,9 +43,10 @@ from nova import utils
 LOG = logging.getLogger(__name__)
 
 s3_opts = [
-    cfg.StrOpt('image_decryption_dir',
-               default='/tmp',
-               help='parent dir for tempdir used for image decryption'),
+    cfg.IntOpt('s3_download_concurrency',
+               default=4,
+               help='number of image parts downloaded from s3 at the same '
+                    'time when registering a bundle'),
     cfg.StrOpt('s3_access_key',
                default='notchecked',
                help='access key to use for s3 server for images'),
@@ -63,6 +65,36 @@ s3_opts = [
 FLAGS = flags.FLAGS
 FLAGS.register_opts(s3_opts)
 
+# Size of the reads made from the image inside the bundle while uploading
+IMAGE_CHUNK_SIZE = 65536
+
+
+class ChunkReader(object):
+    """Read-only file-like object over an iterator of strings."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = ''
+        self._offset = 0
+
+    def read(self, size=-1):
+        pieces = []
+        while size != 0:
+            if self._offset >= len(self._chunk):
+                try:
+                    self._chunk = self._chunks.next()
+                except StopIteration:
+                    break
+                self._offset = 0
+            if size < 0:
+                piece = self._chunk[self._offset:]
+            else:
+                piece = self._chunk[self._offset:self._offset + size]
+                size -= len(piece)
+            self._offset += len(piece)
+            pieces.append(piece)
+        return ''.join(pieces)
+
 
 class S3ImageService(object):
     """Wraps an existing image service to support s3 based register."""
@@ -165,11 +197,46 @@ class S3ImageService(object):
                                                host=FLAGS.s3_host)
 
     @staticmethod
-    def _download_file(bucket, filename, local_dir):
+    def _download_part(bucket, filename):
         key = bucket.get_key(filename)
-        local_filename = os.path.join(local_dir, os.path.basename(filename))
-        key.get_contents_to_filename(local_filename)
-        return local_filename
+        return key.get_contents_as_string()
+
+    def _fetch_parts(self, bucket, filenames):
+        """Yields the contents of the parts in order.
+
+        Up to s3_download_concurrency parts are downloaded ahead of the
+        one being consumed, so memory use stays bounded by that many parts.
+        """
+        filenames = iter(filenames)
+        downloads = collections.deque()
+        for filename in itertools.islice(filenames,
+                                         FLAGS.s3_download_concurrency):
+            downloads.append(eventlet.spawn(self._download_part, bucket,
+                                            filename))
+        try:
+            while downloads:
+                part = downloads.popleft().wait()
+                for filename in itertools.islice(filenames, 1):
+                    downloads.append(eventlet.spawn(self._download_part,
+                                                    bucket, filename))
+                yield part
+        finally:
+            for download in downloads:
+                download.kill()
+
+    @staticmethod
+    def _record_failure(image_state, iterable, failure):
+        """Passes iterable through, noting image_state if it raises.
+
+        Only the first failing stage of the pipeline is recorded, so an
+        error is reported against the stage that caused it.
+        """
+        try:
+            for item in iterable:
+                yield item
+        except Exception:
+            failure.setdefault('image_state', image_state)
+            raise
 
     def _s3_parse_manifest(self, context, metadata, manifest):
         manifest = etree.fromstring(manifest)
@@ -260,8 +327,6 @@ class S3ImageService(object):
     def _s3_create(self, context, metadata):
         """Gets a manifest from s3 and makes an image."""
 
-        image_path = tempfile.mkdtemp(dir=FLAGS.image_decryption_dir)
-
         image_location = metadata['properties']['image_location']
         bucket_name = image_location.split('/')[0]
         manifest_path = image_location[len(bucket_name) + 1:]
@@ -274,10 +339,12 @@ class S3ImageService(object):
                                                               manifest)
 
         def delayed_create():
-            """This handles the fetching and decrypting of the part files."""
+            """
+            This streams the part files through decryption and untarring
+            into the image service, without writing them to disk.
+            """
             context.update_store()
-            log_vars = {'image_location': image_location,
-                        'image_path': image_path}
+            log_vars = {'image_location': image_location}
 
             def _update_image_state(context, image_uuid, image_state):
                 metadata = {'properties': {'image_state': image_state}}
@@ -293,63 +360,62 @@ class S3ImageService(object):
 
             _update_image_state(context, image_uuid, 'downloading')
 
-            try:
-                parts = []
-                elements = manifest.find('image').getiterator('filename')
-                for fn_element in elements:
-                    part = self._download_file(bucket,
-                                               fn_element.text,
-                                               image_path)
-                    parts.append(part)
-
-                # NOTE(vish): this may be suboptimal, should we use cat?
-                enc_filename = os.path.join(image_path, 'image.encrypted')
-                with open(enc_filename, 'w') as combined:
-                    for filename in parts:
-                        with open(filename) as part:
-                            shutil.copyfileobj(part, combined)
-
-            except Exception:
-                LOG.exception(_("Failed to download %(image_location)s "
-                                "to %(image_path)s"), log_vars)
-                _update_image_state(context, image_uuid, 'failed_download')
-                return
-
-            _update_image_state(context, image_uuid, 'decrypting')
-
             try:
                 hex_key = manifest.find('image/ec2_encrypted_key').text
                 encrypted_key = binascii.a2b_hex(hex_key)
                 hex_iv = manifest.find('image/ec2_encrypted_iv').text
                 encrypted_iv = binascii.a2b_hex(hex_iv)
 
-                dec_filename = os.path.join(image_path, 'image.tar.gz')
-                self._decrypt_image(context, enc_filename, encrypted_key,
-                                    encrypted_iv, dec_filename)
+                key, iv = self._decrypt_image_key(context, encrypted_key,
+                                                  encrypted_iv)
             except Exception:
-                LOG.exception(_("Failed to decrypt %(image_location)s "
-                                "to %(image_path)s"), log_vars)
+                LOG.exception(_("Failed to decrypt the key of "
+                                "%(image_location)s"), log_vars)
                 _update_image_state(context, image_uuid, 'failed_decrypt')
                 return
 
-            _update_image_state(context, image_uuid, 'untarring')
-
-            try:
-                unz_filename = self._untarzip_image(image_path, dec_filename)
-            except Exception:
-                LOG.exception(_("Failed to untar %(image_location)s "
-                                "to %(image_path)s"), log_vars)
-                _update_image_state(context, image_uuid, 'failed_untar')
-                return
-
-            _update_image_state(context, image_uuid, 'uploading')
+            filenames = [fn_element.text for fn_element in
+                         manifest.find('image').getiterator('filename')]
+            failure = {}
+            parts = self._record_failure('failed_download',
+                                         self._fetch_parts(bucket, filenames),
+                                         failure)
+            decrypted = self._record_failure('failed_decrypt',
+                                             self._decrypt_image(parts, key,
+                                                                 iv),
+                                             failure)
+            image_state = 'failed_untar'
             try:
-                with open(unz_filename) as image_file:
-                    _update_image_data(context, image_uuid, image_file)
+                tar_file = tarfile.open(mode='r|gz',
+                                        fileobj=ChunkReader(decrypted))
+                members = self._test_for_malicious_tarball('/image',
+                                                           tar_file)
+                image_member = members.next()
+                if not image_member.isfile():
+                    raise exception.NovaException(_('The bundle does not '
+                                                    'start with the image'))
+                image_file = tar_file.extractfile(image_member)
+
+                image_state = 'failed_upload'
+                _update_image_state(context, image_uuid, 'uploading')
+                image_chunks = iter(lambda: image_file.read(IMAGE_CHUNK_SIZE),
+                                    '')
+                _update_image_data(context, image_uuid,
+                                   ChunkReader(image_chunks))
+
+                # The rest of the bundle is still read, to check that it
+                # decrypts and holds no unsafe filenames.
+                image_state = 'failed_untar'
+                for _member in members:
+                    pass
+                tar_file.close()
             except Exception:
-                LOG.exception(_("Failed to upload %(image_location)s "
-                                "to %(image_path)s"), log_vars)
-                _update_image_state(context, image_uuid, 'failed_upload')
+                log_vars['image_state'] = failure.get('image_state',
+                                                      image_state)
+                LOG.exception(_("Failed to register %(image_location)s: "
+                                "%(image_state)s"), log_vars)
+                _update_image_state(context, image_uuid,
+                                    log_vars['image_state'])
                 return
 
             metadata = {'status': 'active',
@@ -357,14 +423,12 @@ class S3ImageService(object):
             headers = {'x-glance-registry-purge-props': False}
             self.service.update(context, image_uuid, metadata, None, headers)
 
-            shutil.rmtree(image_path)
-
         eventlet.spawn_n(delayed_create)
 
         return image
 
-    def _decrypt_image(self, context, encrypted_filename, encrypted_key,
-                       encrypted_iv, decrypted_filename):
+    def _decrypt_image_key(self, context, encrypted_key, encrypted_iv):
+        """Returns the AES key and initialization vector of a bundle."""
         elevated = context.elevated()
         try:
             key = self.cert_rpcapi.decrypt_text(elevated,
@@ -380,35 +444,42 @@ class S3ImageService(object):
         except Exception, exc:
             raise exception.NovaException(_('Failed to decrypt initialization '
                                     'vector: %s') % exc)
-
-        try:
-            utils.execute('openssl', 'enc',
-                          '-d', '-aes-128-cbc',
-                          '-in', '%s' % (encrypted_filename,),
-                          '-K', '%s' % (key,),
-                          '-iv', '%s' % (iv,),
-                          '-out', '%s' % (decrypted_filename,))
-        except exception.ProcessExecutionError, exc:
-            raise exception.NovaException(_('Failed to decrypt image file '
-                                    '%(image_file)s: %(err)s') %
-                                    {'image_file': encrypted_filename,
-                                     'err': exc.stdout})
+        return binascii.a2b_hex(key.strip()), binascii.a2b_hex(iv.strip())
 
     @staticmethod
-    def _test_for_malicious_tarball(path, filename):
-        """Raises exception if extracting tarball would escape extract path"""
-        tar_file = tarfile.open(filename, 'r|gz')
-        for n in tar_file.getnames():
-            if not os.path.abspath(os.path.join(path, n)).startswith(path):
-                tar_file.close()
-                raise exception.NovaException(_('Unsafe filenames in image'))
-        tar_file.close()
+    def _decrypt_image(chunks, key, iv):
+        """Decrypts an AES-128-CBC encrypted stream of chunks.
+
+        The last block is held back until the end of the stream, where its
+        PKCS#7 padding is checked and stripped.
+        """
+        block_size = Crypto.Cipher.AES.block_size
+        cipher = Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CBC, iv)
+        pending = ''
+        for chunk in chunks:
+            pending += chunk
+            usable = max(len(pending) - 1, 0) // block_size * block_size
+            if usable:
+                yield cipher.decrypt(pending[:usable])
+                pending = pending[usable:]
+
+        if len(pending) != block_size:
+            raise exception.NovaException(_('Failed to decrypt image file: '
+                                            'truncated data'))
+        data = cipher.decrypt(pending)
+        padding = ord(data[-1])
+        if (not 0 < padding <= block_size or
+                data[-padding:] != data[-1] * padding):
+            raise exception.NovaException(_('Failed to decrypt image file: '
+                                            'bad padding'))
+        yield data[:-padding]
 
     @staticmethod
-    def _untarzip_image(path, filename):
-        S3ImageService._test_for_malicious_tarball(path, filename)
-        tar_file = tarfile.open(filename, 'r|gz')
-        tar_file.extractall(path)
-        image_file = tar_file.getnames()[0]
-        tar_file.close()
-        return os.path.join(path, image_file)
+    def _test_for_malicious_tarball(path, members):
+        """Yields the members of a tarball, raising an exception as soon
+        as extracting one would escape the extract path."""
+        for member in members:
+            member_path = os.path.abspath(os.path.join(path, member.name))
+            if not member_path.startswith(path + os.sep):
+                raise exception.NovaException(_('Unsafe filenames in image'))
+            yield member
@@ -53,8 +53,14 @@ This module provides Manager, a base class for managers.
 
 """
 
+import random
+import time
+
+import eventlet
+
 from nova.db import base
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common.plugin import pluginmanager
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
@@ -62,7 +68,22 @@ from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import version
 
 
+periodic_opts = [
+    cfg.IntOpt('periodic_task_concurrency',
+               default=1,
+               help='Number of periodic tasks of a service run at the same '
+                    'time.  With 1, the tasks run one after the other on '
+                    'each tick; with more, each task runs in its own green '
+                    'thread and is skipped while its last run goes on'),
+    cfg.IntOpt('periodic_task_timeout',
+               default=0,
+               help='Seconds after which a periodic task is interrupted, '
+                    'the next time it yields, unless the task sets its own '
+                    'timeout.  0 disables it'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(periodic_opts)
 
 
 LOG = logging.getLogger(__name__)
@@ -78,10 +99,23 @@ def periodic_task(*args, **kwargs):
 
         2. With arguments, @periodic_task(ticks_between_runs=N), this will be
            run on every N ticks of the periodic scheduler.
+
+    These arguments are also accepted:
+
+        spacing: seconds between the starts of two runs, checked on each
+            tick.  Either a number or the name of a flag read on each tick.
+            The first run happens on a random tick within the first spacing,
+            unless run_immediately is True.
+
+        timeout: seconds after which the task is interrupted, instead of
+            FLAGS.periodic_task_timeout.  0 disables it.
     """
     def decorator(f):
         f._periodic_task = True
         f._ticks_between_runs = kwargs.pop('ticks_between_runs', 0)
+        f._periodic_spacing = kwargs.pop('spacing', 0)
+        f._periodic_run_immediately = kwargs.pop('run_immediately', False)
+        f._periodic_timeout = kwargs.pop('timeout', None)
         return f
 
     # NOTE(sirp): The `if` is necessary to allow the decorator to be used with
@@ -139,6 +173,11 @@ class Manager(base.Base):
         if not host:
             host = FLAGS.host
         self.host = host
+        self._ticks_to_skip = self._ticks_to_skip.copy()
+        self._periodic_next_run = {}
+        self._periodic_running = {}
+        self._periodic_stats = {}
+        self._periodic_pool = None
         self.load_plugins()
         super(Manager, self).__init__(db_driver)
 
@@ -156,6 +195,11 @@ class Manager(base.Base):
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
+        concurrent = FLAGS.periodic_task_concurrency > 1
+        if concurrent and self._periodic_pool is None:
+            self._periodic_pool = eventlet.GreenPool(
+                    FLAGS.periodic_task_concurrency)
+
         for task_name, task in self._periodic_tasks:
             full_task_name = '.'.join([self.__class__.__name__, task_name])
 
@@ -166,16 +210,94 @@ class Manager(base.Base):
                 self._ticks_to_skip[task_name] -= 1
                 continue
 
+            now = time.time()
+            spacing = task._periodic_spacing
+            if isinstance(spacing, basestring):
+                spacing = FLAGS[spacing]
+            if spacing > 0:
+                next_run = self._periodic_next_run.get(task_name)
+                if next_run is None and not task._periodic_run_immediately:
+                    # Spread the first runs of the tasks and of the hosts
+                    next_run = now + random.uniform(0, spacing)
+                    self._periodic_next_run[task_name] = next_run
+                if next_run is not None and now < next_run:
+                    seconds_left = next_run - now
+                    LOG.debug(_("Skipping %(full_task_name)s, "
+                                "%(seconds_left).0f seconds left until next "
+                                "run"), locals())
+                    continue
+
+            if task_name in self._periodic_running:
+                LOG.warn(_("Skipping %(full_task_name)s, its last run is "
+                           "still going on"), locals())
+                self._get_periodic_stats(task_name)['skipped'] += 1
+                continue
+
             self._ticks_to_skip[task_name] = task._ticks_between_runs
+            if spacing > 0:
+                self._periodic_next_run[task_name] = now + spacing
             LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
 
-            try:
-                task(self, context)
-            except Exception as e:
-                if raise_on_error:
-                    raise
-                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
-                              locals())
+            if concurrent:
+                self._periodic_running[task_name] = self._periodic_pool.spawn(
+                        self._run_periodic_task, context, task_name, task,
+                        False)
+            else:
+                self._run_periodic_task(context, task_name, task,
+                                        raise_on_error)
+
+    def _get_periodic_stats(self, task_name):
+        stats = self._periodic_stats.get(task_name)
+        if stats is None:
+            stats = {'runs': 0, 'errors': 0, 'timeouts': 0, 'skipped': 0,
+                     'total_time': 0.0, 'max_time': 0.0, 'last_time': None,
+                     'last_run': None}
+            self._periodic_stats[task_name] = stats
+        return stats
+
+    def _run_periodic_task(self, context, task_name, task, raise_on_error):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        stats = self._get_periodic_stats(task_name)
+        timeout = task._periodic_timeout
+        if timeout is None:
+            timeout = FLAGS.periodic_task_timeout
+        timer = eventlet.Timeout(timeout) if timeout > 0 else None
+
+        start = time.time()
+        try:
+            task(self, context)
+        except eventlet.Timeout as e:
+            if e is not timer:
+                raise
+            stats['timeouts'] += 1
+            if raise_on_error:
+                raise
+            LOG.error(_("%(full_task_name)s interrupted after %(timeout)s "
+                        "seconds"), locals())
+        except Exception as e:
+            stats['errors'] += 1
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          locals())
+        finally:
+            if timer is not None:
+                timer.cancel()
+            elapsed = time.time() - start
+            stats['runs'] += 1
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+            stats['last_time'] = elapsed
+            stats['last_run'] = start
+            self._periodic_running.pop(task_name, None)
+            LOG.debug(_("Ran periodic task %(full_task_name)s in "
+                        "%(elapsed).3f seconds"), locals())
+
+    def get_periodic_task_stats(self, context):
+        """Returns the runs, errors, timeouts, skipped runs and run times
+        of each periodic task, by task name."""
+        return dict((task_name, stats.copy())
+                    for task_name, stats in self._periodic_stats.iteritems())
 
     def init_host(self):
         """Handle initialization if this is a standalone service.
@@ -266,17 +266,45 @@ class API(base.Base):
 
     def _get_instance_nw_info(self, context, instance):
         """Returns all network info related to an instance."""
-        args = {'instance_id': instance['id'],
-                'instance_uuid': instance['uuid'],
-                'rxtx_factor': instance['instance_type']['rxtx_factor'],
-                'host': instance['host'],
-                'project_id': instance['project_id']}
+        args = self._get_nw_info_args(instance)
         nw_info = rpc.call(context, FLAGS.network_topic,
                            {'method': 'get_instance_nw_info',
                             'args': args})
 
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def _get_nw_info_args(self, instance):
+        return {'instance_id': instance['id'],
+                'instance_uuid': instance['uuid'],
+                'rxtx_factor': instance['instance_type']['rxtx_factor'],
+                'host': instance['host'],
+                'project_id': instance['project_id']}
+
+    def get_instances_nw_info(self, context, instances):
+        """Returns the network info of several instances by uuid.
+
+        This takes a single call to the network manager, and the info
+        caches of the instances are updated together.
+        """
+        if not instances:
+            return {}
+        args = {'instances': [self._get_nw_info_args(instance)
+                              for instance in instances]}
+        nw_infos = rpc.call(context, FLAGS.network_topic,
+                            {'method': 'get_instances_nw_info',
+                             'args': args})
+        nw_infos = dict((instance_uuid,
+                         network_model.NetworkInfo.hydrate(nw_info))
+                        for instance_uuid, nw_info in nw_infos.iteritems())
+
+        try:
+            caches = dict((instance_uuid, {'network_info': nw_info.json()})
+                          for instance_uuid, nw_info in nw_infos.iteritems())
+            self.db.instance_info_cache_update_many(context, caches)
+        except Exception:
+            LOG.exception(_('Failed storing info caches'))
+        return nw_infos
+
     def validate_networks(self, context, requested_networks):
         """validate the networks passed at the time of creating
         the server
@@ -1028,10 +1028,61 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                          rxtx_factor, host)
         return nw_info
 
+    @wrap_check_policy
+    def get_instances_nw_info(self, context, instances, **kwargs):
+        """Creates the network info lists of several instances.
+
+        The virtual interfaces, networks, fixed ips and floating ips of all
+        the instances are loaded with one query each, where
+        get_instance_nw_info runs several queries per interface.
+
+        :param instances: list of dicts with the instance_id, instance_uuid,
+                          rxtx_factor and host arguments of
+                          get_instance_nw_info
+        :returns: dict of the network info lists by instance uuid
+        """
+        instance_ids = [instance['instance_id'] for instance in instances]
+        vifs = self.db.virtual_interface_get_by_instances(context,
+                                                          instance_ids)
+        network_ids = set(vif['network_id'] for vif in vifs
+                          if vif['network_id'] is not None)
+        networks = self._get_networks_by_ids(context, list(network_ids))
+        networks_by_id = dict((network['id'], network)
+                              for network in networks)
+        for network_id in network_ids:
+            if network_id not in networks_by_id:
+                raise exception.NetworkNotFound(network_id=network_id)
+        fixed_ips = self.db.fixed_ips_by_virtual_interfaces(context,
+                [vif['id'] for vif in vifs])
+        floating_ips = self.db.floating_ip_get_by_fixed_ip_ids(context,
+                [fixed_ip['id'] for fixed_ip in fixed_ips])
+        ipam = self.ipam.prefetched(networks, vifs, fixed_ips, floating_ips)
+
+        vifs_by_instance = dict((instance_id, [])
+                                for instance_id in instance_ids)
+        for vif in vifs:
+            vifs_by_instance[vif['instance_id']].append(vif)
+
+        nw_infos = {}
+        for instance in instances:
+            instance_vifs = vifs_by_instance[instance['instance_id']]
+            vif_networks = dict((vif['uuid'],
+                                 networks_by_id[vif['network_id']])
+                                for vif in instance_vifs
+                                if vif['network_id'] is not None)
+            nw_infos[instance['instance_uuid']] = \
+                    self.build_network_info_model(context, instance_vifs,
+                                                  vif_networks,
+                                                  instance['rxtx_factor'],
+                                                  instance['host'],
+                                                  ipam=ipam)
+        return nw_infos
+
     def build_network_info_model(self, context, vifs, networks,
-                                 rxtx_factor, instance_host):
+                                 rxtx_factor, instance_host, ipam=None):
         """Builds a NetworkInfo object containing all network information
         for an instance"""
+        ipam = ipam or self.ipam
         nw_info = network_model.NetworkInfo()
         for vif in vifs:
             vif_dict = {'id': vif['uuid'],
@@ -1046,7 +1097,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             # get network dict for vif from args and build the subnets
             network = networks[vif['uuid']]
             subnets = self._get_subnets_from_network(context, network, vif,
-                                                     instance_host)
+                                                     instance_host, ipam)
 
             # if rxtx_cap data are not set everywhere, set to none
             try:
@@ -1055,14 +1106,14 @@ class NetworkManager(manager.SchedulerDependentManager):
                 rxtx_cap = None
 
             # get fixed_ips
-            v4_IPs = self.ipam.get_v4_ips_by_interface(context,
-                                                       network['uuid'],
-                                                       vif['uuid'],
-                                                       network['project_id'])
-            v6_IPs = self.ipam.get_v6_ips_by_interface(context,
-                                                       network['uuid'],
-                                                       vif['uuid'],
-                                                       network['project_id'])
+            v4_IPs = ipam.get_v4_ips_by_interface(context,
+                                                  network['uuid'],
+                                                  vif['uuid'],
+                                                  network['project_id'])
+            v6_IPs = ipam.get_v6_ips_by_interface(context,
+                                                  network['uuid'],
+                                                  vif['uuid'],
+                                                  network['project_id'])
 
             # create model FixedIPs from these fixed_ips
             network_IPs = [network_model.FixedIP(address=ip_address)
@@ -1073,7 +1124,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             for fixed_ip in network_IPs:
                 if fixed_ip['version'] == 6:
                     continue
-                gfipbfa = self.ipam.get_floating_ips_by_fixed_address
+                gfipbfa = ipam.get_floating_ips_by_fixed_address
                 floating_ips = gfipbfa(context, fixed_ip['address'])
                 floating_ips = [network_model.IP(address=ip['address'],
                                                  type='floating')
@@ -1118,10 +1169,11 @@ class NetworkManager(manager.SchedulerDependentManager):
         return network_dict
 
     def _get_subnets_from_network(self, context, network,
-                                  vif, instance_host=None):
+                                  vif, instance_host=None, ipam=None):
         """Returns the 1 or 2 possible subnets for a nova network"""
+        ipam = ipam or self.ipam
         # get subnets
-        ipam_subnets = self.ipam.get_subnets_by_net_id(context,
+        ipam_subnets = ipam.get_subnets_by_net_id(context,
                            network['project_id'], network['uuid'], vif['uuid'])
 
         subnets = []
@@ -1150,7 +1202,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             # get the routes for this subnet
             # NOTE(tr3buchet): default route comes from subnet gateway
             if subnet.get('id'):
-                routes = self.ipam.get_routes_by_ip_block(context,
+                routes = ipam.get_routes_by_ip_block(context,
                                          subnet['id'], network['project_id'])
                 for route in routes:
                     cidr = netaddr.IPNetwork('%s/%s' % (route['destination'],
@@ -1622,6 +1674,9 @@ class NetworkManager(manager.SchedulerDependentManager):
     def _get_network_by_id(self, context, network_id):
         return self.db.network_get(context, network_id)
 
+    def _get_networks_by_ids(self, context, network_ids):
+        return self.db.network_get_all_by_ids(context, network_ids)
+
     def _get_networks_by_uuids(self, context, network_uuids):
         return self.db.network_get_all_by_uuids(context, network_uuids)
 
@@ -1822,6 +1877,10 @@ class FlatDHCPManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         return NetworkManager._get_network_by_id(self, context.elevated(),
                                                  network_id)
 
+    def _get_networks_by_ids(self, context, network_ids):
+        return NetworkManager._get_networks_by_ids(self, context.elevated(),
+                                                   network_ids)
+
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields"""
 
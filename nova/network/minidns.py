@@ -12,12 +12,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import itertools
 import os
-import shutil
 import tempfile
 
 from nova import exception
 from nova import flags
+from nova import utils
+
+
+# Length of the end of the file compared to tell appends from rewrites
+TAIL_SIZE = 256
 
 
 class MiniDNS(object):
@@ -26,9 +31,11 @@ class MiniDNS(object):
         strictly for testing purposes, and should keep you out of dependency
         hell.
 
-        Note that there is almost certainly a race condition here that
-        will manifest anytime instances are rapidly created and deleted.
-        A proper implementation will need some manner of locking."""
+        The file is parsed once into an index of the entries by name,
+        address and domain.  Afterwards only the lines other processes
+        appended are read, and the whole file again only when it was
+        replaced.  Changes are made under an external lock: new entries
+        are appended, other changes replace the file atomically."""
 
     def __init__(self):
         if flags.FLAGS.logdir:
@@ -41,15 +48,100 @@ class MiniDNS(object):
             f.write("#  minidns\n\n\n")
             f.close()
 
+        self._clear_index()
+
+    def _clear_index(self):
+        self._keys = itertools.count()
+        # The lines of the file with their parsed entry, and their keys in
+        # the order of the file
+        self._lines = {}
+        self._line_keys = []
+        # Lowercased name, lowercased address and domain to line keys
+        self._by_name = {}
+        self._by_address = {}
+        self._by_domain = {}
+        self._stat = None
+        self._offset = 0
+        self._tail = ''
+
+    def _index_line(self, key, line):
+        entry = self.parse_line(line)
+        if key not in self._lines:
+            self._line_keys.append(key)
+        self._lines[key] = (line, entry)
+        if entry:
+            self._by_name.setdefault(entry['name'].lower(), []).append(key)
+            self._by_address.setdefault(entry['address'].lower(),
+                                        []).append(key)
+            self._by_domain.setdefault(entry['domain'], []).append(key)
+
+    def _unindex_line(self, key):
+        line, entry = self._lines.pop(key)
+        self._line_keys.remove(key)
+        self._unindex_entry(key, entry)
+
+    def _unindex_entry(self, key, entry):
+        if entry:
+            for index, value in ((self._by_name, entry['name'].lower()),
+                                 (self._by_address, entry['address'].lower()),
+                                 (self._by_domain, entry['domain'])):
+                keys = index[value]
+                keys.remove(key)
+                if not keys:
+                    del index[value]
+
+    def _entries(self, index, value):
+        return [self._lines[key][1] for key in index.get(value, [])]
+
+    def _refresh(self):
+        """Brings the index up to date with the file."""
+        stat = os.stat(self.filename)
+        old = self._stat
+        if (old and stat.st_ino == old.st_ino and
+            stat.st_size == self._offset and stat.st_mtime == old.st_mtime):
+            return
+        appended = (old and stat.st_ino == old.st_ino and
+                    0 < self._offset < stat.st_size)
+        with open(self.filename, 'r') as infile:
+            if appended:
+                # Reload the whole file unless it was only appended to
+                infile.seek(self._offset - len(self._tail))
+                appended = infile.read(len(self._tail)) == self._tail
+            if not appended:
+                self._clear_index()
+                infile.seek(0)
+            data = infile.read()
+        # A line being appended is indexed once it is complete
+        end = data.rfind('\n') + 1
+        for line in data[:end].splitlines(True):
+            self._index_line(next(self._keys), line)
+        self._offset += end
+        self._tail = (self._tail + data[:end])[-TAIL_SIZE:]
+        self._stat = stat
+
+    def _append(self, line):
+        with open(self.filename, 'a') as outfile:
+            outfile.write(line)
+        self._index_line(next(self._keys), line)
+        self._offset += len(line)
+        self._tail = (self._tail + line)[-TAIL_SIZE:]
+        self._stat = os.stat(self.filename)
+
+    def _rewrite(self):
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        data = ''.join(self._lines[key][0] for key in self._line_keys)
+        outfile = tempfile.NamedTemporaryFile('w', dir=dirname, delete=False)
+        outfile.write(data)
+        outfile.close()
+        os.rename(outfile.name, self.filename)
+        self._offset = len(data)
+        self._tail = data[-TAIL_SIZE:]
+        self._stat = os.stat(self.filename)
+
     def get_domains(self):
-        entries = []
-        infile = open(self.filename, 'r')
-        for line in infile:
-            entry = self.parse_line(line)
-            if entry and entry['address'].lower() == 'domain'.lower():
-                entries.append(entry['name'])
-        infile.close()
-        return entries
+        self._refresh()
+        return [entry['name'] for entry in
+                self._entries(self._by_address, 'domain')]
 
     def qualify(self, name, domain):
         if domain:
@@ -59,6 +151,7 @@ class MiniDNS(object):
 
         return qualified
 
+    @utils.synchronized('minidns', external=True)
     def create_entry(self, name, address, type, domain):
 
         if type.lower() != 'a':
@@ -68,10 +161,8 @@ class MiniDNS(object):
         if self.get_entries_by_name(name, domain):
             raise exception.FloatingIpDNSExists(name=name, domain=domain)
 
-        outfile = open(self.filename, 'a+')
-        outfile.write("%s   %s   %s\n" %
+        self._append("%s   %s   %s\n" %
             (address, self.qualify(name, domain), type))
-        outfile.close()
 
     def parse_line(self, line):
         vals = line.split()
@@ -88,91 +179,65 @@ class MiniDNS(object):
                 entry['domain'] = entry['name'].partition('.')[2]
             return entry
 
+    @utils.synchronized('minidns', external=True)
     def delete_entry(self, name, domain):
-        deleted = False
-        infile = open(self.filename, 'r')
-        outfile = tempfile.NamedTemporaryFile('w', delete=False)
-        for line in infile:
-            entry = self.parse_line(line)
-            if ((not entry) or
-                entry['name'] != self.qualify(name, domain).lower()):
-                outfile.write(line)
-            else:
-                deleted = True
-        infile.close()
-        outfile.close()
-        shutil.move(outfile.name, self.filename)
-        if not deleted:
+        self._refresh()
+        keys = self._by_name.get(self.qualify(name, domain).lower())
+        if not keys:
             raise exception.NotFound
+        for key in list(keys):
+            self._unindex_line(key)
+        self._rewrite()
 
+    @utils.synchronized('minidns', external=True)
     def modify_address(self, name, address, domain):
-
-        if not self.get_entries_by_name(name, domain):
+        self._refresh()
+        qualified = self.qualify(name, domain)
+        keys = self._by_name.get(qualified.lower())
+        if not keys:
             raise exception.NotFound
 
-        infile = open(self.filename, 'r')
-        outfile = tempfile.NamedTemporaryFile('w', delete=False)
-        for line in infile:
-            entry = self.parse_line(line)
-            if (entry and
-                entry['name'].lower() == self.qualify(name, domain).lower()):
-                outfile.write("%s   %s   %s\n" %
-                    (address, self.qualify(name, domain), entry['type']))
-            else:
-                outfile.write(line)
-        infile.close()
-        outfile.close()
-        shutil.move(outfile.name, self.filename)
+        for key in list(keys):
+            line, entry = self._lines[key]
+            self._unindex_entry(key, entry)
+            # Replacing the line keeps its place in the file
+            self._index_line(key, "%s   %s   %s\n" %
+                             (address, qualified, entry['type']))
+        self._rewrite()
 
     def get_entries_by_address(self, address, domain):
+        self._refresh()
         entries = []
-        infile = open(self.filename, 'r')
-        for line in infile:
-            entry = self.parse_line(line)
-            if entry and entry['address'].lower() == address.lower():
-                if entry['name'].lower().endswith(domain.lower()):
-                    domain_index = entry['name'].lower().find(domain.lower())
-                    entries.append(entry['name'][0:domain_index - 1])
-        infile.close()
+        for entry in self._entries(self._by_address, address.lower()):
+            if entry['name'].lower().endswith(domain.lower()):
+                domain_index = entry['name'].lower().find(domain.lower())
+                entries.append(entry['name'][0:domain_index - 1])
         return entries
 
     def get_entries_by_name(self, name, domain):
-        entries = []
-        infile = open(self.filename, 'r')
-        for line in infile:
-            entry = self.parse_line(line)
-            if (entry and
-                entry['name'].lower() == self.qualify(name, domain).lower()):
-                entries.append(entry['address'])
-        infile.close()
-        return entries
+        self._refresh()
+        return [entry['address'] for entry in
+                self._entries(self._by_name,
+                              self.qualify(name, domain).lower())]
 
     def delete_dns_file(self):
         os.remove(self.filename)
+        self._clear_index()
 
+    @utils.synchronized('minidns', external=True)
     def create_domain(self, fqdomain):
         if self.get_entries_by_name(fqdomain, ''):
             raise exception.FloatingIpDNSExists(name=fqdomain, domain='')
 
-        outfile = open(self.filename, 'a+')
-        outfile.write("%s   %s   %s\n" %
+        self._append("%s   %s   %s\n" %
             ('domain', fqdomain, 'domain'))
-        outfile.close()
 
+    @utils.synchronized('minidns', external=True)
     def delete_domain(self, fqdomain):
-        deleted = False
-        infile = open(self.filename, 'r')
-        outfile = tempfile.NamedTemporaryFile('w', delete=False)
-        for line in infile:
-            entry = self.parse_line(line)
-            if ((not entry) or
-                entry['domain'] != fqdomain):
-                outfile.write(line)
-            else:
-                print "deleted %s" % entry
-                deleted = True
-        infile.close()
-        outfile.close()
-        shutil.move(outfile.name, self.filename)
-        if not deleted:
+        self._refresh()
+        keys = self._by_domain.get(fqdomain)
+        if not keys:
             raise exception.NotFound
+        for key in list(keys):
+            self._unindex_line(key)
+        self._rewrite()
@@ -582,6 +582,16 @@ class QuantumManager(manager.FloatingIP, manager.FlatManager):
 
         return nw_info
 
+    def get_instances_nw_info(self, context, instances, **kwargs):
+        """Network info of several instances, by instance uuid.
+
+           The IPAM lib may be Melange, so this calls get_instance_nw_info
+           for each instance.
+        """
+        return dict((instance['instance_uuid'],
+                     self.get_instance_nw_info(context, **instance))
+                    for instance in instances)
+
     def deallocate_for_instance(self, context, **kwargs):
         """Called when a VM is terminated.  Loop through each virtual
            interface in the Nova DB and remove the Quantum port and
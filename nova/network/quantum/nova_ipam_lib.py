@@ -34,6 +34,32 @@ def get_ipam_lib(net_man):
     return QuantumNovaIPAMLib(net_man)
 
 
+def _subnets_of_network(n):
+    """Returns the IPv4 and IPv6 subnet dicts of a network row."""
+    subnet_v4 = {
+        'network_id': n['uuid'],
+        'cidr': n['cidr'],
+        'gateway': n['gateway'],
+        'broadcast': n['broadcast'],
+        'netmask': n['netmask'],
+        'version': 4,
+        'dns1': n['dns1'],
+        'dns2': n['dns2']}
+    #TODO(tr3buchet): I'm noticing we've assumed here that all dns is v4.
+    #                 this is probably bad as there is no way to add v6
+    #                 dns to nova
+    subnet_v6 = {
+        'network_id': n['uuid'],
+        'cidr': n['cidr_v6'],
+        'gateway': n['gateway_v6'],
+        'broadcast': None,
+        'netmask': n['netmask_v6'],
+        'version': 6,
+        'dns1': None,
+        'dns2': None}
+    return [subnet_v4, subnet_v6]
+
+
 class QuantumNovaIPAMLib(object):
     """Implements Quantum IP Address Management (IPAM) interface
        using the local Nova database.  This implementation is inline
@@ -147,28 +173,7 @@ class QuantumNovaIPAMLib(object):
            associated with a Quantum Network UUID.
         """
         n = db.network_get_by_uuid(context.elevated(), net_id)
-        subnet_v4 = {
-            'network_id': n['uuid'],
-            'cidr': n['cidr'],
-            'gateway': n['gateway'],
-            'broadcast': n['broadcast'],
-            'netmask': n['netmask'],
-            'version': 4,
-            'dns1': n['dns1'],
-            'dns2': n['dns2']}
-        #TODO(tr3buchet): I'm noticing we've assumed here that all dns is v4.
-        #                 this is probably bad as there is no way to add v6
-        #                 dns to nova
-        subnet_v6 = {
-            'network_id': n['uuid'],
-            'cidr': n['cidr_v6'],
-            'gateway': n['gateway_v6'],
-            'broadcast': None,
-            'netmask': n['netmask_v6'],
-            'version': 6,
-            'dns1': None,
-            'dns2': None}
-        return [subnet_v4, subnet_v6]
+        return _subnets_of_network(n)
 
     def get_routes_by_ip_block(self, context, block_id, project_id):
         """Returns the list of routes for the IP block"""
@@ -274,3 +279,55 @@ class QuantumNovaIPAMLib(object):
 
     def get_floating_ips_by_fixed_address(self, context, fixed_address):
         return db.floating_ip_get_by_fixed_address(context, fixed_address)
+
+    def prefetched(self, networks, vifs, fixed_ips, floating_ips):
+        """Returns an IPAM lib answering the lookups of
+           build_network_info_model from the given rows, loaded
+           beforehand for several instances.
+        """
+        return PrefetchedNovaIPAMLib(self.net_manager, networks, vifs,
+                                     fixed_ips, floating_ips)
+
+
+class PrefetchedNovaIPAMLib(QuantumNovaIPAMLib):
+    """Nova IPAM lookups served from rows loaded in bulk, so that building
+       the network info of many instances takes no query per interface.
+    """
+
+    def __init__(self, net_manager, networks, vifs, fixed_ips,
+                 floating_ips):
+        super(PrefetchedNovaIPAMLib, self).__init__(net_manager)
+        self.networks = dict((network['uuid'], network)
+                             for network in networks)
+        self.vifs = dict((vif['uuid'], vif) for vif in vifs)
+        self.fixed_ips = dict((vif['id'], []) for vif in vifs)
+        fixed_addresses = {}
+        for fixed_ip in fixed_ips:
+            self.fixed_ips[fixed_ip['virtual_interface_id']].append(fixed_ip)
+            fixed_addresses[fixed_ip['id']] = fixed_ip['address']
+        self.floating_ips = dict((address, [])
+                                 for address in fixed_addresses.values())
+        for floating_ip in floating_ips:
+            address = fixed_addresses[floating_ip['fixed_ip_id']]
+            self.floating_ips[address].append(floating_ip)
+
+    def get_subnets_by_net_id(self, context, tenant_id, net_id, _vif_id=None):
+        return _subnets_of_network(self.networks[net_id])
+
+    def get_v4_ips_by_interface(self, context, net_id, vif_id, project_id):
+        vif_rec = self.vifs[vif_id]
+        return [fixed_ip['address']
+                for fixed_ip in self.fixed_ips[vif_rec['id']]]
+
+    def get_v6_ips_by_interface(self, context, net_id, vif_id, project_id):
+        network = self.networks[net_id]
+        vif_rec = self.vifs[vif_id]
+        if network['cidr_v6']:
+            ip = ipv6.to_global(network['cidr_v6'],
+                                vif_rec['address'],
+                                project_id)
+            return [ip]
+        return []
+
+    def get_floating_ips_by_fixed_address(self, context, fixed_address):
+        return self.floating_ips.get(fixed_address, [])
@@ -129,6 +129,12 @@ class API(base.Base):
         nw_info = self._build_network_info_model(context, instance, networks)
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def get_instances_nw_info(self, context, instances):
+        """Return the network info of several instances by uuid."""
+        return dict((instance['uuid'],
+                     self.get_instance_nw_info(context, instance))
+                    for instance in instances)
+
     def add_fixed_ip_to_instance(self, context, instance, network_id):
         """Add a fixed ip to the instance from specified network."""
         raise NotImplementedError()
@@ -65,6 +65,10 @@ s3_opts = [
 FLAGS = flags.FLAGS
 FLAGS.register_opts(s3_opts)
 
+# Objects are read and written in chunks of this size, so large images
+# are never held in memory as a whole.
+CHUNK_SIZE = 64 * 1024
+
 
 def get_wsgi_server():
     return wsgi.Server("S3 Objectstore",
@@ -96,9 +100,90 @@ class S3Application(wsgi.Router):
         if not os.path.exists(self.directory):
             os.makedirs(self.directory)
         self.bucket_depth = bucket_depth
+        self.bucket_index = BucketIndex(self.directory, bucket_depth)
         super(S3Application, self).__init__(mapper)
 
 
+class BucketIndex(object):
+    """Sorted object names of each bucket.
+
+    The names of a bucket are collected with a single walk the first time
+    it is listed and are then kept up to date as objects are written and
+    deleted through the server, so a listing only bisects to its marker
+    or prefix and reads one page of names.  Changes made to the bucket
+    directories behind the server's back are not seen until restart.
+
+    """
+
+    def __init__(self, directory, bucket_depth):
+        self.directory = directory
+        self.bucket_depth = bucket_depth
+        self._buckets = {}
+
+    def _bucket_path(self, bucket_name):
+        return os.path.abspath(os.path.join(self.directory, bucket_name))
+
+    def _name_offset(self, bucket_path):
+        offset = len(bucket_path) + 1
+        for i in range(self.bucket_depth):
+            offset += 2 * (i + 1) + 1
+        return offset
+
+    def get_names(self, bucket_name):
+        """Returns the sorted object names of a bucket.
+
+        The list is shared with the index and must not be modified.
+        """
+        names = self._buckets.get(bucket_name)
+        if names is None:
+            path = self._bucket_path(bucket_name)
+            offset = self._name_offset(path)
+            names = []
+            for root, dirs, files in os.walk(path):
+                for file_name in files:
+                    names.append(os.path.join(root, file_name)[offset:])
+            names.sort()
+            self._buckets[bucket_name] = names
+        return names
+
+    def _object_name(self, bucket_name, object_path):
+        path = self._bucket_path(bucket_name)
+        return object_path[self._name_offset(path):]
+
+    def add(self, bucket_name, object_path):
+        names = self._buckets.get(bucket_name)
+        if names is None:
+            return
+        name = self._object_name(bucket_name, object_path)
+        pos = bisect.bisect_left(names, name)
+        if pos == len(names) or names[pos] != name:
+            names.insert(pos, name)
+
+    def remove(self, bucket_name, object_path):
+        names = self._buckets.get(bucket_name)
+        if names is None:
+            return
+        name = self._object_name(bucket_name, object_path)
+        pos = bisect.bisect_left(names, name)
+        if pos < len(names) and names[pos] == name:
+            del names[pos]
+
+    def drop(self, bucket_name):
+        self._buckets.pop(bucket_name, None)
+
+
+def _file_iter(path, offset, length):
+    """Yields length bytes of the file from offset on, in chunks."""
+    with open(path, "rb") as object_file:
+        object_file.seek(offset)
+        while length > 0:
+            data = object_file.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
 class BaseRequestHandler(object):
     """Base class emulating Tornado's web framework pattern in WSGI.
 
@@ -235,15 +320,7 @@ class BucketHandler(BaseRequestHandler):
             not os.path.isdir(path)):
             self.set_status(404)
             return
-        object_names = []
-        for root, dirs, files in os.walk(path):
-            for file_name in files:
-                object_names.append(os.path.join(root, file_name))
-        skip = len(path) + 1
-        for i in range(self.application.bucket_depth):
-            skip += 2 * (i + 1) + 1
-        object_names = [n[skip:] for n in object_names]
-        object_names.sort()
+        object_names = self.application.bucket_index.get_names(bucket_name)
         contents = []
 
         start_pos = 0
@@ -253,7 +330,8 @@ class BucketHandler(BaseRequestHandler):
             start_pos = bisect.bisect_left(object_names, prefix, start_pos)
 
         truncated = False
-        for object_name in object_names[start_pos:]:
+        for pos in xrange(start_pos, len(object_names)):
+            object_name = object_names[pos]
             if not object_name.startswith(prefix):
                 break
             if len(contents) >= max_keys:
@@ -287,6 +365,7 @@ class BucketHandler(BaseRequestHandler):
             self.set_status(403)
             return
         os.makedirs(path)
+        self.application.bucket_index.drop(bucket_name)
         self.finish()
 
     def delete(self, bucket_name):
@@ -300,6 +379,7 @@ class BucketHandler(BaseRequestHandler):
             self.set_status(403)
             return
         os.rmdir(path)
+        self.application.bucket_index.drop(bucket_name)
         self.set_status(204)
         self.finish()
 
@@ -316,11 +396,22 @@ class ObjectHandler(BaseRequestHandler):
         self.set_header("Content-Type", "application/unknown")
         self.set_header("Last-Modified", datetime.datetime.utcfromtimestamp(
             info.st_mtime))
-        object_file = open(path, "r")
-        try:
-            self.finish(object_file.read())
-        finally:
-            object_file.close()
+        self.set_header("Accept-Ranges", "bytes")
+        offset, end = 0, info.st_size
+        # NOTE: multiple ranges are not supported, the whole object is
+        # returned for them as allowed by RFC 2616.
+        if self.request.range and len(self.request.range.ranges) == 1:
+            byte_range = self.request.range.range_for_length(info.st_size)
+            if byte_range is None:
+                self.set_status(416)
+                self.set_header("Content-Range", "bytes */%d" % info.st_size)
+                return
+            offset, end = byte_range
+            self.set_status(206)
+            self.set_header("Content-Range", "bytes %d-%d/%d" %
+                            (offset, end - 1, info.st_size))
+        self.response.app_iter = _file_iter(path, offset, end - offset)
+        self.response.content_length = end - offset
 
     def put(self, bucket, object_name):
         object_name = urllib.unquote(object_name)
@@ -337,11 +428,22 @@ class ObjectHandler(BaseRequestHandler):
         directory = os.path.dirname(path)
         if not os.path.exists(directory):
             os.makedirs(directory)
-        object_file = open(path, "w")
-        object_file.write(self.request.body)
-        object_file.close()
-        self.set_header('ETag',
-                        '"%s"' % hashlib.md5(self.request.body).hexdigest())
+        md5 = hashlib.md5()
+        remaining = self.request.content_length
+        with open(path, "wb") as object_file:
+            while remaining != 0:
+                size = CHUNK_SIZE
+                if remaining is not None:
+                    size = min(size, remaining)
+                data = self.request.body_file.read(size)
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                md5.update(data)
+                object_file.write(data)
+        self.application.bucket_index.add(bucket, path)
+        self.set_header('ETag', '"%s"' % md5.hexdigest())
         self.finish()
 
     def delete(self, bucket, object_name):
@@ -352,5 +454,6 @@ class ObjectHandler(BaseRequestHandler):
             self.set_status(404)
             return
         os.unlink(path)
+        self.application.bucket_index.remove(bucket, path)
         self.set_status(204)
         self.finish()
@@ -23,7 +23,7 @@ JSON related utilities.
 This module provides a few things:
 
     1) A handy function for getting an object down to something that can be
-    JSON serialized.  See to_primitive().
+    JSON serialized.  See to_primitive() and to_primitive_fast().
 
     2) Wrappers around loads() and dumps().  The dumps() wrapper will
     automatically use to_primitive() for you if needed.
@@ -56,6 +56,12 @@ def to_primitive(value, convert_instances=False, level=0):
     Therefore, convert_instances=True is lossy ... be aware.
 
     """
+    return _inspect_to_primitive(value, convert_instances, level,
+                                 to_primitive)
+
+
+def _inspect_to_primitive(value, convert_instances, level, recurse):
+    """Converts value using inspection, calling recurse for members."""
     nasty = [inspect.ismodule, inspect.isclass, inspect.ismethod,
              inspect.isfunction, inspect.isgeneratorfunction,
              inspect.isgenerator, inspect.istraceback, inspect.isframe,
@@ -93,31 +99,31 @@ def to_primitive(value, convert_instances=False, level=0):
         if isinstance(value, (list, tuple)):
             o = []
             for v in value:
-                o.append(to_primitive(v, convert_instances=convert_instances,
-                                      level=level))
+                o.append(recurse(v, convert_instances=convert_instances,
+                                 level=level))
             return o
         elif isinstance(value, dict):
             o = {}
             for k, v in value.iteritems():
-                o[k] = to_primitive(v, convert_instances=convert_instances,
-                                    level=level)
+                o[k] = recurse(v, convert_instances=convert_instances,
+                               level=level)
             return o
         elif isinstance(value, datetime.datetime):
             return timeutils.strtime(value)
         elif hasattr(value, 'iteritems'):
-            return to_primitive(dict(value.iteritems()),
-                                convert_instances=convert_instances,
-                                level=level + 1)
+            return recurse(dict(value.iteritems()),
+                           convert_instances=convert_instances,
+                           level=level + 1)
         elif hasattr(value, '__iter__'):
-            return to_primitive(list(value),
-                                convert_instances=convert_instances,
-                                level=level)
+            return recurse(list(value),
+                           convert_instances=convert_instances,
+                           level=level)
         elif convert_instances and hasattr(value, '__dict__'):
             # Likely an instance of something. Watch for cycles.
             # Ignore class member vars.
-            return to_primitive(value.__dict__,
-                                convert_instances=convert_instances,
-                                level=level + 1)
+            return recurse(value.__dict__,
+                           convert_instances=convert_instances,
+                           level=level + 1)
         else:
             return value
     except TypeError, e:
@@ -126,6 +132,48 @@ def to_primitive(value, convert_instances=False, level=0):
         return unicode(value)
 
 
+_SIMPLE_TYPES = frozenset([type(None), bool, int, long, float, str,
+                           unicode])
+_CONTAINER_TYPES = (dict, list, tuple)
+
+
+def to_primitive_fast(value, convert_instances=False, level=0):
+    """Convert a complex object into primitives, dispatching on type first.
+
+    Produces exactly the same output as to_primitive(), but plain JSON
+    types, datetimes, dicts, lists and tuples (including subclasses such as
+    the network model classes) are converted without running any of the
+    inspect predicates.  Only values of other types take the slower
+    inspection path.
+
+    """
+    value_type = type(value)
+    if value_type in _SIMPLE_TYPES:
+        if level > 3:
+            return '?'
+        return value
+    elif value_type is datetime.datetime:
+        if level > 3:
+            return '?'
+        return timeutils.strtime(value)
+    elif (value_type in _CONTAINER_TYPES or
+          (isinstance(value, _CONTAINER_TYPES) and
+           getattr(value, '__module__', None) != 'mox')):
+        if level > 3:
+            return '?'
+        if isinstance(value, dict):
+            o = {}
+            for k, v in value.iteritems():
+                o[k] = to_primitive_fast(v,
+                                         convert_instances=convert_instances,
+                                         level=level)
+            return o
+        return [to_primitive_fast(v, convert_instances=convert_instances,
+                                  level=level) for v in value]
+    return _inspect_to_primitive(value, convert_instances, level,
+                                 to_primitive_fast)
+
+
 def dumps(value, default=to_primitive, **kwargs):
     return json.dumps(value, default=default, **kwargs)
 
@@ -55,6 +55,24 @@ class BadPriorityException(Exception):
     pass
 
 
+_drivers = {}
+
+
+def _get_driver(notification_driver=None):
+    """Returns the driver module for notification_driver.
+
+    Drivers are imported once and cached by name, so notify() does not
+    pay for a module lookup on every call.
+    """
+    if notification_driver is None:
+        notification_driver = CONF.notification_driver
+    driver = _drivers.get(notification_driver)
+    if driver is None:
+        driver = importutils.import_module(notification_driver)
+        _drivers[notification_driver] = driver
+    return driver
+
+
 def notify_decorator(name, fn):
     """ decorator for notify which is used from utils.monkey_patch()
 
@@ -125,9 +143,9 @@ def notify(context, publisher_id, event_type, priority, payload):
                  _('%s not in valid priorities') % priority)
 
     # Ensure everything is JSON serializable.
-    payload = jsonutils.to_primitive(payload, convert_instances=True)
+    payload = jsonutils.to_primitive_fast(payload, convert_instances=True)
 
-    driver = importutils.import_module(CONF.notification_driver)
+    driver = _get_driver()
     msg = dict(message_id=str(uuid.uuid4()),
                    publisher_id=publisher_id,
                    event_type=event_type,
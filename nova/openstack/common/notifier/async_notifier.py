@@ -0,0 +1,222 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Notification driver that publishes from a background green thread.
+
+Notifications are put on a bounded in-process queue and handed to the
+real driver (async_notifier_driver) in batches, so callers never wait on
+the message broker.  When the queue is full the overflow policy decides
+what happens:
+
+block
+  the caller waits until there is room on the queue
+drop_oldest
+  the oldest queued notification is discarded
+spill
+  the notification is appended to async_notifier_spill_file and replayed
+  once the queue has drained.  Spilled notifications are replayed without
+  their request context.
+"""
+
+import os
+import time
+
+import eventlet
+from eventlet import queue
+
+from nova.openstack.common import cfg
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+
+
+async_notifier_opts = [
+    cfg.StrOpt('async_notifier_driver',
+               default='nova.openstack.common.notifier.rabbit_notifier',
+               help='Driver used to publish queued notifications'),
+    cfg.IntOpt('async_notifier_queue_size',
+               default=1000,
+               help='Maximum number of notifications waiting to be sent'),
+    cfg.IntOpt('async_notifier_batch_size',
+               default=50,
+               help='Maximum number of notifications published at once'),
+    cfg.StrOpt('async_notifier_overflow_policy',
+               default='block',
+               help='What to do when the notification queue is full: '
+                    'block, drop_oldest or spill'),
+    cfg.StrOpt('async_notifier_spill_file',
+               default=None,
+               help='File notifications are spilled to when the queue is '
+                    'full and the overflow policy is spill'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(async_notifier_opts)
+
+LOG = logging.getLogger(__name__)
+
+_driver = None
+_queue = None
+_worker = None
+_stats = {}
+
+
+def _reset_stats():
+    _stats.update(enqueued=0, published=0, dropped=0, spilled=0, failed=0,
+                  batches=0, latency_total=0.0, latency_max=0.0)
+
+
+_reset_stats()
+
+
+def _get_driver():
+    """Imports the real notification driver once."""
+    global _driver
+    if _driver is None:
+        _driver = importutils.import_module(CONF.async_notifier_driver)
+    return _driver
+
+
+def _get_queue():
+    """Creates the queue and starts the publisher on first use."""
+    global _queue, _worker
+    if _queue is None:
+        _queue = queue.Queue(CONF.async_notifier_queue_size)
+    if _worker is None:
+        _worker = eventlet.spawn(_publish_loop)
+    return _queue
+
+
+def _spill(message):
+    path = CONF.async_notifier_spill_file
+    if not path:
+        LOG.error(_("Notification queue is full and no "
+                    "async_notifier_spill_file is set, dropping "
+                    "%(event_type)s"), message)
+        _stats['dropped'] += 1
+        return
+    with open(path, 'a') as spill_file:
+        spill_file.write(jsonutils.dumps(message) + '\n')
+    _stats['spilled'] += 1
+
+
+def _replay_spilled():
+    """Queues notifications spilled to disk while the queue was full."""
+    path = CONF.async_notifier_spill_file
+    if not path:
+        return
+    replay_path = path + '.replay'
+    if not os.path.exists(replay_path):
+        if not os.path.exists(path):
+            return
+        os.rename(path, replay_path)
+    with open(replay_path) as spill_file:
+        messages = [jsonutils.loads(line) for line in spill_file
+                    if line.strip()]
+    LOG.info(_("Replaying %d spilled notifications"), len(messages))
+    batch_size = CONF.async_notifier_batch_size
+    now = time.time()
+    for i in xrange(0, len(messages), batch_size):
+        _publish([(now, None, message)
+                  for message in messages[i:i + batch_size]])
+    os.unlink(replay_path)
+
+
+def _publish(batch):
+    """Hands a list of (enqueued_at, context, message) to the driver."""
+    driver = _get_driver()
+    notifications = [(context, message) for _at, context, message in batch]
+    try:
+        if hasattr(driver, 'notify_batch'):
+            driver.notify_batch(notifications)
+        else:
+            for context, message in notifications:
+                driver.notify(context, message)
+    except Exception:
+        LOG.exception(_("Problem attempting to publish a batch of %d "
+                        "notifications"), len(batch))
+        _stats['failed'] += len(batch)
+        return
+
+    now = time.time()
+    for enqueued_at, _context, _message in batch:
+        latency = now - enqueued_at
+        _stats['latency_total'] += latency
+        _stats['latency_max'] = max(_stats['latency_max'], latency)
+    _stats['published'] += len(batch)
+    _stats['batches'] += 1
+    LOG.debug(_("Published %(count)d notifications, %(depth)d still "
+                "queued, oldest waited %(latency).3fs"),
+              {'count': len(batch), 'depth': _queue.qsize(),
+               'latency': now - batch[0][0]})
+
+
+def _publish_loop():
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < CONF.async_notifier_batch_size:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        _publish(batch)
+        if _queue.empty():
+            try:
+                _replay_spilled()
+            except Exception:
+                LOG.exception(_("Problem replaying spilled notifications"))
+
+
+def notify(context, message):
+    """Queues a notification for the background publisher."""
+    notification_queue = _get_queue()
+    if notification_queue.full():
+        policy = CONF.async_notifier_overflow_policy
+        if policy == 'spill':
+            _spill(message)
+            return
+        elif policy == 'drop_oldest':
+            try:
+                dropped = notification_queue.get_nowait()[2]
+                _stats['dropped'] += 1
+                LOG.warn(_("Notification queue is full, dropping "
+                           "%(event_type)s"), dropped)
+            except queue.Empty:
+                pass
+    notification_queue.put((time.time(), context, message))
+    _stats['enqueued'] += 1
+
+
+def get_stats():
+    """Returns counters, queue depth and publish latency of the notifier."""
+    stats = dict(_stats)
+    stats['queue_depth'] = _queue.qsize() if _queue is not None else 0
+    if stats['published']:
+        stats['latency_avg'] = stats['latency_total'] / stats['published']
+    else:
+        stats['latency_avg'] = 0.0
+    return stats
+
+
+def _reset():
+    """Used by unit tests to stop the publisher and drop queued messages."""
+    global _driver, _queue, _worker
+    if _worker is not None:
+        _worker.kill()
+    _driver = None
+    _queue = None
+    _worker = None
+    _reset_stats()
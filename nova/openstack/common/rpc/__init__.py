@@ -182,6 +182,24 @@ def notify(context, topic, msg):
     return _get_impl().notify(cfg.CONF, context, topic, msg)
 
 
+def notify_batch(notifications):
+    """Send several notification events at once.
+
+    Implementations that support it publish the whole batch over a single
+    connection; the others fall back to one notify() per event.
+
+    :param notifications: A list of (context, topic, msg) tuples, with the
+                          same meaning as the arguments to notify().
+
+    :returns: None
+    """
+    impl = _get_impl()
+    if hasattr(impl, 'notify_batch'):
+        return impl.notify_batch(cfg.CONF, notifications)
+    for context, topic, msg in notifications:
+        impl.notify(cfg.CONF, context, topic, msg)
+
+
 def cleanup():
     """Clean up resoruces in use by implementation.
 
@@ -413,6 +413,18 @@ def notify(conf, context, topic, msg, connection_pool):
         conn.notify_send(topic, msg)
 
 
+def notify_batch(conf, notifications, connection_pool):
+    """Sends several notification events over a single pooled connection.
+
+    :param notifications: a list of (context, topic, msg) tuples
+    """
+    LOG.debug(_('Sending a batch of %d notifications'), len(notifications))
+    with ConnectionContext(conf, connection_pool) as conn:
+        for context, topic, msg in notifications:
+            pack_context(msg, context)
+            conn.notify_send(topic, msg)
+
+
 def cleanup(connection_pool):
     if connection_pool:
         connection_pool.empty()
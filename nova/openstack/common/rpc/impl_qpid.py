@@ -595,5 +595,12 @@ def notify(conf, context, topic, msg):
                            rpc_amqp.get_connection_pool(conf, Connection))
 
 
+def notify_batch(conf, notifications):
+    """Sends a list of (context, topic, msg) notification events."""
+    return rpc_amqp.notify_batch(
+        conf, notifications,
+        rpc_amqp.get_connection_pool(conf, Connection))
+
+
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
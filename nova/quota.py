@@ -83,6 +83,10 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='default driver to use for quota checks'),
+    cfg.IntOpt('quota_limit_cache_ttl',
+               default=5,
+               help='number of seconds the quota limits used by reserve '
+                    'and limit checks are cached; 0 disables the cache'),
     ]
 
 FLAGS = flags.FLAGS
@@ -96,6 +100,10 @@ class DbQuotaDriver(object):
     database.
     """
 
+    def __init__(self):
+        # (project_id, quota_class) -> (expiry, {resource: limit})
+        self._limit_cache = {}
+
     def get_by_project(self, context, project_id, resource):
         """Get a specific quota by project."""
 
@@ -235,11 +243,50 @@ class DbQuotaDriver(object):
             raise exception.QuotaResourceUnknown(unknown=sorted(unknown))
 
         # Grab and return the quotas (without usages)
-        quotas = self.get_project_quotas(context, sub_resources,
+        limits = self._get_limits(context, resources)
+
+        return dict((k, limits[k]) for k in sub_resources)
+
+    def _get_limits(self, context, resources):
+        """
+        Return the limits of all resources for the context's project
+        and quota class, from the cache if they were read within the
+        last quota_limit_cache_ttl seconds.
+        """
+
+        key = (context.project_id, context.quota_class)
+        now = timeutils.utcnow()
+        cached = self._limit_cache.get(key)
+        if (cached and cached[0] > now and
+            all(name in cached[1] for name in resources)):
+            return cached[1]
+
+        quotas = self.get_project_quotas(context, resources,
                                          context.project_id,
                                          context.quota_class, usages=False)
+        limits = dict((k, v['limit']) for k, v in quotas.items())
+        if FLAGS.quota_limit_cache_ttl > 0:
+            ttl = datetime.timedelta(seconds=FLAGS.quota_limit_cache_ttl)
+            self._limit_cache[key] = (now + ttl, limits)
+        return limits
+
+    def invalidate_cache(self, project_id=None, quota_class=None):
+        """
+        Drop cached limits after quotas are changed.  With neither
+        argument, everything is dropped.
+
+        :param project_id: Drop the limits cached for this project.
+        :param quota_class: Drop the limits cached for this quota
+                            class.
+        """
 
-        return dict((k, v['limit']) for k, v in quotas.items())
+        if project_id is None and quota_class is None:
+            self._limit_cache.clear()
+            return
+        for key in self._limit_cache.keys():
+            if ((project_id is not None and key[0] == project_id) or
+                (quota_class is not None and key[1] == quota_class)):
+                del self._limit_cache[key]
 
     def limit_check(self, context, resources, values):
         """Check simple quota limits.
@@ -367,6 +414,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        self.invalidate_cache(project_id=project_id)
 
     def expire(self, context):
         """Expire reservations.
@@ -745,6 +793,19 @@ class QuotaEngine(object):
 
         self._driver.destroy_all_by_project(context, project_id)
 
+    def invalidate_cache(self, project_id=None, quota_class=None):
+        """
+        Drop cached quota limits after the quotas of a project or quota
+        class are changed.  With neither argument, everything is
+        dropped.
+
+        :param project_id: The ID of the project whose quotas changed.
+        :param quota_class: The name of the quota class which changed.
+        """
+
+        self._driver.invalidate_cache(project_id=project_id,
+                                      quota_class=quota_class)
+
     def expire(self, context):
         """Expire reservations.
 
@@ -761,38 +822,21 @@ class QuotaEngine(object):
         return sorted(self._resources.keys())
 
 
-def _sync_instances(context, project_id, session):
-    return dict(zip(('instances', 'cores', 'ram'),
-                    db.instance_data_get_for_project(
-                context, project_id, session=session)))
-
-
-def _sync_volumes(context, project_id, session):
-    return dict(zip(('volumes', 'gigabytes'),
-                    db.volume_data_get_for_project(
-                context, project_id, session=session)))
-
-
-def _sync_floating_ips(context, project_id, session):
-    return dict(floating_ips=db.floating_ip_count_by_project(
-            context, project_id, session=session))
-
-
-def _sync_security_groups(context, project_id, session):
-    return dict(security_groups=db.security_group_count_by_project(
-            context, project_id, session=session))
+def _sync_usages(context, project_id, session):
+    return db.quota_usage_data_get_for_project(context, project_id,
+                                               session=session)
 
 
 QUOTAS = QuotaEngine()
 
 
 resources = [
-    ReservableResource('instances', _sync_instances, 'quota_instances'),
-    ReservableResource('cores', _sync_instances, 'quota_cores'),
-    ReservableResource('ram', _sync_instances, 'quota_ram'),
-    ReservableResource('volumes', _sync_volumes, 'quota_volumes'),
-    ReservableResource('gigabytes', _sync_volumes, 'quota_gigabytes'),
-    ReservableResource('floating_ips', _sync_floating_ips,
+    ReservableResource('instances', _sync_usages, 'quota_instances'),
+    ReservableResource('cores', _sync_usages, 'quota_cores'),
+    ReservableResource('ram', _sync_usages, 'quota_ram'),
+    ReservableResource('volumes', _sync_usages, 'quota_volumes'),
+    ReservableResource('gigabytes', _sync_usages, 'quota_gigabytes'),
+    ReservableResource('floating_ips', _sync_usages,
                        'quota_floating_ips'),
     AbsoluteResource('metadata_items', 'quota_metadata_items'),
     AbsoluteResource('injected_files', 'quota_injected_files'),
@@ -800,7 +844,7 @@ resources = [
                      'quota_injected_file_content_bytes'),
     AbsoluteResource('injected_file_path_bytes',
                      'quota_injected_file_path_bytes'),
-    ReservableResource('security_groups', _sync_security_groups,
+    ReservableResource('security_groups', _sync_usages,
                        'quota_security_groups'),
     CountableResource('security_group_rules',
                       db.security_group_rule_count_by_group,
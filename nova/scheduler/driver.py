@@ -176,6 +176,27 @@ class Scheduler(object):
         base_options['uuid'] = instance['uuid']
         return instance
 
+    def create_instance_db_entries(self, context, request_spec, reservations,
+                                   hosts):
+        """Create one instance DB entry per host based on request_spec.
+
+        The entries are created in one transaction and are already
+        assigned to their hosts, so they can be cast with update_db=False.
+        """
+        base_options = request_spec['instance_properties']
+        if base_options.get('uuid'):
+            # Instance was already created before calling scheduler
+            return [db.instance_update(context, base_options['uuid'],
+                    {'host': hosts[0], 'scheduled_at': timeutils.utcnow()})]
+        image = request_spec['image']
+        instance_type = request_spec.get('instance_type')
+        security_group = request_spec.get('security_group', 'default')
+        block_device_mapping = request_spec.get('block_device_mapping', [])
+
+        return self.compute_api.create_db_entries_for_new_instances(
+                context, instance_type, image, base_options,
+                security_group, block_device_mapping, reservations, hosts)
+
     def schedule(self, context, topic, method, *_args, **_kwargs):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement a fallback schedule"))
@@ -79,24 +79,9 @@ class FilterScheduler(driver.Scheduler):
         # contains an instance of RpcContext that cannot be serialized.
         filter_properties.pop('context', None)
 
-        instances = []
-        for num in xrange(num_instances):
-            if not weighted_hosts:
-                break
-            weighted_host = weighted_hosts.pop(0)
-
-            request_spec['instance_properties']['launch_index'] = num
-
-            instance = self._provision_resource(elevated, weighted_host,
-                                                request_spec, reservations,
-                                                filter_properties, kwargs)
-            # scrub retry host list in case we're scheduling multiple
-            # instances:
-            retry = filter_properties.get('retry', {})
-            retry['hosts'] = []
-
-            if instance:
-                instances.append(instance)
+        instances = self._provision_resources(elevated,
+                weighted_hosts[:num_instances], request_spec, reservations,
+                filter_properties, kwargs)
 
         notifier.notify(context, notifier.publisher_id("scheduler"),
                         'scheduler.run_instance.end', notifier.INFO, payload)
@@ -124,34 +109,52 @@ class FilterScheduler(driver.Scheduler):
         driver.cast_to_compute_host(context, host.host_state.host,
                 'prep_resize', **kwargs)
 
-    def _provision_resource(self, context, weighted_host, request_spec,
+    def _provision_resources(self, context, weighted_hosts, request_spec,
             reservations, filter_properties, kwargs):
-        """Create the requested resource in this Zone."""
-        instance = self.create_instance_db_entry(context, request_spec,
-                                                 reservations)
-
-        # Add a retry entry for the selected compute host:
-        self._add_retry_host(filter_properties, weighted_host.host_state.host)
+        """Create the requested instances, one per weighted host, and cast
+        each of them to its host.
+        """
+        hosts = [weighted_host.host_state.host
+                 for weighted_host in weighted_hosts]
+        instances = self.create_instance_db_entries(context, request_spec,
+                                                    reservations, hosts)
 
-        payload = dict(request_spec=request_spec,
-                       weighted_host=weighted_host.to_dict(),
-                       instance_id=instance['uuid'])
-        notifier.notify(context, notifier.publisher_id("scheduler"),
-                        'scheduler.run_instance.scheduled', notifier.INFO,
-                        payload)
+        instance_properties = request_spec['instance_properties']
+        encoded = []
+        for num, (weighted_host, instance) in enumerate(zip(weighted_hosts,
+                                                            instances)):
+            host = weighted_host.host_state.host
+            # NOTE(comstud): This needs to be set for the generic exception
+            # checking in scheduler manager, so that it'll set this
+            # instance to ERROR properly.
+            instance_properties['uuid'] = instance['uuid']
+            instance_properties['launch_index'] = num
+
+            # Add a retry entry for the selected compute host:
+            self._add_retry_host(filter_properties, host)
+
+            payload = dict(request_spec=request_spec,
+                           weighted_host=weighted_host.to_dict(),
+                           instance_id=instance['uuid'])
+            notifier.notify(context, notifier.publisher_id("scheduler"),
+                            'scheduler.run_instance.scheduled', notifier.INFO,
+                            payload)
+
+            driver.cast_to_compute_host(context, host, 'run_instance',
+                    update_db=False, instance_uuid=instance['uuid'],
+                    request_spec=request_spec,
+                    filter_properties=filter_properties, **kwargs)
+            encoded.append(driver.encode_instance(instance, local=True))
 
-        driver.cast_to_compute_host(context, weighted_host.host_state.host,
-                'run_instance', instance_uuid=instance['uuid'],
-                request_spec=request_spec, filter_properties=filter_properties,
-                **kwargs)
-        inst = driver.encode_instance(instance, local=True)
+            # scrub retry host list in case we're scheduling multiple
+            # instances:
+            retry = filter_properties.get('retry', {})
+            retry['hosts'] = []
 
-        # So if another instance is created, create_instance_db_entry will
-        # actually create a new entry, instead of assume it's been created
-        # already
-        del request_spec['instance_properties']['uuid']
+        # The entries exist now, later requests must not reuse the uuid.
+        instance_properties.pop('uuid', None)
 
-        return inst
+        return encoded
 
     def _add_retry_host(self, filter_properties, host):
         """Add a retry entry for the selected computep host.  In the event that
@@ -160,8 +160,7 @@ class HostState(object):
             if not filter_fn(self, filter_properties):
                 LOG.debug(_('Host filter function %(func)s failed for '
                             '%(host)s'),
-                          {'func': repr(filter_fn),
-                           'host': self.host})
+                          {'func': filter_fn, 'host': self.host})
                 return False
 
         LOG.debug(_('Host filter passes for %(host)s'), {'host': self.host})
@@ -226,7 +225,7 @@ class HostManager(object):
     def update_service_capabilities(self, service_name, host, capabilities):
         """Update the per-service capabilities based on this notification."""
         LOG.debug(_("Received %(service_name)s service update from "
-                    "%(host)s.") % locals())
+                    "%(host)s."), locals())
         service_caps = self.service_states.get(host, {})
         # Copy the capabilities, so we don't modify the original dict
         capab_copy = dict(capabilities)
@@ -21,6 +21,7 @@
 Scheduler Service
 """
 
+import datetime
 import functools
 
 from nova.compute import vm_states
@@ -34,6 +35,7 @@ from nova.openstack.common import excutils
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier
+from nova.openstack.common import timeutils
 from nova import quota
 
 
@@ -43,8 +45,22 @@ scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
         default='nova.scheduler.multi.MultiScheduler',
         help='Default driver to use for the scheduler')
 
+archive_opts = [
+    cfg.IntOpt('archive_deleted_rows_interval',
+               default=0,
+               help='Seconds between archivals of old deleted rows to the '
+                    'shadow tables by the scheduler. 0 disables it'),
+    cfg.IntOpt('archive_deleted_rows_age',
+               default=90,
+               help='Days after which deleted rows are archived'),
+    cfg.IntOpt('archive_deleted_rows_max_rows',
+               default=10000,
+               help='Maximum number of rows archived in one run'),
+    ]
+
 FLAGS = flags.FLAGS
 FLAGS.register_opt(scheduler_driver_opt)
+FLAGS.register_opts(archive_opts)
 
 QUOTAS = quota.QUOTAS
 
@@ -244,3 +260,17 @@ class SchedulerManager(manager.Manager):
     @manager.periodic_task
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
+
+    @manager.periodic_task(spacing='archive_deleted_rows_interval')
+    def _archive_deleted_rows(self, context):
+        """Move old soft-deleted rows to the shadow tables."""
+        if not FLAGS.archive_deleted_rows_interval:
+            return
+        older_than = timeutils.utcnow() - datetime.timedelta(
+                days=FLAGS.archive_deleted_rows_age)
+        archived = db.archive_deleted_rows(context,
+                max_rows=FLAGS.archive_deleted_rows_max_rows,
+                older_than=older_than)
+        LOG.info(_("Archived %(count)d rows deleted before "
+                   "%(older_than)s"),
+                 {'count': sum(archived.values()), 'older_than': older_than})
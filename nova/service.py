@@ -39,6 +39,7 @@ from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
+from nova import servicegroup
 from nova import utils
 from nova import version
 from nova import wsgi
@@ -371,6 +372,7 @@ class Service(object):
         self.periodic_fuzzy_delay = periodic_fuzzy_delay
         self.saved_args, self.saved_kwargs = args, kwargs
         self.timers = []
+        self.servicegroup_api = servicegroup.API()
 
     def start(self):
         vcs_string = version.version_string_with_vcs()
@@ -387,6 +389,7 @@ class Service(object):
             self.service_id = service_ref['id']
         except exception.NotFound:
             self._create_service_ref(ctxt)
+        self.servicegroup_api.join(ctxt, self)
 
         if 'nova-compute' == self.binary:
             self.manager.update_available_resource(ctxt)
@@ -490,6 +493,10 @@ class Service(object):
             self.conn.close()
         except Exception:
             pass
+        try:
+            self.servicegroup_api.leave(context.get_admin_context(), self)
+        except Exception:
+            pass
         for x in self.timers:
             try:
                 x.stop()
@@ -510,25 +517,10 @@ class Service(object):
         self.manager.periodic_tasks(ctxt, raise_on_error=raise_on_error)
 
     def report_state(self):
-        """Update the state of this service in the datastore."""
+        """Report a heartbeat through the servicegroup driver."""
         ctxt = context.get_admin_context()
-        zone = FLAGS.node_availability_zone
-        state_catalog = {}
         try:
-            try:
-                service_ref = db.service_get(ctxt, self.service_id)
-            except exception.NotFound:
-                LOG.debug(_('The service database object disappeared, '
-                            'Recreating it.'))
-                self._create_service_ref(ctxt)
-                service_ref = db.service_get(ctxt, self.service_id)
-
-            state_catalog['report_count'] = service_ref['report_count'] + 1
-            if zone != service_ref['availability_zone']:
-                state_catalog['availability_zone'] = zone
-
-            db.service_update(ctxt,
-                             self.service_id, state_catalog)
+            self.servicegroup_api.report_state(ctxt, self)
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(self, 'model_disconnected', False):
@@ -0,0 +1,195 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+A servicegroup driver that takes heartbeats off the database write path.
+
+Services fanout_cast their heartbeats to the servicegroup topic instead
+of updating their own services row.  Services whose topic is listed in
+servicegroup_aggregator_topics (the schedulers by default) also consume
+that topic, keep the latest heartbeat of every service in memory and
+write all of them to the database in one transaction every
+servicegroup_flush_interval seconds.
+
+Liveness checks on an aggregating host are answered from memory.
+Everywhere else they read the services table and allow for the flush
+delay on top of service_down_time.
+"""
+
+from nova import db
+from nova import flags
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
+import nova.openstack.common.rpc.proxy
+from nova.openstack.common import timeutils
+from nova.servicegroup import driver
+from nova import utils
+
+
+aggregator_opts = [
+    cfg.StrOpt('servicegroup_topic',
+               default='servicegroup',
+               help='the topic heartbeats are sent to'),
+    cfg.ListOpt('servicegroup_aggregator_topics',
+                default=['scheduler'],
+                help='Services with these topics collect heartbeats and '
+                     'write them to the database.  At least one of them '
+                     'must be running or every service will look down'),
+    cfg.IntOpt('servicegroup_flush_interval',
+               default=30,
+               help='Seconds between database writes of the collected '
+                    'heartbeats'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(aggregator_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class HeartbeatAPI(nova.openstack.common.rpc.proxy.RpcProxy):
+    '''Client side of the heartbeat aggregator rpc API.
+
+    API version history:
+
+        1.0 - Initial version.
+    '''
+
+    BASE_RPC_API_VERSION = '1.0'
+
+    def __init__(self):
+        super(HeartbeatAPI, self).__init__(topic=FLAGS.servicegroup_topic,
+                default_version=self.BASE_RPC_API_VERSION)
+
+    def heartbeat(self, ctxt, service_id, report_count):
+        self.fanout_cast(ctxt, self.make_msg('heartbeat',
+                service_id=service_id, report_count=report_count))
+
+
+class HeartbeatAggregator(object):
+    """Collects the heartbeats sent to the servicegroup topic."""
+
+    RPC_API_VERSION = '1.0'
+
+    def __init__(self):
+        # service id -> time the last heartbeat was received
+        self.last_seen = {}
+        # service id -> values not yet written to the database
+        self._pending = {}
+
+    def heartbeat(self, context, service_id, report_count):
+        # NOTE: the time a heartbeat is received is recorded rather than a
+        # time sent by the service, so clock skew between hosts does not
+        # matter.
+        now = timeutils.utcnow()
+        self.last_seen[service_id] = now
+        self._pending[service_id] = {'updated_at': now,
+                                     'report_count': report_count}
+
+    def flush(self, context):
+        """Write the heartbeats received since the last flush."""
+        if not self._pending:
+            return
+        heartbeats, self._pending = self._pending, {}
+        try:
+            db.service_heartbeat_bulk_update(context, heartbeats)
+        except Exception:
+            LOG.exception(_('Failed to write %d service heartbeats') %
+                          len(heartbeats))
+            # Retry on the next flush unless newer heartbeats arrived.
+            for service_id, values in heartbeats.iteritems():
+                self._pending.setdefault(service_id, values)
+
+
+class AggregatorDriver(driver.ServiceGroupDriver):
+    """Heartbeats go over rpc and are written to the database in bulk."""
+
+    def __init__(self):
+        self.heartbeat_api = HeartbeatAPI()
+        self.aggregator = None
+        self._conn = None
+        self._timer = None
+        self._report_counts = {}
+
+    def join(self, context, service):
+        # The zone and report_count are checked once here instead of on
+        # every heartbeat.
+        service_ref = db.service_get(context, service.service_id)
+        self._report_counts[service.service_id] = service_ref['report_count']
+        zone = FLAGS.node_availability_zone
+        if zone != service_ref['availability_zone']:
+            db.service_update(context, service.service_id,
+                              {'availability_zone': zone})
+
+        if (self.aggregator is not None or
+            service.topic not in FLAGS.servicegroup_aggregator_topics):
+            return
+
+        LOG.debug(_("Collecting heartbeats from topic %s") %
+                  FLAGS.servicegroup_topic)
+        self.aggregator = HeartbeatAggregator()
+        self._conn = rpc.create_connection(new=True)
+        dispatcher = rpc_dispatcher.RpcDispatcher([self.aggregator])
+        self._conn.create_consumer(FLAGS.servicegroup_topic, dispatcher,
+                                   fanout=True)
+        self._conn.consume_in_thread()
+        self._timer = utils.LoopingCall(self.aggregator.flush, context)
+        self._timer.start(interval=FLAGS.servicegroup_flush_interval,
+                          initial_delay=FLAGS.servicegroup_flush_interval)
+
+    def leave(self, context, service):
+        self._report_counts.pop(service.service_id, None)
+        if self.aggregator is None or self._report_counts:
+            return
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._timer.stop()
+        self.aggregator.flush(context)
+        self.aggregator = None
+
+    def report_state(self, context, service):
+        # NOTE: the absolute count is sent, so the write is idempotent when
+        # more than one aggregator is running.
+        report_count = self._report_counts.get(service.service_id, 0) + 1
+        self.heartbeat_api.heartbeat(context, service.service_id,
+                                     report_count)
+        self._report_counts[service.service_id] = report_count
+
+    def is_up(self, service_ref):
+        return bool(self.get_up_services([service_ref]))
+
+    def get_up_services(self, services):
+        now = timeutils.utcnow()
+        last_seen = self.aggregator.last_seen if self.aggregator else {}
+        # The services table is behind the heartbeats by up to one flush.
+        db_down_time = (FLAGS.service_down_time +
+                        FLAGS.servicegroup_flush_interval)
+        up = []
+        for service_ref in services:
+            seen = last_seen.get(service_ref['id'])
+            if seen is not None:
+                down_time = FLAGS.service_down_time
+            else:
+                seen = service_ref['updated_at'] or service_ref['created_at']
+                down_time = db_down_time
+            if abs(utils.total_seconds(now - seen)) <= down_time:
+                up.append(service_ref)
+        return up
@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Handles all requests relating to service liveness."""
+
+from nova import flags
+from nova.openstack.common import cfg
+from nova.openstack.common import importutils
+
+
+servicegroup_opts = [
+    cfg.StrOpt('servicegroup_driver',
+               default='nova.servicegroup.db_driver.DbDriver',
+               help='The driver that records service heartbeats and '
+                    'decides whether a service is up'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(servicegroup_opts)
+
+_DRIVER = None
+_DRIVER_CLASS = None
+
+
+def _get_driver():
+    """Return the driver instance shared by this process.
+
+    Drivers may hold state (the aggregator keeps the heartbeats it has
+    received in memory), so every API object uses the same instance.
+    """
+    global _DRIVER, _DRIVER_CLASS
+    if _DRIVER is None or _DRIVER_CLASS != FLAGS.servicegroup_driver:
+        _DRIVER = importutils.import_object(FLAGS.servicegroup_driver)
+        _DRIVER_CLASS = FLAGS.servicegroup_driver
+    return _DRIVER
+
+
+class API(object):
+    """API for reporting and checking service liveness."""
+
+    def __init__(self):
+        self._driver = _get_driver()
+
+    def join(self, context, service):
+        """Start reporting for a service that has just been started.
+
+        :param service: the nova.service.Service being started
+        """
+        return self._driver.join(context, service)
+
+    def leave(self, context, service):
+        """Stop anything join() started for the service."""
+        return self._driver.leave(context, service)
+
+    def report_state(self, context, service):
+        """Record a heartbeat for the service.
+
+        Called every report_interval seconds.  Errors are raised to the
+        caller, which tracks whether the backend is reachable.
+        """
+        return self._driver.report_state(context, service)
+
+    def service_is_up(self, service_ref):
+        """Check whether a service is up.
+
+        :param service_ref: a services table row
+        """
+        return self._driver.is_up(service_ref)
+
+    def get_up_services(self, services):
+        """Return the services that are up, in the order given.
+
+        :param services: services table rows
+        """
+        return self._driver.get_up_services(services)
@@ -0,0 +1,72 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+The default servicegroup driver: every service writes its own heartbeat
+to its services table row.
+"""
+
+from nova import db
+from nova import exception
+from nova import flags
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova.servicegroup import driver
+from nova import utils
+
+
+FLAGS = flags.FLAGS
+LOG = logging.getLogger(__name__)
+
+
+class DbDriver(driver.ServiceGroupDriver):
+    """Heartbeats are report_count/updated_at updates of the service row."""
+
+    def report_state(self, context, service):
+        zone = FLAGS.node_availability_zone
+        state_catalog = {}
+        try:
+            service_ref = db.service_get(context, service.service_id)
+        except exception.NotFound:
+            LOG.debug(_('The service database object disappeared, '
+                        'Recreating it.'))
+            service._create_service_ref(context)
+            service_ref = db.service_get(context, service.service_id)
+
+        state_catalog['report_count'] = service_ref['report_count'] + 1
+        if zone != service_ref['availability_zone']:
+            state_catalog['availability_zone'] = zone
+
+        db.service_update(context, service.service_id, state_catalog)
+
+    def is_up(self, service_ref):
+        """Check whether a service is up based on last heartbeat."""
+        last_heartbeat = service_ref['updated_at'] or service_ref['created_at']
+        # Timestamps in DB are UTC.
+        elapsed = utils.total_seconds(timeutils.utcnow() - last_heartbeat)
+        return abs(elapsed) <= FLAGS.service_down_time
+
+    def get_up_services(self, services):
+        now = timeutils.utcnow()
+        up = []
+        for service_ref in services:
+            last_heartbeat = (service_ref['updated_at'] or
+                              service_ref['created_at'])
+            elapsed = utils.total_seconds(now - last_heartbeat)
+            if abs(elapsed) <= FLAGS.service_down_time:
+                up.append(service_ref)
+        return up
@@ -0,0 +1,46 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Base class for servicegroup drivers."""
+
+
+class ServiceGroupDriver(object):
+    """Base class for servicegroup drivers."""
+
+    def join(self, context, service):
+        """Called once the service has its database record."""
+        pass
+
+    def leave(self, context, service):
+        """Called when the service stops."""
+        pass
+
+    def report_state(self, context, service):
+        """Record a heartbeat for the service."""
+        raise NotImplementedError()
+
+    def is_up(self, service_ref):
+        """Check whether the service is up."""
+        raise NotImplementedError()
+
+    def get_up_services(self, services):
+        """Return the services that are up.
+
+        Drivers that can answer for many services at once should
+        override this.
+        """
+        return [service for service in services if self.is_up(service)]
@@ -35,6 +35,11 @@ def fake_get_console_output(self, _context, _instance, tail_length):
     return '\n'.join(fixture)
 
 
+def fake_get_console_output_range(self, _context, _instance, offset,
+                                  tail_length):
+    return {'output': '01234'[offset:], 'offset': 5}
+
+
 def fake_get(self, context, instance_uuid):
     return {'uuid': instance_uuid}
 
@@ -49,6 +54,8 @@ class ConsoleOutputExtensionTest(test.TestCase):
         super(ConsoleOutputExtensionTest, self).setUp()
         self.stubs.Set(compute.API, 'get_console_output',
                        fake_get_console_output)
+        self.stubs.Set(compute.API, 'get_console_output_range',
+                       fake_get_console_output_range)
         self.stubs.Set(compute.API, 'get', fake_get)
 
     def test_get_text_console_instance_action(self):
@@ -95,6 +102,27 @@ class ConsoleOutputExtensionTest(test.TestCase):
         output = jsonutils.loads(res.body)
         self.assertEqual(res.status_int, 400)
 
+    def test_get_console_output_with_offset(self):
+        body = {'os-getConsoleOutput': {'offset': 3}}
+        req = webob.Request.blank('/v2/fake/servers/1/action')
+        req.method = "POST"
+        req.body = jsonutils.dumps(body)
+        req.headers["content-type"] = "application/json"
+        res = req.get_response(fakes.wsgi_app())
+        output = jsonutils.loads(res.body)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(output, {'output': '34', 'offset': 5})
+
+    def test_get_console_output_with_bad_offset(self):
+        for offset in ('NaN', -1):
+            body = {'os-getConsoleOutput': {'offset': offset}}
+            req = webob.Request.blank('/v2/fake/servers/1/action')
+            req.method = "POST"
+            req.body = jsonutils.dumps(body)
+            req.headers["content-type"] = "application/json"
+            res = req.get_response(fakes.wsgi_app())
+            self.assertEqual(res.status_int, 400)
+
     def test_get_text_console_no_instance(self):
         self.stubs.Set(compute.API, 'get', fake_get_not_found)
         body = {'os-getConsoleOutput': {}}
@@ -596,6 +596,92 @@ class LimiterTest(BaseLimitTestSuite):
         results = list(self._check(5, "PUT", "/anything", "user2"))
         self.assertEqual(expected, results)
 
+    def test_idle_users_are_evicted(self):
+        """
+        Users whose buckets have drained are forgotten, but not the users
+        with limits of their own.
+        """
+        list(self._check(5, "PUT", "/servers", "user1"))
+        self.assertTrue('user1' in self.limiter.levels)
+
+        self.time += 30.0
+        list(self._check(1, "PUT", "/servers", "user2"))
+        self.assertTrue('user1' in self.limiter.levels)
+
+        self.time += 61.0
+        list(self._check(1, "PUT", "/servers", "user2"))
+        self.assertFalse('user1' in self.limiter.levels)
+        self.assertTrue('user2' in self.limiter.levels)
+        self.assertEqual(self.limiter.levels['user3'], [])
+
+    def test_regex_matched_once_per_request(self):
+        """
+        Limits sharing a regex match it once, compiled.
+        """
+        calls = []
+        real_regex_match = limits._regex_match
+
+        def fake_regex_match(regex, url):
+            calls.append(regex)
+            return real_regex_match(regex, url)
+
+        self.stubs.Set(limits, "_regex_match", fake_regex_match)
+        limiter = limits.Limiter([
+            limits.Limit("GET", "*", ".*", 10, limits.PER_MINUTE),
+            limits.Limit("GET", "*", ".*", 100, limits.PER_HOUR),
+            limits.Limit("GET", "/servers", "^/servers", 5,
+                         limits.PER_MINUTE),
+            limits.Limit("POST", "*", ".*", 5, limits.PER_MINUTE),
+        ])
+        limiter.check_for_delay("GET", "/images")
+        self.assertEqual(calls, [".*", "^/servers"])
+
+
+class MemcachedLimiterTest(LimiterTest):
+    """
+    Tests for `limits.MemcachedLimiter`, with the in-process memcache.
+    """
+
+    def setUp(self):
+        """Run before each test."""
+        super(MemcachedLimiterTest, self).setUp()
+        userlimits = {'user:user3': ''}
+        self.limiter = limits.MemcachedLimiter(TEST_LIMITS, **userlimits)
+
+    def test_idle_users_are_evicted(self):
+        """
+        Memcached expires the levels, users are not added to levels.
+        """
+        list(self._check(5, "PUT", "/servers", "user1"))
+        self.assertFalse('user1' in self.limiter.levels)
+
+    def test_workers_share_levels(self):
+        """
+        Limiters using the same memcached enforce one budget.
+        """
+        other = limits.MemcachedLimiter(TEST_LIMITS)
+        other.mc = self.limiter.mc
+        expected = [None] * 5
+        results = list(self._check(5, "PUT", "/servers", "user1"))
+        self.assertEqual(expected, results)
+        delay, error = other.check_for_delay("PUT", "/servers", "user1")
+        self.assertEqual(delay, 12.0)
+
+    def test_get_limits(self):
+        list(self._check(2, "PUT", "/servers", "user1"))
+        limits_by_uri = dict((limit["URI"], limit) for limit in
+                             self.limiter.get_limits("user1")
+                             if limit["verb"] == "PUT")
+        self.assertEqual(limits_by_uri["/servers"]["remaining"], 3)
+        self.assertEqual(limits_by_uri["*"]["remaining"], 8)
+
+    def test_lost_updates_let_requests_through(self):
+        self.stubs.Set(self.limiter.mc, "add", lambda *a, **kw: False)
+        self.stubs.Set(self.limiter.mc, "cas", lambda *a, **kw: False)
+        expected = [None] * 20
+        results = list(self._check(20, "PUT", "/anything"))
+        self.assertEqual(expected, results)
+
 
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
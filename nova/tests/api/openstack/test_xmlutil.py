@@ -652,6 +652,51 @@ class TemplateTest(test.TestCase):
                          str(obj['test']['image']['id']))
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
+    def _make_merged_template(self):
+        root = xmlutil.TemplateElement('test', selector='test',
+                                       name='name', status='status')
+        value = xmlutil.SubTemplateElement(root, 'value', selector='values')
+        value.text = xmlutil.Selector()
+        xmlutil.SubTemplateElement(root, 'image', selector='image', id='id')
+        master = xmlutil.MasterTemplate(root, 1, nsmap=dict(f='foo'))
+
+        # The slave overrides an attribute and adds to a child
+        root_slave = xmlutil.TemplateElement('test', selector='test',
+                                             name='other', extra='extra')
+        image = xmlutil.SubTemplateElement(root_slave, 'image',
+                                           selector='image')
+        image.text = xmlutil.Selector('name')
+        xmlutil.SubTemplateElement(root_slave, 'fault', selector='fault')
+        master.attach(xmlutil.SlaveTemplate(root_slave, 1,
+                                            nsmap=dict(b='bar')))
+        return master
+
+    def test_serialize_compiled(self):
+        obj = {'test': {'name': 'foobar', 'other': 'other', 'extra': 'x',
+                        'values': [1, 2, 3],
+                        'image': {'name': 'image_foobar', 'id': 42}}}
+        master = self._make_merged_template()
+
+        expected = etree.tostring(master._serialize(None, obj,
+                                                    master._siblings(),
+                                                    master._nsmap()),
+                                  encoding='UTF-8', xml_declaration=True)
+        self.assertEqual(master.serialize(obj), expected)
+
+    def test_compile_cached(self):
+        obj = {'test': {'name': 'foobar', 'status': 'ACTIVE'}}
+        master = self._make_merged_template()
+        siblings = master._siblings()
+
+        compiled = siblings[0].compile(siblings[1:])
+        self.assertTrue(siblings[0].compile(siblings[1:]) is compiled)
+        self.assertEqual(master.make_tree(obj).get('status'), 'ACTIVE')
+
+        # Changing a compiled element compiles the template again
+        siblings[1].set('status', 'name')
+        self.assertFalse(siblings[0].compile(siblings[1:]) is compiled)
+        self.assertEqual(master.make_tree(obj).get('status'), 'foobar')
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
@@ -17,6 +17,7 @@ import __builtin__
 
 import functools
 import mox
+import os
 import StringIO
 
 from nova.compute import power_state
@@ -25,6 +26,7 @@ from nova import flags
 from nova.openstack.common import jsonutils
 from nova import test
 from nova.tests import fake_utils
+from nova import utils
 
 from nova.virt.baremetal import dom
 from nova.virt.baremetal import driver
@@ -108,7 +110,9 @@ class DomainReadWriteTestCase(test.TestCase):
                "name": "instance-00000001", "memory_kb": 16777216,
                "mac_address": "02:16:3e:01:4e:c9", "kernel_id": "1896115634",
                "ramdisk_id": "", "ip_address": "10.5.1.2"}]'''
-        open('/tftpboot/test_fake_dom_file', 'w').AndReturn(mock_file)
+        self.mox.StubOutWithMock(os, 'fsync')
+        self.mox.StubOutWithMock(os, 'rename')
+        open('/tftpboot/test_fake_dom_file.tmp', 'w').AndReturn(mock_file)
 
         # Check if the argument to file.write() represents the same
         # Python object as expected_json
@@ -116,7 +120,12 @@ class DomainReadWriteTestCase(test.TestCase):
         # because of ordering and whitespace
         mock_file.write(mox.Func(functools.partial(self.assertJSONEquals,
                                                    expected_json)))
+        mock_file.flush()
+        mock_file.fileno().AndReturn(3)
+        os.fsync(3)
         mock_file.close()
+        os.rename('/tftpboot/test_fake_dom_file.tmp',
+                  '/tftpboot/test_fake_dom_file')
 
         self.mox.ReplayAll()
 
@@ -187,17 +196,17 @@ class BareMetalDomTestCase(test.TestCase):
         # Create the mock objects
         self.mox.StubOutWithMock(dom, 'read_domains')
         self.mox.StubOutWithMock(dom, 'write_domains')
+        running_domains = [dict(node_id=2, name='i-00000002',
+                                status=power_state.RUNNING)]
         dom.read_domains('/tftpboot/test_fake_dom_file').AndReturn(domains)
-        dom.write_domains('/tftpboot/test_fake_dom_file', domains)
+        dom.write_domains('/tftpboot/test_fake_dom_file', running_domains)
 
         self.mox.ReplayAll()
 
         # Code under test
         bmdom = dom.BareMetalDom()
 
-        self.assertEqual(bmdom.domains, [{'node_id': 2,
-                                          'name': 'i-00000002',
-                                          'status': power_state.RUNNING}])
+        self.assertEqual(bmdom.domains, running_domains)
         self.assertEqual(bmdom.fake_dom_nums, 1)
 
     def test_find_domain(self):
@@ -225,6 +234,44 @@ class BareMetalDomTestCase(test.TestCase):
         # Expected values
         self.assertEquals(bmdom.find_domain('instance-00000001'), domain)
 
+    def test_changes_are_journaled_and_recovered(self):
+        with utils.tempdir() as tmpdir:
+            dom_file = os.path.join(tmpdir, 'dom_file')
+            dom.write_domains(dom_file, fake_domains)
+
+            bmdom = dom.BareMetalDom(fake_dom_file=dom_file)
+            bmdom.change_domain_state('instance-00000001',
+                                      power_state.RUNNING)
+            self.assertEqual(len(dom.read_journal(dom_file + '.journal')), 1)
+
+            # Simulate a crash part way through appending a record
+            with open(dom_file + '.journal', 'a') as f:
+                f.write('{"name": "instance-0')
+
+            dom.BareMetalDom._instance = None
+            dom.BareMetalDom._is_init = False
+            bmdom = dom.BareMetalDom(fake_dom_file=dom_file)
+            self.assertEqual(bmdom.list_domains(), ['instance-00000001'])
+            self.assertFalse(os.path.exists(dom_file + '.journal'))
+            self.assertEqual(dom.read_domains(dom_file), bmdom.domains)
+
+    def test_journal_is_compacted(self):
+        self.flags(baremetal_dom_journal_size=2)
+        with utils.tempdir() as tmpdir:
+            dom_file = os.path.join(tmpdir, 'dom_file')
+            dom.write_domains(dom_file, fake_domains)
+
+            bmdom = dom.BareMetalDom(fake_dom_file=dom_file)
+            for i in xrange(2):
+                bmdom.change_domain_state('instance-00000001',
+                                          power_state.RUNNING)
+            self.assertTrue(os.path.exists(dom_file + '.journal'))
+            bmdom.change_domain_state('instance-00000001',
+                                      power_state.SHUTDOWN)
+            self.assertFalse(os.path.exists(dom_file + '.journal'))
+            self.assertEqual(dom.read_domains(dom_file)[0]['status'],
+                             power_state.SHUTDOWN)
+
 
 class BareMetalTestCase(test.TestCase):
 
@@ -800,6 +800,20 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(output, 'ANOTHER\nLAST LINE')
         self.compute.terminate_instance(self.context, instance['uuid'])
 
+    def test_console_output_range(self):
+        """Make sure we can follow console output from an offset"""
+        self.flags(console_output_max_bytes=10)
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance['uuid'])
+
+        result = self.compute.get_console_output_range(self.context,
+                instance=instance, tail_length=1)
+        self.assertEqual(result, {'output': 'LAST LINE', 'offset': 37})
+        result = self.compute.get_console_output_range(self.context,
+                instance=instance, offset=20)
+        self.assertEqual(result, {'output': 'ANOTHER\nLA', 'offset': 30})
+        self.compute.terminate_instance(self.context, instance['uuid'])
+
     def test_novnc_vnc_console(self):
         """Make sure we can a vnc console for an instance."""
         instance = self._create_fake_instance()
@@ -1825,7 +1839,6 @@ class ComputeTestCase(BaseTestCase):
                                                     'nothertest=blat'])
         self.mox.StubOutWithMock(self.compute.driver, 'get_host_stats')
         self.compute.driver.get_host_stats(refresh=True).AndReturn(test_caps)
-        self.compute._last_host_check = 0
         self.mox.ReplayAll()
 
         self.compute._report_driver_status(context.get_admin_context())
@@ -1896,7 +1909,8 @@ class ComputeTestCase(BaseTestCase):
 
     def test_heal_instance_info_cache(self):
         # Update on every call for the test
-        self.flags(heal_instance_info_cache_interval=-1)
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=1)
         ctxt = context.get_admin_context()
 
         instance_map = {}
@@ -1919,21 +1933,20 @@ class ComputeTestCase(BaseTestCase):
             call_info['get_by_uuid'] += 1
             return instance_map[instance_uuid]
 
-        # NOTE(comstud): Override the stub in setUp()
-        def fake_get_instance_nw_info(context, instance):
+        def fake_get_instances_nw_info(context, instances):
             # Note that this exception gets caught in compute/manager
             # and is ignored.  However, the below increment of
             # 'get_nw_info' won't happen, and you'll get an assert
             # failure checking it below.
-            self.assertEqual(instance, call_info['expected_instance'])
+            self.assertEqual(instances, [call_info['expected_instance']])
             call_info['get_nw_info'] += 1
 
         self.stubs.Set(db, 'instance_get_all_by_host',
                 fake_instance_get_all_by_host)
         self.stubs.Set(db, 'instance_get_by_uuid',
                 fake_instance_get_by_uuid)
-        self.stubs.Set(self.compute.network_api, 'get_instance_nw_info',
-                fake_get_instance_nw_info)
+        self.stubs.Set(self.compute.network_api, 'get_instances_nw_info',
+                fake_get_instances_nw_info)
 
         call_info['expected_instance'] = instances[0]
         self.compute._heal_instance_info_cache(ctxt)
@@ -1970,6 +1983,39 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(call_info['get_by_uuid'], 3)
         self.assertEqual(call_info['get_nw_info'], 4)
 
+    def test_heal_instance_info_cache_batch(self):
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=3)
+        ctxt = context.get_admin_context()
+        instances = [{'uuid': 'fake-uuid-%s' % x, 'host': FLAGS.host}
+                     for x in xrange(5)]
+        instance_map = dict((instance['uuid'], instance)
+                            for instance in instances)
+        healed = []
+
+        def fake_instance_get_all_by_host(context, host):
+            return instances[:]
+
+        def fake_instance_get_by_uuid(context, instance_uuid):
+            return instance_map[instance_uuid]
+
+        def fake_get_instances_nw_info(context, instances):
+            healed.append([instance['uuid'] for instance in instances])
+
+        self.stubs.Set(db, 'instance_get_all_by_host',
+                fake_instance_get_all_by_host)
+        self.stubs.Set(db, 'instance_get_by_uuid',
+                fake_instance_get_by_uuid)
+        self.stubs.Set(self.compute.network_api, 'get_instances_nw_info',
+                fake_get_instances_nw_info)
+
+        for i in xrange(3):
+            self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(healed,
+                         [['fake-uuid-0', 'fake-uuid-1', 'fake-uuid-2'],
+                          ['fake-uuid-3', 'fake-uuid-4'],
+                          ['fake-uuid-0', 'fake-uuid-1', 'fake-uuid-2']])
+
     def test_poll_unconfirmed_resizes(self):
         instances = [{'uuid': 'fake_uuid1', 'vm_state': vm_states.RESIZED,
                       'task_state': None},
@@ -2179,6 +2225,36 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(instance['task_state'], None)
         return instance, instance_uuid
 
+    def test_create_db_entries_for_new_instances(self):
+        inst_type = instance_types.get_default_instance_type()
+        base_options = {'instance_type_id': inst_type['id'],
+                        'user_id': self.user_id,
+                        'project_id': self.project_id,
+                        'image_ref': 1,
+                        'display_name': None}
+
+        instances = self.compute_api.create_db_entries_for_new_instances(
+                self.context, inst_type, self.fake_image, base_options,
+                None, [], None, ['host1', 'host2'])
+
+        self.assertEqual(len(instances), 2)
+        self.assertFalse('uuid' in base_options)
+        self.assertEqual(base_options['vm_state'], vm_states.BUILDING)
+        for launch_index, instance in enumerate(instances):
+            instance = db.instance_get_by_uuid(self.context,
+                                               instance['uuid'])
+            self.assertEqual(instance['host'], 'host%d' % (launch_index + 1))
+            self.assertEqual(instance['launch_index'], launch_index)
+            self.assertEqual(instance['display_name'],
+                             'Server %s' % instance['uuid'])
+            self.assertEqual(instance['vm_state'], vm_states.BUILDING)
+            self.assertEqual(instance['task_state'], task_states.SCHEDULING)
+            self.assertEqual(
+                    [group['name'] for group in instance['security_groups']],
+                    ['default'])
+            self.assertNotEqual(instance['scheduled_at'], None)
+            db.instance_destroy(self.context, instance['uuid'])
+
     def test_create_with_too_little_ram(self):
         """Test an instance type with too little memory"""
 
@@ -3449,6 +3525,53 @@ class ComputeAPITestCase(BaseTestCase):
 
         return bdm
 
+    def test_new_instances_block_device_mapping(self):
+        inst_type = dict(instance_types.get_default_instance_type(), swap=1)
+        image = copy.deepcopy(self.fake_image)
+        image['properties']['mappings'] = [
+                {'virtual': 'ami', 'device': 'sda1'},
+                {'virtual': 'swap', 'device': 'sdb2'},
+                {'virtual': 'swap', 'device': 'sdb1'},
+                {'virtual': 'ephemeral0', 'device': 'sdc1'}]
+        image['properties']['block_device_mapping'] = [
+                {'device_name': '/dev/sdb1', 'no_device': True}]
+        block_device_mapping = [
+                {'device_name': '/dev/sda1',
+                 'snapshot_id': '00000000-aaaa-bbbb-cccc-000000000000',
+                 'delete_on_termination': False},
+                {'device_name': '/dev/sdc1', 'virtual_name': 'NoDevice'},
+                {'device_name': '/dev/sdd1', 'virtual_name': 'swap'},
+                {'device_name': '/dev/sdd2', 'volume_id': 'fake'}]
+
+        def bdms(instance_uuid):
+            # NOTE: an update with delete_on_termination=None stores NULL
+            # where the bulk insert stores the column default, False.
+            return sorted(
+                    (bdm['device_name'], bool(bdm['delete_on_termination']),
+                     bdm['no_device'], bdm['virtual_name'], bdm['volume_id'],
+                     bdm['volume_size'], bdm['snapshot_id'])
+                    for bdm in db.block_device_mapping_get_all_by_instance(
+                            self.context, instance_uuid))
+
+        instance = self._create_fake_instance()
+        self.compute_api._populate_instance_for_bdm(self.context, instance,
+                inst_type, image, block_device_mapping)
+        base_options = {'instance_type_id': inst_type['id'],
+                        'user_id': self.user_id,
+                        'project_id': self.project_id,
+                        'image_ref': 1,
+                        'display_name': None}
+        instances = self.compute_api.create_db_entries_for_new_instances(
+                self.context, inst_type, image, base_options, None,
+                block_device_mapping, None, ['host1', 'host2'])
+
+        expected = bdms(instance['uuid'])
+        self.assertEqual(len(expected), 5)
+        for new_instance in instances:
+            self.assertEqual(bdms(new_instance['uuid']), expected)
+            db.instance_destroy(self.context, new_instance['uuid'])
+        db.instance_destroy(self.context, instance['uuid'])
+
     def test_update_block_device_mapping(self):
         swap_size = 1
         instance_type = {'swap': swap_size}
@@ -53,6 +53,7 @@ class ComputeRpcAPITestCase(test.TestCase):
             'check_can_live_migrate_destination',
             'check_can_live_migrate_source', 'confirm_resize',
             'detach_volume', 'finish_resize', 'get_console_output',
+            'get_console_output_range',
             'pause_instance', 'reboot_instance', 'suspend_instance',
             'unpause_instance'
         ]
@@ -172,6 +173,11 @@ class ComputeRpcAPITestCase(test.TestCase):
         self._test_compute_api('get_console_output', 'call',
                 instance=self.fake_instance, tail_length='tl', version='1.7')
 
+    def test_get_console_output_range(self):
+        self._test_compute_api('get_console_output_range', 'call',
+                instance=self.fake_instance, offset=10, tail_length='tl',
+                version='1.15')
+
     def test_get_console_pool_info(self):
         self._test_compute_api('get_console_pool_info', 'call',
                 console_type='type', host='host')
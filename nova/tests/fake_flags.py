@@ -22,10 +22,13 @@ FLAGS = flags.FLAGS
 
 flags.DECLARE('compute_scheduler_driver', 'nova.scheduler.multi')
 flags.DECLARE('fake_network', 'nova.network.manager')
+flags.DECLARE('glance_image_meta_cache_ttl', 'nova.image.glance')
+flags.DECLARE('instance_type_cache_ttl', 'nova.compute.instance_types')
 flags.DECLARE('iscsi_num_targets', 'nova.volume.driver')
 flags.DECLARE('network_size', 'nova.network.manager')
 flags.DECLARE('num_networks', 'nova.network.manager')
 flags.DECLARE('policy_file', 'nova.policy')
+flags.DECLARE('quota_limit_cache_ttl', 'nova.quota')
 flags.DECLARE('volume_driver', 'nova.volume.manager')
 
 
@@ -36,9 +39,12 @@ def set_defaults(conf):
     conf.set_default('fake_network', True)
     conf.set_default('fake_rabbit', True)
     conf.set_default('flat_network_bridge', 'br100')
+    conf.set_default('glance_image_meta_cache_ttl', 0)
+    conf.set_default('instance_type_cache_ttl', 0)
     conf.set_default('iscsi_num_targets', 8)
     conf.set_default('network_size', 8)
     conf.set_default('num_networks', 2)
+    conf.set_default('quota_limit_cache_ttl', 0)
     conf.set_default('rpc_backend', 'nova.openstack.common.rpc.impl_fake')
     conf.set_default('sql_connection', "sqlite://")
     conf.set_default('sqlite_synchronous', False)
@@ -17,6 +17,8 @@
 import os
 import StringIO
 
+from nova import utils
+
 
 files = {}
 disk_sizes = {}
@@ -110,6 +112,17 @@ def load_file(path):
         return ''
 
 
+def load_file_range(path, offset=None, tail_length=None, max_bytes=None):
+    if os.path.exists(path):
+        with open(path, 'r') as fp:
+            return utils.read_file_range(fp, os.fstat(fp.fileno()).st_size,
+                                         offset=offset,
+                                         tail_length=tail_length,
+                                         max_bytes=max_bytes)
+    else:
+        return '', 0
+
+
 def file_delete(path):
     return True
 
@@ -517,12 +517,17 @@ class TestGlanceClientWrapper(test.TestCase):
         super(TestGlanceClientWrapper, self).setUp()
         self.flags(glance_api_servers=['host1:9292', 'host2:9293',
             'host3:9294'])
+        glance._reset_api_server_failures()
 
         # Make the test run fast
         def _fake_sleep(secs):
             pass
         self.stubs.Set(time, 'sleep', _fake_sleep)
 
+    def tearDown(self):
+        glance._reset_api_server_failures()
+        super(TestGlanceClientWrapper, self).tearDown()
+
     def test_static_client_without_retries(self):
         self.flags(glance_num_retries=0)
 
@@ -654,3 +659,126 @@ class TestGlanceClientWrapper(test.TestCase):
 
         client2.call(ctxt, 'get_image', 'meow')
         self.assertEqual(info['num_calls'], 2)
+
+    def test_default_client_skips_failed_servers(self):
+        self.flags(glance_num_retries=1)
+
+        ctxt = context.RequestContext('fake', 'fake')
+
+        info = {'num_calls': 0,
+                'hosts': []}
+
+        # Leave the list in a known-order
+        def _fake_shuffle(servers):
+            pass
+
+        def _fake_create_glance_client(context, host, port):
+            info['hosts'].append(host)
+            return _create_failing_glance_client(info)
+
+        self.stubs.Set(random, 'shuffle', _fake_shuffle)
+        self.stubs.Set(glance, '_create_glance_client',
+                _fake_create_glance_client)
+
+        # host1 fails and host2 answers the retry
+        glance.GlanceClientWrapper().call(ctxt, 'get_image', 'meow')
+        self.assertEqual(info['hosts'], ['host1', 'host2'])
+
+        # host1 is skipped until glance_api_server_dead_time has passed
+        info.update(num_calls=1, hosts=[])
+        glance.GlanceClientWrapper().call(ctxt, 'get_image', 'meow')
+        self.assertEqual(info['hosts'], ['host2'])
+
+        self.flags(glance_api_server_dead_time=0)
+        info.update(num_calls=1, hosts=[])
+        glance.GlanceClientWrapper().call(ctxt, 'get_image', 'meow')
+        self.assertEqual(info['hosts'], ['host1'])
+
+
+class TestGlanceImageMetaCache(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceImageMetaCache, self).setUp()
+        self.flags(glance_image_meta_cache_ttl=30)
+        glance._image_meta_cache.clear()
+
+        self.client = glance_stubs.StubGlanceClient()
+        self.stubs.Set(glance, '_create_glance_client',
+                       lambda context, host, port: self.client)
+        self.service = glance.GlanceImageService(
+                client=glance.GlanceClientWrapper('fake', 'fake_host', 9292))
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token=True)
+        self.image_id = self.service.create(self.context,
+                {'name': 'image1', 'status': 'active',
+                 'is_public': True, 'properties': {}})['id']
+
+        self.calls = {'get_image_meta': 0}
+        orig_get_image_meta = self.client.get_image_meta
+
+        def _counting_get_image_meta(image_id):
+            self.calls['get_image_meta'] += 1
+            return orig_get_image_meta(image_id)
+        self.client.get_image_meta = _counting_get_image_meta
+
+    def tearDown(self):
+        glance._image_meta_cache.clear()
+        super(TestGlanceImageMetaCache, self).tearDown()
+
+    def test_show_is_cached(self):
+        for i in xrange(4):
+            image_meta = self.service.show(self.context, self.image_id)
+            self.assertEqual(image_meta['name'], 'image1')
+            image_meta['name'] = 'changed by caller'
+        self.assertEqual(self.calls['get_image_meta'], 1)
+        stats = glance.get_image_meta_cache_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.75)
+
+    def test_cache_is_per_context(self):
+        other_context = context.RequestContext('other', 'other',
+                                               auth_token='other-token')
+        self.service.show(self.context, self.image_id)
+        self.service.show(other_context, self.image_id)
+        self.assertEqual(self.calls['get_image_meta'], 2)
+
+    def test_inactive_images_are_not_cached(self):
+        self.client.images[0]['status'] = 'saving'
+        self.service.show(self.context, self.image_id)
+        self.service.show(self.context, self.image_id)
+        self.assertEqual(self.calls['get_image_meta'], 2)
+
+    def test_cache_expires(self):
+        self.service.show(self.context, self.image_id)
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now + 31)
+        self.service.show(self.context, self.image_id)
+        self.assertEqual(self.calls['get_image_meta'], 2)
+
+    def test_update_invalidates(self):
+        self.service.show(self.context, self.image_id)
+        self.service.update(self.context, self.image_id, {'name': 'new'})
+        image_meta = self.service.show(self.context, self.image_id)
+        self.assertEqual(image_meta['name'], 'new')
+        self.assertEqual(glance.get_image_meta_cache_stats()['invalidations'],
+                         1)
+
+    def test_delete_invalidates(self):
+        self.service.show(self.context, self.image_id)
+        self.service.delete(self.context, self.image_id)
+        self.assertRaises(exception.ImageNotFound, self.service.show,
+                          self.context, self.image_id)
+
+    def test_cache_is_bounded(self):
+        self.flags(glance_image_meta_cache_size=1)
+        image_id2 = self.service.create(self.context,
+                {'name': 'image2', 'status': 'active',
+                 'is_public': True, 'properties': {}})['id']
+        self.service.show(self.context, self.image_id)
+        self.service.show(self.context, image_id2)
+        self.service.show(self.context, self.image_id)
+        self.assertEqual(self.calls['get_image_meta'], 3)
+        stats = glance.get_image_meta_cache_stats()
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['images'], 1)
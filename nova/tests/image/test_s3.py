@@ -15,11 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import binascii
-import eventlet
-import mox
 import os
-import tempfile
+import StringIO
+import tarfile
+
+import Crypto.Cipher.AES
+import eventlet
 
 from nova import context
 import nova.db.api
@@ -66,18 +69,36 @@ ami_manifest_xml = """<?xml version="1.0" ?>
 file_manifest_xml = """<?xml version="1.0" ?>
 <manifest>
         <image>
-                <ec2_encrypted_key>foo</ec2_encrypted_key>
-                <user_encrypted_key>foo</user_encrypted_key>
-                <ec2_encrypted_iv>foo</ec2_encrypted_iv>
-                <parts count="1">
-                        <part index="0">
-                               <filename>foo</filename>
-                        </part>
+                <ec2_encrypted_key>%(key)s</ec2_encrypted_key>
+                <user_encrypted_key>%(key)s</user_encrypted_key>
+                <ec2_encrypted_iv>%(iv)s</ec2_encrypted_iv>
+                <parts count="%(count)d">
+%(parts)s
                 </parts>
         </image>
 </manifest>
 """
 
+part_xml = """                        <part index="%(index)d">
+                               <filename>my.img.part.%(index)d</filename>
+                        </part>"""
+
+
+class FakeKey(object):
+    def __init__(self, contents):
+        self.contents = contents
+
+    def get_contents_as_string(self):
+        return self.contents
+
+
+class FakeBucket(object):
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_key(self, name):
+        return FakeKey(self.keys[name])
+
 
 class TestS3ImageService(test.TestCase):
     def setUp(self):
@@ -158,39 +179,78 @@ class TestS3ImageService(test.TestCase):
              'no_device': True}]
         self.assertEqual(block_device_mapping, expected_bdm)
 
-    def test_s3_create_is_public(self):
+    def _make_bundle(self, files, num_parts=3):
+        """Tars, gzips and encrypts files the way ec2-bundle-image does."""
+        key = 'k' * 16
+        iv = 'i' * 16
+        tar_data = StringIO.StringIO()
+        tar_file = tarfile.open(mode='w:gz', fileobj=tar_data)
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar_file.addfile(info, StringIO.StringIO(data))
+        tar_file.close()
+
+        data = tar_data.getvalue()
+        padding = 16 - len(data) % 16
+        cipher = Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CBC, iv)
+        encrypted = cipher.encrypt(data + chr(padding) * padding)
+
+        part_size = len(encrypted) // num_parts + 1
+        keys = {}
+        for i in xrange(num_parts):
+            keys['my.img.part.%d' % i] = encrypted[i * part_size:
+                                                   (i + 1) * part_size]
+        # The cert service decrypts the hex key and iv from the manifest,
+        # these are not encrypted at all.
+        keys['my.img.manifest.xml'] = file_manifest_xml % {
+            'key': binascii.b2a_hex(binascii.b2a_hex(key)),
+            'iv': binascii.b2a_hex(binascii.b2a_hex(iv)),
+            'count': num_parts,
+            'parts': '\n'.join(part_xml % {'index': i}
+                               for i in xrange(num_parts))}
+        return FakeBucket(keys)
+
+    def _s3_create(self, bucket):
+        class FakeConnection(object):
+            def get_bucket(self, name):
+                return bucket
+
+        self.stubs.Set(self.image_service, '_conn',
+                       lambda context: FakeConnection())
+        self.stubs.Set(self.image_service.cert_rpcapi, 'decrypt_text',
+                       lambda context, project_id, text:
+                           base64.b64decode(text))
+        self.stubs.Set(eventlet, 'spawn_n',
+                       lambda func, *args, **kwargs: func(*args, **kwargs))
+
+        uploads = []
+        orig_update = self.image_service.service.update
+
+        def _update(context, image_id, metadata, data=None, headers=None):
+            if data is not None:
+                uploads.append(data.read())
+            return orig_update(context, image_id, metadata, data, headers)
+        self.stubs.Set(self.image_service.service, 'update', _update)
+
         metadata = {'properties': {
                     'image_location': 'mybucket/my.img.manifest.xml'},
                     'name': 'mybucket/my.img'}
-        handle, tempf = tempfile.mkstemp(dir='/tmp')
-
-        ignore = mox.IgnoreArg()
-        mockobj = self.mox.CreateMockAnything()
-        self.stubs.Set(self.image_service, '_conn', mockobj)
-        mockobj(ignore).AndReturn(mockobj)
-        self.stubs.Set(mockobj, 'get_bucket', mockobj)
-        mockobj(ignore).AndReturn(mockobj)
-        self.stubs.Set(mockobj, 'get_key', mockobj)
-        mockobj(ignore).AndReturn(mockobj)
-        self.stubs.Set(mockobj, 'get_contents_as_string', mockobj)
-        mockobj().AndReturn(file_manifest_xml)
-        self.stubs.Set(self.image_service, '_download_file', mockobj)
-        mockobj(ignore, ignore, ignore).AndReturn(tempf)
-        self.stubs.Set(binascii, 'a2b_hex', mockobj)
-        mockobj(ignore).AndReturn('foo')
-        mockobj(ignore).AndReturn('foo')
-        self.stubs.Set(self.image_service, '_decrypt_image', mockobj)
-        mockobj(ignore, ignore, ignore, ignore, ignore).AndReturn(mockobj)
-        self.stubs.Set(self.image_service, '_untarzip_image', mockobj)
-        mockobj(ignore, ignore).AndReturn(tempf)
-        self.mox.ReplayAll()
-
         img = self.image_service._s3_create(self.context, metadata)
-        eventlet.sleep()
-        translated = self.image_service._translate_id_to_uuid(context, img)
-        uuid = translated['id']
+        translated = self.image_service._translate_id_to_uuid(self.context,
+                                                              img)
+        image_uuid = translated['id']
+        image = fake.FakeImageService().show(self.context, image_uuid)
+        return image_uuid, image, uploads
+
+    def test_s3_create_is_public(self):
+        image_data = ''.join(chr(i % 256) for i in xrange(100000))
+        bucket = self._make_bundle([('my.img', image_data)])
+        image_uuid, image, uploads = self._s3_create(bucket)
+        self.assertEqual(uploads, [image_data])
+
         image_service = fake.FakeImageService()
-        updated_image = image_service.update(self.context, uuid,
+        updated_image = image_service.update(self.context, image_uuid,
                         {'is_public': True}, None,
                         {'x-glance-registry-purge-props': False})
         self.assertTrue(updated_image['is_public'])
@@ -198,10 +258,38 @@ class TestS3ImageService(test.TestCase):
         self.assertEqual(updated_image['properties']['image_state'],
                           'available')
 
+    def test_s3_create_failed_download(self):
+        bucket = self._make_bundle([('my.img', 'image data')])
+        del bucket.keys['my.img.part.1']
+        image_uuid, image, uploads = self._s3_create(bucket)
+        self.assertEqual(image['properties']['image_state'],
+                         'failed_download')
+
+    def test_s3_create_failed_decrypt(self):
+        bucket = self._make_bundle([('my.img', 'image data')])
+        bucket.keys['my.img.part.2'] = bucket.keys['my.img.part.2'][:-1]
+        image_uuid, image, uploads = self._s3_create(bucket)
+        self.assertEqual(image['properties']['image_state'],
+                         'failed_decrypt')
+
+    def test_s3_create_malicious_tarball(self):
+        bucket = self._make_bundle([('my.img', 'image data'),
+                                    ('../../etc/passwd', 'root')])
+        image_uuid, image, uploads = self._s3_create(bucket)
+        self.assertEqual(image['properties']['image_state'], 'failed_untar')
+        self.assertNotEqual(image['status'], 'active')
+
     def test_s3_malicious_tarballs(self):
-        self.assertRaises(exception.NovaException,
-            self.image_service._test_for_malicious_tarball,
-            "/unused", os.path.join(os.path.dirname(__file__), 'abs.tar.gz'))
-        self.assertRaises(exception.NovaException,
-            self.image_service._test_for_malicious_tarball,
-            "/unused", os.path.join(os.path.dirname(__file__), 'rel.tar.gz'))
+        for name in ('abs.tar.gz', 'rel.tar.gz'):
+            tar_file = tarfile.open(os.path.join(os.path.dirname(__file__),
+                                                 name), 'r|gz')
+            self.assertRaises(exception.NovaException, list,
+                self.image_service._test_for_malicious_tarball("/unused",
+                                                               tar_file))
+
+    def test_chunk_reader(self):
+        reader = s3.ChunkReader(['abc', '', 'defg', 'h'])
+        self.assertEqual(reader.read(2), 'ab')
+        self.assertEqual(reader.read(4), 'cdef')
+        self.assertEqual(reader.read(), 'gh')
+        self.assertEqual(reader.read(1), '')
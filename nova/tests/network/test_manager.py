@@ -22,10 +22,13 @@ import tempfile
 
 from nova import context
 from nova import db
+from nova.db import instrumentation
 from nova import exception
+from nova.network import api as network_api
 from nova.network import linux_net
 from nova.network import manager as network_manager
 from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 import nova.policy
@@ -1652,6 +1655,95 @@ class FloatingIPTestCase(test.TestCase):
         self.network.delete_dns_domain(context_admin, domain2)
 
 
+class InstancesNetworkInfoTestCase(test.TestCase):
+    """Tests the bulk get_instances_nw_info against the DB"""
+    def setUp(self):
+        super(InstancesNetworkInfoTestCase, self).setUp()
+        self.network = network_manager.FlatManager(host=HOST)
+        self.network.db = db
+        self.context = context.get_admin_context()
+        self.net = db.network_create_safe(self.context,
+                {'cidr': '192.168.0.0/24', 'netmask': '255.255.255.0',
+                 'gateway': '192.168.0.1', 'broadcast': '192.168.0.255',
+                 'dns1': '192.168.0.2', 'cidr_v6': 'fd00::/64',
+                 'gateway_v6': 'fd00::1', 'netmask_v6': '64',
+                 'bridge': 'br100', 'label': 'test'})
+        self.instances = [self._create_instance(i) for i in xrange(3)]
+
+    def tearDown(self):
+        instrumentation.reset_stats()
+        super(InstancesNetworkInfoTestCase, self).tearDown()
+
+    def _create_instance(self, i):
+        instance = db.instance_create(self.context,
+                                      {'host': HOST, 'instance_type_id': 1})
+        vif = db.virtual_interface_create(self.context,
+                {'address': 'de:ad:be:ef:00:%02x' % i,
+                 'instance_id': instance['id'],
+                 'network_id': self.net['id'],
+                 'uuid': str(utils.gen_uuid())})
+        address = db.fixed_ip_create(self.context,
+                {'address': '192.168.0.%d' % (10 + i),
+                 'network_id': self.net['id'],
+                 'virtual_interface_id': vif['id'],
+                 'instance_uuid': instance['uuid'],
+                 'allocated': True})
+        if i:
+            fixed_ip = db.fixed_ip_get_by_address(self.context, address)
+            db.floating_ip_create(self.context,
+                                  {'address': '10.0.0.%d' % i,
+                                   'fixed_ip_id': fixed_ip['id']})
+        return {'instance_id': instance['id'],
+                'instance_uuid': instance['uuid'],
+                'rxtx_factor': 1.0, 'host': HOST, 'project_id': None}
+
+    def test_same_as_get_instance_nw_info(self):
+        nw_infos = self.network.get_instances_nw_info(self.context,
+                                                      self.instances)
+        self.assertEqual(len(nw_infos), 3)
+        for instance in self.instances:
+            nw_info = self.network.get_instance_nw_info(self.context,
+                                                        **instance)
+            self.assertEqual(nw_infos[instance['instance_uuid']], nw_info)
+        floating_ips = nw_infos[self.instances[1]['instance_uuid']].\
+                floating_ips()
+        self.assertEqual([ip['address'] for ip in floating_ips],
+                         ['10.0.0.1'])
+
+    def test_constant_queries(self):
+        self.flags(db_call_stats=True)
+        instrumentation.reset_stats()
+        self.network.get_instances_nw_info(self.context, self.instances)
+        stats = instrumentation.get_stats()
+        self.assertEqual(sum(stat['calls'] for stat in stats.values()), 4)
+
+    def test_instance_without_vifs(self):
+        instance = db.instance_create(self.context, {'host': HOST})
+        nw_infos = self.network.get_instances_nw_info(self.context,
+                [{'instance_id': instance['id'],
+                  'instance_uuid': instance['uuid'],
+                  'rxtx_factor': 1.0, 'host': HOST}])
+        self.assertEqual(nw_infos, {instance['uuid']: []})
+
+    def test_api_updates_info_caches(self):
+        def fake_rpc_call(context, topic, msg):
+            self.assertEqual(msg['method'], 'get_instances_nw_info')
+            result = self.network.get_instances_nw_info(context,
+                                                        **msg['args'])
+            return jsonutils.to_primitive(result)
+
+        self.stubs.Set(rpc, 'call', fake_rpc_call)
+        instances = [db.instance_get(self.context, instance['instance_id'])
+                     for instance in self.instances]
+        nw_infos = network_api.API().get_instances_nw_info(self.context,
+                                                            instances)
+        for instance in instances:
+            cache = db.instance_info_cache_get(self.context,
+                                               instance['uuid'])
+            self.assertEqual(jsonutils.loads(cache['network_info']),
+                             nw_infos[instance['uuid']])
+
+
 class NetworkPolicyTestCase(test.TestCase):
     def setUp(self):
         super(NetworkPolicyTestCase, self).setUp()
@@ -0,0 +1,136 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import shutil
+import tempfile
+
+from nova import exception
+from nova.network import minidns
+from nova import test
+
+
+class MiniDNSTestCase(test.TestCase):
+    def setUp(self):
+        super(MiniDNSTestCase, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.flags(logdir=self.tempdir, lock_path=self.tempdir)
+        self.driver = minidns.MiniDNS()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(MiniDNSTestCase, self).tearDown()
+
+    def _read_file(self):
+        with open(self.driver.filename) as dnsfile:
+            return [line.split() for line in dnsfile if line.split()]
+
+    def test_create_and_get_entries(self):
+        self.driver.create_domain('example.org')
+        self.driver.create_entry('a', '10.0.0.1', 'A', 'example.org')
+        self.driver.create_entry('b', '10.0.0.1', 'A', 'example.org')
+        self.driver.create_entry('c', '10.0.0.2', 'A', 'example.org')
+        self.assertEqual(self.driver.get_domains(), ['example.org'])
+        self.assertEqual(self.driver.get_entries_by_name('A', 'example.org'),
+                         ['10.0.0.1'])
+        self.assertEqual(
+                self.driver.get_entries_by_address('10.0.0.1', 'example.org'),
+                ['a', 'b'])
+        self.assertEqual(self._read_file(),
+                         [['#', 'minidns'],
+                          ['domain', 'example.org', 'domain'],
+                          ['10.0.0.1', 'a.example.org', 'A'],
+                          ['10.0.0.1', 'b.example.org', 'A'],
+                          ['10.0.0.2', 'c.example.org', 'A']])
+
+    def test_create_existing(self):
+        self.driver.create_domain('example.org')
+        self.driver.create_entry('a', '10.0.0.1', 'A', 'example.org')
+        self.assertRaises(exception.FloatingIpDNSExists,
+                          self.driver.create_entry,
+                          'a', '10.0.0.2', 'A', 'example.org')
+        self.assertRaises(exception.FloatingIpDNSExists,
+                          self.driver.create_domain, 'example.org')
+        self.assertRaises(exception.InvalidInput,
+                          self.driver.create_entry,
+                          'b', '10.0.0.2', 'CNAME', 'example.org')
+
+    def test_delete_and_modify(self):
+        self.driver.create_entry('a', '10.0.0.1', 'A', 'example.org')
+        self.driver.create_entry('b', '10.0.0.2', 'A', 'example.org')
+        self.driver.create_entry('c', '10.0.0.3', 'A', 'example.org')
+        self.driver.delete_entry('b', 'example.org')
+        self.driver.modify_address('a', '10.0.0.4', 'example.org')
+        self.assertEqual(self.driver.get_entries_by_name('b', 'example.org'),
+                         [])
+        self.assertEqual(
+                self.driver.get_entries_by_address('10.0.0.4', 'example.org'),
+                ['a'])
+        self.assertEqual(self._read_file(),
+                         [['#', 'minidns'],
+                          ['10.0.0.4', 'a.example.org', 'A'],
+                          ['10.0.0.3', 'c.example.org', 'A']])
+        self.assertRaises(exception.NotFound,
+                          self.driver.delete_entry, 'b', 'example.org')
+        self.assertRaises(exception.NotFound, self.driver.modify_address,
+                          'b', '10.0.0.5', 'example.org')
+
+    def test_delete_domain(self):
+        self.driver.create_domain('example.org')
+        self.driver.create_domain('example.com')
+        self.driver.create_entry('a', '10.0.0.1', 'A', 'example.org')
+        self.driver.create_entry('a', '10.0.0.1', 'A', 'example.com')
+        self.driver.delete_domain('example.org')
+        self.assertEqual(self.driver.get_domains(), ['example.com'])
+        self.assertEqual(
+                self.driver.get_entries_by_address('10.0.0.1', 'example.com'),
+                ['a'])
+        self.assertEqual(
+                self.driver.get_entries_by_address('10.0.0.1', 'example.org'),
+                [])
+        self.assertRaises(exception.NotFound,
+                          self.driver.delete_domain, 'example.org')
+
+    def test_reads_existing_file(self):
+        with open(self.driver.filename, 'a') as dnsfile:
+            dnsfile.write('domain   example.org   domain\n'
+                          '10.0.0.1   a.example.org   A\n')
+        driver = minidns.MiniDNS()
+        self.assertEqual(driver.get_domains(), ['example.org'])
+        self.assertEqual(driver.get_entries_by_name('a', 'example.org'),
+                         ['10.0.0.1'])
+
+    def test_sees_changes_of_other_drivers(self):
+        other = minidns.MiniDNS()
+        self.assertEqual(self.driver.get_domains(), [])
+        other.create_entry('a', '10.0.0.1', 'A', 'example.org')
+        self.assertEqual(self.driver.get_entries_by_name('a', 'example.org'),
+                         ['10.0.0.1'])
+        other.modify_address('a', '10.0.0.2', 'example.org')
+        self.assertEqual(self.driver.get_entries_by_name('a', 'example.org'),
+                         ['10.0.0.2'])
+        other.delete_entry('a', 'example.org')
+        self.assertEqual(self.driver.get_entries_by_name('a', 'example.org'),
+                         [])
+
+    def test_ignores_incomplete_line(self):
+        self.assertEqual(self.driver.get_domains(), [])
+        with open(self.driver.filename, 'a') as dnsfile:
+            dnsfile.write('domain   example.org')
+        self.assertEqual(self.driver.get_domains(), [])
+        with open(self.driver.filename, 'a') as dnsfile:
+            dnsfile.write('   domain\n')
+        self.assertEqual(self.driver.get_domains(), ['example.org'])
@@ -125,6 +125,9 @@ class FakeComputeAPI(object):
     def create_db_entry_for_new_instance(self, *args, **kwargs):
         pass
 
+    def create_db_entries_for_new_instances(self, *args, **kwargs):
+        pass
+
 
 def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
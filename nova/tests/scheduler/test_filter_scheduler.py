@@ -20,6 +20,7 @@ import mox
 
 from nova import context
 from nova import exception
+from nova.scheduler import driver
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
 from nova.scheduler import least_cost
@@ -88,18 +89,20 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         instance_opts = {'fake_opt1': 'meow'}
         request_spec = {'num_instances': 2,
                         'instance_properties': instance_opts}
-        instance1 = {'uuid': 'fake-uuid1'}
-        instance2 = {'uuid': 'fake-uuid2'}
-
-        def _has_launch_index(expected_index):
+        instance1 = {'id': 1, 'uuid': 'fake-uuid1'}
+        instance2 = {'id': 2, 'uuid': 'fake-uuid2'}
+        weighted_hosts = [
+            least_cost.WeightedHost(1,
+                    host_state=fakes.FakeHostState('host1', 'compute', {})),
+            least_cost.WeightedHost(2,
+                    host_state=fakes.FakeHostState('host2', 'compute', {}))]
+
+        def _has_launch_index(expected_index, expected_uuid):
             """Return a function that verifies the expected index."""
             def _check_launch_index(value):
-                if 'instance_properties' in value:
-                    if 'launch_index' in value['instance_properties']:
-                        index = value['instance_properties']['launch_index']
-                        if index == expected_index:
-                            return True
-                return False
+                props = value.get('instance_properties', {})
+                return (props.get('launch_index') == expected_index and
+                        props.get('uuid') == expected_uuid)
             return _check_launch_index
 
         class ContextFake(object):
@@ -108,25 +111,31 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         context_fake = ContextFake()
 
         self.mox.StubOutWithMock(self.driver, '_schedule')
-        self.mox.StubOutWithMock(self.driver, '_provision_resource')
+        self.mox.StubOutWithMock(self.driver, 'create_instance_db_entries')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_host')
 
         self.driver._schedule(context_fake, 'compute',
                               request_spec, {}, **fake_kwargs
-                              ).AndReturn(['host1', 'host2'])
-        # instance 1
-        self.driver._provision_resource(
-            ctxt, 'host1',
-            mox.Func(_has_launch_index(0)), None,
-            {}, fake_kwargs).AndReturn(instance1)
-        # instance 2
-        self.driver._provision_resource(
-            ctxt, 'host2',
-            mox.Func(_has_launch_index(1)), None,
-            {}, fake_kwargs).AndReturn(instance2)
+                              ).AndReturn(weighted_hosts)
+        # Both instances are created at once
+        self.driver.create_instance_db_entries(ctxt, request_spec, None,
+                ['host1', 'host2']).AndReturn([instance1, instance2])
+        driver.cast_to_compute_host(ctxt, 'host1', 'run_instance',
+                update_db=False, instance_uuid='fake-uuid1',
+                request_spec=mox.Func(_has_launch_index(0, 'fake-uuid1')),
+                filter_properties={}, **fake_kwargs)
+        driver.cast_to_compute_host(ctxt, 'host2', 'run_instance',
+                update_db=False, instance_uuid='fake-uuid2',
+                request_spec=mox.Func(_has_launch_index(1, 'fake-uuid2')),
+                filter_properties={}, **fake_kwargs)
         self.mox.ReplayAll()
 
-        self.driver.schedule_run_instance(context_fake, request_spec, None,
-                                          **fake_kwargs)
+        instances = self.driver.schedule_run_instance(context_fake,
+                request_spec, None, **fake_kwargs)
+        self.assertEqual(instances,
+                         [dict(id=1, _is_precooked=False),
+                          dict(id=2, _is_precooked=False)])
+        self.assertFalse('uuid' in instance_opts)
 
     def test_schedule_happy_day(self):
         """Make sure there's nothing glaringly wrong with _schedule()
@@ -19,6 +19,12 @@
 Tests For Scheduler
 """
 
+import datetime
+import random
+import time
+
+import mox
+
 from nova.compute import api as compute_api
 from nova.compute import power_state
 from nova.compute import rpcapi as compute_rpcapi
@@ -62,6 +68,10 @@ class SchedulerManagerTestCase(test.TestCase):
         self.fake_args = (1, 2, 3)
         self.fake_kwargs = {'cat': 'meow', 'dog': 'woof'}
 
+    def tearDown(self):
+        timeutils.clear_time_override()
+        super(SchedulerManagerTestCase, self).tearDown()
+
     def test_1_correct_init(self):
         # Correct scheduler driver
         manager = self.manager
@@ -289,6 +299,35 @@ class SchedulerManagerTestCase(test.TestCase):
                          self.context, self.topic,
                          *self.fake_args, **self.fake_kwargs)
 
+    def test_archive_deleted_rows(self):
+        calls = []
+
+        def fake_archive_deleted_rows(context, max_rows=None,
+                                      older_than=None):
+            calls.append((max_rows, older_than))
+            return {'instances': 2, 'instance_metadata': 3}
+
+        self.stubs.Set(db, 'archive_deleted_rows', fake_archive_deleted_rows)
+        self.now = 1000.0
+        self.stubs.Set(time, 'time', lambda: self.now)
+        self.stubs.Set(random, 'uniform', lambda a, b: b / 2)
+        self.manager._periodic_tasks = [
+                (name, task) for name, task in self.manager._periodic_tasks
+                if name == '_archive_deleted_rows']
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(calls, [])
+
+        self.flags(archive_deleted_rows_interval=3600,
+                   archive_deleted_rows_age=30,
+                   archive_deleted_rows_max_rows=100)
+        timeutils.set_time_override()
+        older_than = timeutils.utcnow() - datetime.timedelta(days=30)
+        # The first run comes after a random part of the interval
+        for now in (1000, 2799, 2800, 6399, 6400):
+            self.now = now
+            self.manager.periodic_tasks(self.context)
+        self.assertEqual(calls, [(100, older_than), (100, older_than)])
+
 
 class SchedulerTestCase(test.TestCase):
     """Test case for base scheduler driver class"""
@@ -376,6 +415,50 @@ class SchedulerTestCase(test.TestCase):
                 request_spec, None)
         self.assertEqual(instance, fake_instance)
 
+    def test_create_instance_db_entries(self):
+        base_options = {'fake_option': 'meow'}
+        image = 'fake_image'
+        instance_type = 'fake_instance_type'
+        security_group = 'fake_security_group'
+        block_device_mapping = 'fake_block_device_mapping'
+        request_spec = {'instance_properties': base_options,
+                        'image': image,
+                        'instance_type': instance_type,
+                        'security_group': security_group,
+                        'block_device_mapping': block_device_mapping}
+        hosts = ['host1', 'host2']
+
+        self.mox.StubOutWithMock(self.driver.compute_api,
+                'create_db_entries_for_new_instances')
+        self.mox.StubOutWithMock(db, 'instance_update')
+
+        # New entries
+        fake_instances = [{'uuid': 'fake-uuid1'}, {'uuid': 'fake-uuid2'}]
+        self.driver.compute_api.create_db_entries_for_new_instances(
+                self.context, instance_type, image, base_options,
+                security_group, block_device_mapping, None,
+                hosts).AndReturn(fake_instances)
+        self.mox.ReplayAll()
+        instances = self.driver.create_instance_db_entries(self.context,
+                request_spec, None, hosts)
+        self.mox.VerifyAll()
+        self.assertEqual(instances, fake_instances)
+
+        # Entry created by compute already, it only needs its host
+        self.mox.ResetAll()
+
+        fake_uuid = 'fake-uuid'
+        base_options['uuid'] = fake_uuid
+        fake_instance = {'uuid': fake_uuid}
+        db.instance_update(self.context, fake_uuid,
+                mox.ContainsKeyValue('host', 'host1')).AndReturn(
+                fake_instance)
+
+        self.mox.ReplayAll()
+        instances = self.driver.create_instance_db_entries(self.context,
+                request_spec, None, ['host1'])
+        self.assertEqual(instances, [fake_instance])
+
     def _live_migration_instance(self):
         volume1 = {'id': 31338}
         volume2 = {'id': 31339}
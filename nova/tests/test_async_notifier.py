@@ -0,0 +1,96 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the asynchronous notification driver."""
+
+import os
+
+import eventlet
+
+from nova import context
+from nova.openstack.common.notifier import api as notifier_api
+from nova.openstack.common.notifier import async_notifier
+from nova.openstack.common.notifier import test_notifier
+from nova import test
+from nova import utils
+
+
+class AsyncNotifierTestCase(test.TestCase):
+
+    def setUp(self):
+        super(AsyncNotifierTestCase, self).setUp()
+        self.flags(
+            notification_driver='nova.openstack.common.notifier.'
+                                'async_notifier',
+            async_notifier_driver='nova.openstack.common.notifier.'
+                                  'test_notifier')
+        self.context = context.get_admin_context()
+        test_notifier.NOTIFICATIONS = []
+        async_notifier._reset()
+
+    def tearDown(self):
+        async_notifier._reset()
+        super(AsyncNotifierTestCase, self).tearDown()
+
+    def _notify(self, event_type):
+        notifier_api.notify(self.context, 'compute.host1', event_type,
+                            notifier_api.INFO, {'event': event_type})
+
+    def _sent_event_types(self):
+        return [msg['event_type'] for msg in test_notifier.NOTIFICATIONS]
+
+    def test_notify_is_published_in_background(self):
+        self._notify('event.1')
+        self.assertEqual(test_notifier.NOTIFICATIONS, [])
+        eventlet.sleep(0)
+        self.assertEqual(self._sent_event_types(), ['event.1'])
+        stats = async_notifier.get_stats()
+        self.assertEqual(stats['published'], 1)
+        self.assertEqual(stats['batches'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_notifications_are_batched(self):
+        self.flags(async_notifier_batch_size=2)
+        for i in xrange(5):
+            self._notify('event.%d' % i)
+        eventlet.sleep(0)
+        self.assertEqual(self._sent_event_types(),
+                         ['event.%d' % i for i in xrange(5)])
+        self.assertEqual(async_notifier.get_stats()['batches'], 3)
+
+    def test_drop_oldest(self):
+        self.flags(async_notifier_queue_size=2,
+                   async_notifier_overflow_policy='drop_oldest')
+        for i in xrange(4):
+            self._notify('event.%d' % i)
+        eventlet.sleep(0)
+        self.assertEqual(self._sent_event_types(), ['event.2', 'event.3'])
+        self.assertEqual(async_notifier.get_stats()['dropped'], 2)
+
+    def test_spill_and_replay(self):
+        with utils.tempdir() as tmpdir:
+            spill_file = os.path.join(tmpdir, 'spill')
+            self.flags(async_notifier_queue_size=1,
+                       async_notifier_overflow_policy='spill',
+                       async_notifier_spill_file=spill_file)
+            for i in xrange(3):
+                self._notify('event.%d' % i)
+            self.assertEqual(async_notifier.get_stats()['spilled'], 2)
+            eventlet.sleep(0)
+            self.assertEqual(self._sent_event_types(),
+                             ['event.0', 'event.1', 'event.2'])
+            self.assertFalse(os.path.exists(spill_file))
@@ -68,3 +68,13 @@ class ContextTestCase(test.TestCase):
         self.assertTrue(c)
         self.assertIn("'extra_arg1': 'meow'", info['log_msg'])
         self.assertIn("'extra_arg2': 'wuff'", info['log_msg'])
+
+    def test_to_dict_is_invalidated_by_setattr(self):
+        ctxt = context.RequestContext('111', '222')
+        self.assertEqual(ctxt.to_dict()['project_id'], '222')
+        ctxt.to_dict()['project_id'] = 'changed'
+        self.assertEqual(ctxt.to_dict()['project_id'], '222')
+        ctxt.project_id = '333'
+        self.assertEqual(ctxt.to_dict()['project_id'], '333')
+        ctxt.read_deleted = 'yes'
+        self.assertEqual(ctxt.to_dict()['read_deleted'], 'yes')
@@ -19,9 +19,17 @@
 """Unit tests for the DB API"""
 
 import datetime
+import os
+import re
+import shutil
+import tempfile
+
+import nose
 
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session as sql_session
 from nova import exception
 from nova import flags
 from nova.openstack.common import timeutils
@@ -411,6 +419,103 @@ class DbApiTestCase(test.TestCase):
         ec2_id = db.get_ec2_snapshot_id_by_uuid(self.context, 'fake-uuid')
         self.assertEqual(ref['id'], ec2_id)
 
+    def test_bw_usage_bulk_update(self):
+        start_period = datetime.datetime(2012, 8, 1, 12, 0, 0)
+        db.bw_usage_update(self.context, 'uuid1', 'mac1', start_period,
+                           100, 200)
+        usages = [dict(uuid='uuid1', mac_address='mac1', bw_in=150,
+                       bw_out=250),
+                  dict(uuid='uuid1', mac_address='mac2', bw_in=10,
+                       bw_out=20),
+                  dict(uuid='uuid2', mac_address='mac3', bw_in=30,
+                       bw_out=40)]
+        db.bw_usage_bulk_update(self.context, usages, start_period)
+        result = db.bw_usage_get_by_uuids(self.context, ['uuid1', 'uuid2'],
+                                          start_period)
+        self.assertEqual(len(result), 3)
+        got = dict(((row['uuid'], row['mac']), (row['bw_in'], row['bw_out']))
+                   for row in result)
+        self.assertEqual(got, {('uuid1', 'mac1'): (150, 250),
+                               ('uuid1', 'mac2'): (10, 20),
+                               ('uuid2', 'mac3'): (30, 40)})
+
+    def test_bw_usage_bulk_update_empty(self):
+        start_period = datetime.datetime(2012, 8, 1, 12, 0, 0)
+        db.bw_usage_bulk_update(self.context, [], start_period)
+        self.assertEqual(db.bw_usage_get_by_uuids(self.context, ['uuid1'],
+                                                  start_period), [])
+
+    def test_instance_create_bulk(self):
+        values = [{'host': 'host%d' % i, 'project_id': 'fake',
+                   'security_groups': ['default'],
+                   'system_metadata': {'image_kernel_id': 'kernel'},
+                   'info_cache': {'network_info': '[]'}}
+                  for i in xrange(3)]
+        instances = db.instance_create_bulk(self.context, values)
+        self.assertEqual([i['host'] for i in instances],
+                         ['host0', 'host1', 'host2'])
+        self.assertEqual(len(set(i['uuid'] for i in instances)), 3)
+        for instance in instances:
+            instance = db.instance_get_by_uuid(self.context, instance['uuid'])
+            self.assertEqual(
+                    [group['name'] for group in instance['security_groups']],
+                    ['default'])
+            self.assertEqual(instance['info_cache']['network_info'], '[]')
+            self.assertEqual(instance['system_metadata'][0]['value'],
+                             'kernel')
+            self.assertTrue(db.get_ec2_instance_id_by_uuid(self.context,
+                                                           instance['uuid']))
+        # The default group was created once for all of them.
+        groups = db.security_group_get_by_project(self.context, 'fake')
+        self.assertEqual(len(groups), 1)
+
+    def test_service_heartbeat_bulk_update(self):
+        ctxt = context.get_admin_context()
+        then = datetime.datetime(2012, 8, 1, 12, 0, 0)
+        later = then + datetime.timedelta(seconds=30)
+        service1 = db.service_create(ctxt, {'host': 'host1',
+                                            'report_count': 5})
+        service2 = db.service_create(ctxt, {'host': 'host2',
+                                            'report_count': 7})
+        db.service_update(ctxt, service2['id'], {'updated_at': later})
+        db.service_heartbeat_bulk_update(ctxt, {
+            service1['id']: {'updated_at': later, 'report_count': 6},
+            service2['id']: {'updated_at': then, 'report_count': 3},
+            service2['id'] + 100: {'updated_at': later, 'report_count': 1}})
+        service1 = db.service_get(ctxt, service1['id'])
+        self.assertEqual(service1['updated_at'], later)
+        self.assertEqual(service1['report_count'], 6)
+        # Older heartbeats do not move a service back in time.
+        service2 = db.service_get(ctxt, service2['id'])
+        self.assertEqual(service2['updated_at'], later)
+        self.assertEqual(service2['report_count'], 7)
+
+    def test_quota_usage_data_get_for_project(self):
+        ctxt = context.get_admin_context()
+        for project_id, vcpus in (('fake', 2), ('fake', 4), ('other', 8)):
+            db.instance_create(ctxt, {'project_id': project_id,
+                                      'vcpus': vcpus, 'memory_mb': 512})
+        deleted = db.instance_create(ctxt, {'project_id': 'fake',
+                                            'vcpus': 16, 'memory_mb': 512})
+        db.instance_destroy(ctxt, deleted['uuid'])
+        db.volume_create(ctxt, {'project_id': 'fake', 'size': 10})
+        db.floating_ip_create(ctxt, {'address': '10.0.0.1',
+                                     'project_id': 'fake'})
+        db.floating_ip_create(ctxt, {'address': '10.0.0.2',
+                                     'project_id': 'fake',
+                                     'auto_assigned': True})
+        db.security_group_create(ctxt, {'project_id': 'fake',
+                                        'name': 'default'})
+
+        usages = db.quota_usage_data_get_for_project(self.context, 'fake')
+        self.assertEqual(usages, dict(instances=2, cores=6, ram=1024,
+                                      volumes=1, gigabytes=10,
+                                      floating_ips=1, security_groups=1))
+        usages = db.quota_usage_data_get_for_project(ctxt, 'empty')
+        self.assertEqual(usages, dict(instances=0, cores=0, ram=0,
+                                      volumes=0, gigabytes=0,
+                                      floating_ips=0, security_groups=0))
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate',
@@ -1075,3 +1180,260 @@ class SMVolumeDBApiTestCase(test.TestCase):
                           db.sm_flavor_get,
                           ctxt,
                           "fake")
+
+
+class ArchiveTestCase(test.TestCase):
+    """Tests for archiving deleted rows to the shadow tables"""
+
+    def setUp(self):
+        super(ArchiveTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(archive_batch_size=2, archive_batch_delay=0)
+        self.engine = sql_session.get_engine()
+
+    def _count(self, tablename):
+        return self.engine.execute(
+                "SELECT COUNT(*) FROM %s" % tablename).scalar()
+
+    def _destroyed_instance(self, deleted_at=None):
+        instance = db.instance_create(self.context, {})
+        db.instance_destroy(self.context, instance['uuid'])
+        if deleted_at:
+            self.engine.execute(models.Instance.__table__.update().
+                                where(models.Instance.uuid ==
+                                      instance['uuid']).
+                                values(deleted_at=deleted_at))
+        return instance
+
+    def test_archive_deleted_rows(self):
+        live = db.instance_create(self.context, {})
+        deleted = [self._destroyed_instance() for i in xrange(3)]
+
+        archived = db.archive_deleted_rows(self.context)
+        self.assertEqual(archived['instances'], 3)
+        self.assertEqual(archived['instance_info_caches'], 3)
+        self.assertEqual(self._count('instances'), 1)
+        self.assertEqual(self._count('shadow_instances'), 3)
+        self.assertEqual(self._count('instance_info_caches'), 1)
+        self.assertEqual(self._count('shadow_instance_info_caches'), 3)
+        db.instance_get_by_uuid(self.context, live['uuid'])
+        shadow_uuids = [row['uuid'] for row in self.engine.execute(
+                "SELECT uuid FROM shadow_instances ORDER BY id")]
+        self.assertEqual(shadow_uuids, [i['uuid'] for i in deleted])
+
+        archived = db.archive_deleted_rows(self.context)
+        self.assertEqual(sum(archived.values()), 0)
+
+    def test_archive_max_rows_and_older_than(self):
+        now = timeutils.utcnow()
+        older_than = now - datetime.timedelta(days=1)
+        for i in xrange(3):
+            self._destroyed_instance(now - datetime.timedelta(days=10))
+        self._destroyed_instance(now)
+        # The info caches go with the instances deleted long enough ago,
+        # although they were soft-deleted later
+        archived = db.archive_deleted_rows(self.context, max_rows=5,
+                                           older_than=older_than)
+        self.assertEqual(archived['instance_info_caches'], 3)
+        self.assertEqual(archived['instances'], 2)
+        archived = db.archive_deleted_rows(self.context,
+                                           older_than=older_than)
+        self.assertEqual(archived['instances'], 1)
+        self.assertEqual(self._count('instances'), 1)
+        self.assertEqual(self._count('shadow_instances'), 3)
+        self.assertEqual(self._count('instance_info_caches'), 1)
+
+    def test_archive_instance_with_children(self):
+        instance = db.instance_create(self.context,
+                {'metadata': {'key': 'value'},
+                 'system_metadata': {'image_kernel_id': 'fake'}})
+        db.instance_fault_create(self.context,
+                                 {'instance_uuid': instance['uuid'],
+                                  'code': 500, 'message': 'fake',
+                                  'details': ''})
+        live = db.instance_create(self.context,
+                                  {'metadata': {'key': 'value'}})
+        db.instance_destroy(self.context, instance['uuid'])
+
+        archived = db.archive_deleted_rows(self.context)
+        self.assertEqual(archived['instances'], 1)
+        self.assertEqual(archived['instance_metadata'], 1)
+        self.assertEqual(archived['instance_system_metadata'], 1)
+        self.assertEqual(archived['instance_faults'], 1)
+        self.assertEqual(self._count('instances'), 1)
+        self.assertEqual(self._count('instance_metadata'), 1)
+        self.assertEqual(self._count('instance_system_metadata'), 0)
+        self.assertEqual(self._count('instance_faults'), 0)
+        self.assertEqual(db.instance_metadata_get(self.context, live['uuid']),
+                         {'key': 'value'})
+
+    def test_referenced_instance_is_kept(self):
+        instance = self._destroyed_instance()
+        db.fixed_ip_create(self.context, {'address': '10.0.0.2',
+                                          'instance_uuid': instance['uuid']})
+        archived = db.archive_deleted_rows(self.context)
+        self.assertEqual(archived['instance_info_caches'], 1)
+        self.assertEqual(archived['instances'], 0)
+        self.assertEqual(self._count('instances'), 1)
+
+    def test_rows_failing_to_archive_are_skipped(self):
+        deleted = [self._destroyed_instance() for i in xrange(5)]
+        # A row of the shadow table already has the id of the second one
+        self.engine.execute("INSERT INTO shadow_instances (id) VALUES (%d)" %
+                            deleted[1]['id'])
+        archived = db.archive_deleted_rows_for_table(self.context,
+                                                     'instance_info_caches')
+        self.assertEqual(archived, 5)
+        archived = db.archive_deleted_rows_for_table(self.context,
+                                                     'instances')
+        self.assertEqual(archived, 4)
+        self.assertEqual([row['uuid'] for row in self.engine.execute(
+                                "SELECT uuid FROM instances")],
+                         [deleted[1]['uuid']])
+        archived = db.archive_deleted_rows_for_table(self.context,
+                                                     'instances')
+        self.assertEqual(archived, 0)
+
+    def test_unknown_table(self):
+        self.assertRaises(exception.InvalidInput,
+                          db.archive_deleted_rows_for_table,
+                          self.context, 'services')
+
+
+class SlaveConnectionTestCase(test.TestCase):
+    """Tests for reading replica safe calls from the slave database"""
+
+    def setUp(self):
+        super(SlaveConnectionTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.tmpdir = tempfile.mkdtemp()
+        self.flags(slave_connection='sqlite:///' +
+                   os.path.join(self.tmpdir, 'slave.sqlite'))
+        self.stubs.Set(sql_session, '_SLAVE_ENGINE', None)
+        self.stubs.Set(sql_session, '_SLAVE_MAKER', None)
+        db.key_pair_create(self.context, {'user_id': 'fake',
+                                          'name': 'master'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(SlaveConnectionTestCase, self).tearDown()
+
+    def _create_slave_key_pair(self):
+        models.BASE.metadata.create_all(sql_session.get_engine(slave=True))
+        key_pair = models.KeyPair()
+        key_pair.update({'user_id': 'fake', 'name': 'slave'})
+        key_pair.save(session=sql_session.get_session(slave=True))
+
+    def _key_pair_names(self, **kwargs):
+        return [key_pair['name'] for key_pair in
+                db.key_pair_get_all_by_user(self.context, 'fake', **kwargs)]
+
+    def test_replica_safe_call_reads_slave(self):
+        self._create_slave_key_pair()
+        before = sql_session.get_routing_stats()
+        self.assertEqual(self._key_pair_names(), ['slave'])
+        stats = sql_session.get_routing_stats()
+        self.assertEqual(stats['slave'], before['slave'] + 1)
+        self.assertEqual(stats['master'], before['master'])
+
+    def test_use_slave_false_reads_master(self):
+        self._create_slave_key_pair()
+        self.assertEqual(self._key_pair_names(use_slave=False), ['master'])
+
+    def test_other_calls_read_master(self):
+        self._create_slave_key_pair()
+        db.key_pair_get(self.context, 'fake', 'master')
+
+    def test_without_slave_connection(self):
+        self.flags(slave_connection=None)
+        self.assertEqual(self._key_pair_names(), ['master'])
+        self.assertEqual(sql_session._SLAVE_ENGINE, None)
+
+    def test_slave_error_falls_back_to_master(self):
+        # The slave database has no tables
+        before = sql_session.get_routing_stats()
+        self.assertEqual(self._key_pair_names(), ['master'])
+        stats = sql_session.get_routing_stats()
+        self.assertEqual(stats['slave_errors'], before['slave_errors'] + 1)
+
+
+class QueryPlanTestCase(test.TestCase):
+    """Checks that the hot queries are served by an index.
+
+    Every statement a DB API call runs is passed through sqlite's EXPLAIN
+    QUERY PLAN, and the test fails if the table the call filters on is
+    read with a full table scan.
+    """
+
+    def setUp(self):
+        super(QueryPlanTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.uuid = str(utils.gen_uuid())
+        self.engine = sql_session.get_engine()
+        self.plans = []
+        self.stubs.Set(self.engine.dialect, 'do_execute', self._do_execute)
+
+    def _do_execute(self, cursor, statement, parameters, context=None):
+        if not statement.startswith('INSERT'):
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            details = [row[-1] for row in cursor.fetchall()]
+            self.plans.append((statement, details))
+        cursor.execute(statement, parameters)
+
+    def assertIndexed(self, table, func, *args):
+        if self.engine.name != 'sqlite':
+            raise nose.SkipTest('EXPLAIN QUERY PLAN is sqlite specific')
+        self.plans = []
+        try:
+            func(self.context, *args)
+        except exception.NotFound:
+            # Only the query plans matter, the tables are empty
+            pass
+        self.assertTrue(self.plans)
+        full_scan = re.compile(r'^SCAN (TABLE )?%s\b(?! USING)' % table)
+        for statement, details in self.plans:
+            for detail in details:
+                if full_scan.match(detail):
+                    self.fail('%s does a full scan of %s:\n%s' %
+                              (func.__name__, table, statement))
+
+    def test_instance_queries(self):
+        self.assertIndexed('instances', db.instance_get_all_by_host,
+                           'host1')
+        self.assertIndexed('instances', db.instance_get_all_by_reservation,
+                           'r-1')
+        self.assertIndexed('instances', db.instance_get_all_by_filters,
+                           {'changes-since': timeutils.utcnow()})
+
+    def test_service_queries(self):
+        self.assertIndexed('services', db.service_get_by_host_and_topic,
+                           'host1', 'compute')
+        self.assertIndexed('services', db.service_get_all_by_topic,
+                           'compute')
+        self.assertIndexed('compute_nodes',
+                           db.service_get_all_compute_by_host, 'host1')
+
+    def test_fixed_ip_queries(self):
+        self.assertIndexed('fixed_ips', db.fixed_ip_get_by_instance,
+                           self.uuid)
+        self.assertIndexed('fixed_ips', db.fixed_ip_get_by_network_host,
+                           1, 'host1')
+
+    def test_quota_queries(self):
+        self.assertIndexed('quota_usages', db.quota_usage_get_all_by_project,
+                           'project1')
+        self.assertIndexed('reservations', db.reservation_commit,
+                           [self.uuid])
+        self.assertIndexed('reservations', db.reservation_expire)
+
+    def test_migration_queries(self):
+        self.assertIndexed('migrations', db.migration_get_all_unconfirmed,
+                           60)
+        self.assertIndexed('migrations',
+                           db.migration_get_by_instance_and_status,
+                           self.uuid, 'finished')
+
+    def test_block_device_mapping_queries(self):
+        destroy = db.block_device_mapping_destroy_by_instance_and_volume
+        self.assertIndexed('block_device_mapping', destroy,
+                           self.uuid, 'fake-volume')
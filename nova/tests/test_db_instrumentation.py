@@ -0,0 +1,108 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the DB API call statistics"""
+
+from nova import context
+from nova import db
+from nova.db import instrumentation
+from nova import exception
+from nova import test
+
+
+class InstrumentationTestCase(test.TestCase):
+    def setUp(self):
+        super(InstrumentationTestCase, self).setUp()
+        self.flags(db_call_stats=True, db_call_repeat_threshold=2,
+                   db_call_stats_log_interval=0)
+        self.context = context.get_admin_context()
+        instrumentation.reset_stats()
+        self.logged = []
+        self.stubs.Set(instrumentation.LOG, 'info', self._log)
+        self.stubs.Set(instrumentation.LOG, 'warn', self._log)
+
+    def tearDown(self):
+        instrumentation.reset_stats()
+        super(InstrumentationTestCase, self).tearDown()
+
+    def _log(self, msg, *args, **kwargs):
+        self.logged.append(msg % args[0])
+
+    def test_disabled(self):
+        self.flags(db_call_stats=False)
+        db.instance_get_all(self.context)
+        self.assertEqual(instrumentation.get_stats(), {})
+
+    def test_calls_and_rows(self):
+        for i in xrange(3):
+            db.instance_create(self.context, {})
+        db.instance_get_all(self.context)
+        stats = instrumentation.get_stats()
+        self.assertEqual(stats['instance_create']['calls'], 3)
+        self.assertEqual(stats['instance_create']['rows'], 3)
+        self.assertEqual(stats['instance_get_all']['calls'], 1)
+        self.assertEqual(stats['instance_get_all']['rows'], 3)
+        self.assertEqual(stats['instance_get_all']['max_rows'], 3)
+        self.assertEqual(stats['instance_get_all']['errors'], 0)
+        self.assertEqual(sum(stats['instance_get_all']['latency'].values()),
+                         1)
+
+    def test_errors(self):
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_by_uuid, self.context,
+                          'b2b1d8a4-6b8f-4a1f-9c35-2f4e1a0f0cde')
+        stats = instrumentation.get_stats()['instance_get_by_uuid']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['rows'], 0)
+
+    def test_repeated_calls(self):
+        for i in xrange(4):
+            db.instance_get_all(self.context)
+        db.instance_get_all(context.get_admin_context())
+        stats = instrumentation.get_stats()['instance_get_all']
+        self.assertEqual(stats['calls'], 5)
+        self.assertEqual(stats['repeats'], 1)
+        self.assertEqual(len(self.logged), 1)
+        self.assertTrue(self.context.request_id in self.logged[0])
+
+    def test_tracked_requests(self):
+        self.stubs.Set(instrumentation, 'TRACKED_REQUESTS', 2)
+        contexts = [context.get_admin_context() for i in xrange(3)]
+        for ctxt in contexts + contexts[:1]:
+            db.instance_get_all(ctxt)
+        requests = instrumentation._call_stats._requests
+        self.assertEqual(sorted(requests),
+                         sorted([contexts[2].request_id,
+                                 contexts[0].request_id]))
+        self.assertEqual(requests[contexts[0].request_id]['instance_get_all'],
+                         1)
+
+    def test_log_stats(self):
+        db.instance_get_all(self.context)
+        db.instance_create(self.context, {})
+        instrumentation.log_stats()
+        self.assertEqual(len(self.logged), 2)
+
+    def test_periodic_log(self):
+        self.flags(db_call_stats_log_interval=1)
+        db.instance_get_all(self.context)
+        self.assertEqual(self.logged, [])
+        self.stubs.Set(instrumentation._call_stats, '_last_log', 0)
+        db.instance_get_all(self.context)
+        self.assertEqual(len(self.logged), 1)
+        self.assertTrue(self.logged[0].startswith('instance_get_all:'))
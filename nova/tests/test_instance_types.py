@@ -251,6 +251,85 @@ class InstanceTypeTestCase(test.TestCase):
         self.assertTrue(instance["instance_type"])
 
 
+class InstanceTypeCacheTestCase(test.TestCase):
+    """Test cases for the in-process instance type cache"""
+    def setUp(self):
+        super(InstanceTypeCacheTestCase, self).setUp()
+        self.flags(instance_type_cache_ttl=60)
+        instance_types.invalidate_cache()
+        self.loads = 0
+        real_get_all = db.instance_type_get_all
+
+        def fake_get_all(context, inactive=False, filters=None):
+            self.loads += 1
+            return real_get_all(context, inactive=inactive, filters=filters)
+
+        self.stubs.Set(db, 'instance_type_get_all', fake_get_all)
+
+    def tearDown(self):
+        instance_types.invalidate_cache()
+        super(InstanceTypeCacheTestCase, self).tearDown()
+
+    def test_lookups_load_all_types_once(self):
+        def fail(*args, **kwargs):
+            self.fail('instance type read from the database')
+
+        for name in ('instance_type_get', 'instance_type_get_by_name',
+                     'instance_type_get_by_flavor_id'):
+            self.stubs.Set(db, name, fail)
+        default = instance_types.get_default_instance_type()
+        self.assertEqual(default['name'], FLAGS.default_instance_type)
+        self.assertEqual(instance_types.get_instance_type(default['id']),
+                         default)
+        self.assertEqual(
+                instance_types.get_instance_type_by_flavor_id(
+                        default['flavorid']),
+                default)
+        self.assertEqual(self.loads, 1)
+
+    def test_lookups_return_copies(self):
+        inst_type = instance_types.get_instance_type_by_name('m1.small')
+        inst_type['memory_mb'] = 1
+        inst_type['extra_specs']['foo'] = 'bar'
+        inst_type = instance_types.get_instance_type_by_name('m1.small')
+        self.assertNotEqual(inst_type['memory_mb'], 1)
+        self.assertEqual(inst_type['extra_specs'], {})
+
+    def test_cache_expires(self):
+        instance_types.get_instance_type_by_name('m1.small')
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now + 61)
+        instance_types.get_instance_type_by_name('m1.small')
+        self.assertEqual(self.loads, 2)
+
+    def test_create_and_destroy_invalidate(self):
+        instance_types.get_instance_type_by_name('m1.small')
+        instance_types.create('cached', 256, 1, 120, 100, 'cached1')
+        inst_type = instance_types.get_instance_type_by_flavor_id('cached1')
+        self.assertEqual(inst_type['name'], 'cached')
+        instance_types.destroy('cached')
+        self.assertRaises(exception.FlavorNotFound,
+                          instance_types.get_instance_type_by_flavor_id,
+                          'cached1', read_deleted='no')
+        inst_type = instance_types.get_instance_type_by_flavor_id('cached1')
+        self.assertEqual(inst_type['name'], 'cached')
+        self.assertTrue(inst_type['deleted'])
+        self.assertEqual(self.loads, 3)
+
+    def test_miss_reads_database(self):
+        instance_types.get_instance_type_by_name('m1.small')
+        ctxt = context.get_admin_context()
+        db.instance_type_create(ctxt, dict(name='elsewhere', memory_mb=256,
+                                           vcpus=1, root_gb=1,
+                                           ephemeral_gb=0, flavorid='e1',
+                                           swap=0, rxtx_factor=1))
+        inst_type = instance_types.get_instance_type_by_name('elsewhere')
+        self.assertEqual(inst_type['flavorid'], 'e1')
+        self.assertRaises(exception.InstanceTypeNotFound,
+                          instance_types.get_instance_type, 9999)
+        self.assertEqual(self.loads, 1)
+
+
 class InstanceTypeFilteringTest(test.TestCase):
     """Test cases for the filter option available for instance_type_get_all"""
     def setUp(self):
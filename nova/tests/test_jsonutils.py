@@ -0,0 +1,81 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests that to_primitive_fast() matches to_primitive()."""
+
+import datetime
+import itertools
+import xmlrpclib
+
+from nova.network import model
+from nova.openstack.common import jsonutils
+from nova import test
+from nova.tests import fake_network_cache_model
+
+
+class Thing(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ItemsThing(object):
+    def __init__(self, data):
+        self.data = data
+
+    def iteritems(self):
+        return self.data.iteritems()
+
+
+class ToPrimitiveFastTestCase(test.TestCase):
+
+    def _check(self, value, convert_instances=False):
+        expected = jsonutils.to_primitive(
+            value, convert_instances=convert_instances)
+        actual = jsonutils.to_primitive_fast(
+            value, convert_instances=convert_instances)
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_simple_types(self):
+        for value in (None, True, 1, 2L, 1.5, 'str', u'unicode'):
+            self._check(value)
+
+    def test_containers(self):
+        now = datetime.datetime(2012, 8, 1, 12, 30, 15, 1234)
+        value = {'a': [1, (2, 3), {'b': now}],
+                 'c': (None, u'd'),
+                 'e': set([1]),
+                 'f': xmlrpclib.DateTime(now.timetuple())}
+        self.assertEqual(self._check(value)['a'][2]['b'],
+                         jsonutils.to_primitive(now))
+
+    def test_nasty_values(self):
+        for value in (jsonutils, Thing, self._check, len,
+                      itertools.count(1)):
+            self._check({'x': value})
+
+    def test_instances_and_depth(self):
+        nested = Thing(a=Thing(b=Thing(c=Thing(d=Thing(e=1)))))
+        self._check(nested, convert_instances=True)
+        self._check(nested, convert_instances=False)
+        self._check(ItemsThing({'a': ItemsThing({'b': [1, {'c': 2}]})}))
+
+    def test_nw_info(self):
+        nw_info = model.NetworkInfo([
+                fake_network_cache_model.new_vif(),
+                fake_network_cache_model.new_vif(dict(id=2))])
+        self._check({'info_cache': {'network_info': nw_info}})
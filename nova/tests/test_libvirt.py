@@ -1931,6 +1931,42 @@ class LibvirtConnTestCase(test.TestCase):
             output = conn.get_console_output(instance)
             self.assertEquals("foo", output)
 
+    def test_get_console_output_range_file(self):
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+
+            instance = db.instance_create(self.context, self.test_instance)
+            console_log = os.path.join(tmpdir, 'console.log')
+            with open(console_log, "w") as f:
+                f.write("one\ntwo\nthree")
+            fake_dom_xml = """
+                <domain type='kvm'>
+                    <devices>
+                        <console type='file'>
+                            <source path='%s'/>
+                            <target port='0'/>
+                        </console>
+                    </devices>
+                </domain>
+            """ % console_log
+
+            def fake_lookup(id):
+                return FakeVirtDomain(fake_dom_xml)
+
+            self.create_fake_libvirt_mock()
+            libvirt_driver.LibvirtDriver._conn.lookupByName = fake_lookup
+            libvirt_driver.libvirt_utils = fake_libvirt_utils
+
+            conn = libvirt_driver.LibvirtDriver(False)
+            self.assertEquals(conn.get_console_output_range(instance,
+                                                            tail_length=2),
+                              ("two\nthree", 13))
+            self.assertEquals(conn.get_console_output_range(instance,
+                                                            offset=4,
+                                                            max_bytes=4),
+                              ("two\n", 8))
+
     def test_get_console_output_pty(self):
 
         with utils.tempdir() as tmpdir:
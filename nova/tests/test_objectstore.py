@@ -128,6 +128,48 @@ class S3APITestCase(test.TestCase):
 
         self._ensure_no_buckets(bucket.get_all_keys())
 
+    def test_key_larger_than_chunk(self):
+        """Objects are streamed in chunks and checksummed on the way."""
+        key_contents = os.urandom(s3server.CHUNK_SIZE * 3 + 17)
+        bucket = self.conn.create_bucket('testbucket')
+        key = bucket.new_key('bigkey')
+        # boto checks the ETag against the md5 of what it sent
+        key.set_contents_from_string(key_contents)
+        key = bucket.get_key('bigkey')
+        self.assertEquals(key.get_contents_as_string(), key_contents)
+
+    def test_get_key_range(self):
+        bucket = self.conn.create_bucket('testbucket')
+        bucket.new_key('somekey').set_contents_from_string('0123456789')
+        key = bucket.get_key('somekey')
+        self.assertEquals(
+            key.get_contents_as_string(headers={'Range': 'bytes=2-5'}),
+            '2345')
+        self.assertEquals(
+            key.get_contents_as_string(headers={'Range': 'bytes=-3'}),
+            '789')
+        self.assertRaises(boto_exception.S3ResponseError,
+                          key.get_contents_as_string,
+                          headers={'Range': 'bytes=20-30'})
+
+    def test_list_keys_with_marker_and_prefix(self):
+        bucket = self.conn.create_bucket('testbucket')
+        for key_name in ('b2', 'a1', 'b1', 'c1', 'b3'):
+            bucket.new_key(key_name).set_contents_from_string(key_name)
+        # overwriting a key does not list it twice
+        bucket.new_key('b1').set_contents_from_string('again')
+
+        def names(**kwargs):
+            return [key.name for key in bucket.get_all_keys(**kwargs)]
+
+        self.assertEquals(names(), ['a1', 'b1', 'b2', 'b3', 'c1'])
+        self.assertEquals(names(prefix='b'), ['b1', 'b2', 'b3'])
+        self.assertEquals(names(marker='b1'), ['b2', 'b3', 'c1'])
+        self.assertEquals(names(prefix='b', marker='b1', max_keys=1),
+                          ['b2'])
+        bucket.delete_key('b2')
+        self.assertEquals(names(prefix='b'), ['b1', 'b3'])
+
     def test_unknown_bucket(self):
         bucket_name = 'falalala'
         self.assertRaises(boto_exception.S3ResponseError,
@@ -0,0 +1,141 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the scheduling of the periodic tasks of managers"""
+
+import random
+import time
+
+import eventlet
+from eventlet import event
+
+from nova import context
+from nova import manager
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    def __init__(self, *args, **kwargs):
+        super(FakeManager, self).__init__(*args, **kwargs)
+        self.calls = []
+        self.event = None
+
+    @manager.periodic_task
+    def every_tick(self, context):
+        self.calls.append('every_tick')
+
+    @manager.periodic_task(ticks_between_runs=2)
+    def every_third_tick(self, context):
+        self.calls.append('every_third_tick')
+
+    @manager.periodic_task(spacing=100)
+    def spaced(self, context):
+        self.calls.append('spaced')
+
+    @manager.periodic_task(spacing='bandwith_poll_interval',
+                           run_immediately=True)
+    def spaced_by_flag(self, context):
+        self.calls.append('spaced_by_flag')
+
+    @manager.periodic_task
+    def blocking(self, context):
+        if self.event:
+            self.event.wait()
+
+    @manager.periodic_task(timeout=0.01)
+    def timing_out(self, context):
+        if self.event:
+            eventlet.sleep(1)
+            self.calls.append('timing_out')
+
+    @manager.periodic_task
+    def failing(self, context):
+        if self.event:
+            raise test.TestingException()
+
+
+class PeriodicTasksTestCase(test.TestCase):
+    def setUp(self):
+        super(PeriodicTasksTestCase, self).setUp()
+        self.flags(bandwith_poll_interval=100)
+        self.now = 1000.0
+        self.stubs.Set(time, 'time', lambda: self.now)
+        self.stubs.Set(random, 'uniform', lambda a, b: b / 2)
+        self.manager = FakeManager(host='fake_host')
+        self.context = context.get_admin_context()
+
+    def _tick(self):
+        self.manager.calls = []
+        self.manager.periodic_tasks(self.context)
+        self.now += 60
+        return sorted(self.manager.calls)
+
+    def test_ticks_and_spacing(self):
+        self.assertEqual(self._tick(), ['every_tick', 'spaced_by_flag'])
+        self.assertEqual(self._tick(), ['every_tick', 'spaced'])
+        self.assertEqual(self._tick(), ['every_third_tick', 'every_tick',
+                                        'spaced_by_flag'])
+        self.assertEqual(self._tick(), ['every_tick', 'spaced'])
+        self.assertEqual(self._tick(), ['every_tick', 'spaced_by_flag'])
+
+    def test_stats(self):
+        self._tick()
+        self._tick()
+        stats = self.manager.get_periodic_task_stats(self.context)
+        self.assertEqual(stats['every_tick']['runs'], 2)
+        self.assertEqual(stats['every_tick']['errors'], 0)
+        self.assertEqual(stats['every_tick']['last_run'], 1060.0)
+        self.assertEqual(stats['spaced']['runs'], 1)
+        self.assertFalse('every_third_tick' in stats)
+
+    def test_errors_and_timeouts(self):
+        self.manager.event = event.Event()
+        self.manager.event.send()
+        self._tick()
+        stats = self.manager.get_periodic_task_stats(self.context)
+        self.assertEqual(stats['failing']['errors'], 1)
+        self.assertEqual(stats['timing_out']['timeouts'], 1)
+        self.assertEqual(stats['timing_out']['runs'], 1)
+        self.assertFalse('timing_out' in self.manager.calls)
+
+    def test_raise_on_error(self):
+        self.manager.event = event.Event()
+        self.manager._periodic_tasks = [
+                (name, task) for name, task in self.manager._periodic_tasks
+                if name == 'failing']
+        self.assertRaises(test.TestingException,
+                          self.manager.periodic_tasks, self.context,
+                          raise_on_error=True)
+        stats = self.manager.get_periodic_task_stats(self.context)
+        self.assertEqual(stats['failing']['errors'], 1)
+
+    def test_concurrent_skips_running_task(self):
+        self.flags(periodic_task_concurrency=4)
+        self.manager.event = event.Event()
+        self.manager.periodic_tasks(self.context)
+        eventlet.sleep(0)
+        self.assertTrue('blocking' in self.manager._periodic_running)
+
+        self.manager.periodic_tasks(self.context)
+        self.manager.event.send()
+        self.manager._periodic_pool.waitall()
+        stats = self.manager.get_periodic_task_stats(self.context)
+        self.assertEqual(stats['blocking']['skipped'], 1)
+        self.assertEqual(stats['blocking']['runs'], 1)
+        self.assertEqual(stats['every_tick']['runs'], 2)
+        self.assertEqual(stats['failing']['errors'], 2)
+        self.assertEqual(self.manager._periodic_running, {})
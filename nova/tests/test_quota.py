@@ -295,6 +295,9 @@ class FakeDriver(object):
     def destroy_all_by_project(self, context, project_id):
         self.called.append(('destroy_all_by_project', context, project_id))
 
+    def invalidate_cache(self, project_id=None, quota_class=None):
+        self.called.append(('invalidate_cache', project_id, quota_class))
+
     def expire(self, context):
         self.called.append(('expire', context))
 
@@ -662,6 +665,15 @@ class QuotaEngineTestCase(test.TestCase):
                 ('destroy_all_by_project', context, 'test_project'),
                 ])
 
+    def test_invalidate_cache(self):
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.invalidate_cache(project_id='test_project')
+
+        self.assertEqual(driver.called, [
+                ('invalidate_cache', 'test_project', None),
+                ])
+
     def test_expire(self):
         context = FakeContext(None, None)
         driver = FakeDriver()
@@ -1226,6 +1238,47 @@ class DbQuotaDriverTestCase(test.TestCase):
                           quota.QUOTAS._resources,
                           dict(metadata_items=-1))
 
+    def test_get_quotas_cached(self):
+        self.flags(quota_limit_cache_ttl=5)
+        self._stub_get_project_quotas()
+        context = FakeContext('test_project', 'test_class')
+        result1 = self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                          ['instances'], True)
+        result2 = self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                          ['metadata_items'], False)
+        self.assertEqual(self.calls, ['get_project_quotas'])
+        self.assertEqual(result1, dict(instances=10))
+        self.assertEqual(result2, dict(metadata_items=128))
+
+        # Another project or quota class has its own entry
+        self.driver._get_quotas(FakeContext('other_project', 'test_class'),
+                                quota.QUOTAS._resources, ['instances'], True)
+        self.assertEqual(len(self.calls), 2)
+
+        # The entry expires...
+        timeutils.advance_time_seconds(6)
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        self.assertEqual(len(self.calls), 3)
+
+        # ...and is dropped when the quotas change
+        self.driver.invalidate_cache(project_id='test_project')
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        self.assertEqual(len(self.calls), 4)
+        self.driver.invalidate_cache(quota_class='test_class')
+        self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                ['instances'], True)
+        self.assertEqual(len(self.calls), 5)
+
+    def test_get_quotas_not_cached(self):
+        self._stub_get_project_quotas()
+        context = FakeContext('test_project', 'test_class')
+        for i in xrange(2):
+            self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                    ['instances'], True)
+        self.assertEqual(self.calls, ['get_project_quotas'] * 2)
+
     def test_limit_check_over(self):
         self._stub_get_project_quotas()
         self.assertRaises(exception.OverQuota,
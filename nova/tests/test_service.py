@@ -31,6 +31,7 @@ from nova import flags
 from nova import manager
 from nova.openstack.common import cfg
 from nova import service
+from nova.servicegroup import db_driver
 from nova import test
 from nova import wsgi
 
@@ -111,6 +112,8 @@ class ServiceTestCase(test.TestCase):
     def setUp(self):
         super(ServiceTestCase, self).setUp()
         self.mox.StubOutWithMock(service, 'db')
+        # The default servicegroup driver writes the heartbeats.
+        self.stubs.Set(db_driver, 'db', service.db)
 
     def test_create(self):
         host = 'foo'
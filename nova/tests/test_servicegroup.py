@@ -0,0 +1,184 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the servicegroup drivers."""
+
+import datetime
+
+import mox
+
+from nova import context
+from nova import db
+from nova import flags
+from nova.openstack.common import timeutils
+from nova import service
+from nova import servicegroup
+from nova.servicegroup import api
+from nova import test
+from nova import utils
+
+
+flags.DECLARE('servicegroup_aggregator_topics',
+              'nova.servicegroup.aggregator_driver')
+
+
+class _ServiceGroupTestCase(test.TestCase):
+
+    driver = None
+
+    def setUp(self):
+        super(_ServiceGroupTestCase, self).setUp()
+        self.flags(servicegroup_driver=self.driver, service_down_time=60)
+        # Every test gets a fresh driver instead of the process-wide one.
+        self.stubs.Set(api, '_DRIVER', None)
+        self.context = context.get_admin_context()
+        self.now = datetime.datetime(2012, 8, 1, 12, 0, 0)
+        timeutils.set_time_override(self.now)
+        self.services = []
+
+    def tearDown(self):
+        for serv in self.services:
+            serv.stop()
+        timeutils.clear_time_override()
+        super(_ServiceGroupTestCase, self).tearDown()
+
+    def _start_service(self, host, topic):
+        serv = service.Service(host, 'nova-fake-%s' % topic, topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.start()
+        self.services.append(serv)
+        return serv
+
+    def _service_ref(self, seconds_ago):
+        updated = self.now - datetime.timedelta(seconds=seconds_ago)
+        return {'id': 1, 'created_at': updated, 'updated_at': updated}
+
+
+class DbDriverTestCase(_ServiceGroupTestCase):
+
+    driver = 'nova.servicegroup.db_driver.DbDriver'
+
+    def test_report_state(self):
+        self.flags(node_availability_zone='zone1')
+        serv = self._start_service('host1', 'compute')
+        db.service_update(self.context, serv.service_id,
+                          {'availability_zone': 'zone2'})
+        serv.report_state()
+        serv.report_state()
+        service_ref = db.service_get(self.context, serv.service_id)
+        self.assertEqual(service_ref['report_count'], 2)
+        self.assertEqual(service_ref['availability_zone'], 'zone1')
+
+    def test_report_state_recreates_service(self):
+        serv = self._start_service('host1', 'compute')
+        db.service_destroy(self.context, serv.service_id)
+        serv.report_state()
+        service_ref = db.service_get_by_args(self.context, 'host1',
+                                             'nova-fake-compute')
+        self.assertEqual(service_ref['report_count'], 1)
+        self.assertFalse(serv.model_disconnected)
+
+    def test_get_up_services(self):
+        services = [self._service_ref(0), self._service_ref(60),
+                    self._service_ref(61)]
+        up = servicegroup.API().get_up_services(services)
+        self.assertEqual(up, services[:2])
+
+    def test_utils_service_is_up_uses_driver(self):
+        self.assertTrue(utils.service_is_up(self._service_ref(60)))
+        self.assertFalse(utils.service_is_up(self._service_ref(61)))
+
+
+class AggregatorDriverTestCase(_ServiceGroupTestCase):
+
+    driver = 'nova.servicegroup.aggregator_driver.AggregatorDriver'
+
+    def setUp(self):
+        super(AggregatorDriverTestCase, self).setUp()
+        self.flags(servicegroup_flush_interval=30,
+                   servicegroup_aggregator_topics=['scheduler'])
+
+    def test_heartbeats_are_written_in_bulk(self):
+        self._start_service('host1', 'scheduler')
+        computes = [self._start_service('host%d' % i, 'compute')
+                    for i in xrange(2, 5)]
+        self.mox.StubOutWithMock(db, 'service_update')
+        self.mox.ReplayAll()
+        for serv in computes:
+            serv.report_state()
+            serv.report_state()
+        self.assertEqual(db.service_get(self.context,
+                                        computes[0].service_id)
+                         ['report_count'], 0)
+        self.mox.VerifyAll()
+        self.mox.UnsetStubs()
+
+        driver = api._get_driver()
+        timeutils.advance_time_seconds(10)
+        driver.aggregator.flush(self.context)
+        for serv in computes:
+            service_ref = db.service_get(self.context, serv.service_id)
+            self.assertEqual(service_ref['report_count'], 2)
+            self.assertEqual(service_ref['updated_at'], self.now)
+
+    def test_is_up_from_memory(self):
+        self._start_service('host1', 'scheduler')
+        compute = self._start_service('host2', 'compute')
+        service_ref = db.service_get(self.context, compute.service_id)
+        compute.report_state()
+        timeutils.advance_time_seconds(60)
+        self.assertTrue(utils.service_is_up(service_ref))
+        timeutils.advance_time_seconds(1)
+        self.assertFalse(utils.service_is_up(service_ref))
+
+    def test_is_up_from_db_allows_for_flush(self):
+        # Without a local aggregator the services table is used, which is
+        # up to servicegroup_flush_interval seconds behind.
+        services = [self._service_ref(90), self._service_ref(91)]
+        services[1]['id'] = 2
+        up = servicegroup.API().get_up_services(services)
+        self.assertEqual(up, services[:1])
+
+    def test_failed_flush_is_retried(self):
+        self._start_service('host1', 'scheduler')
+        compute = self._start_service('host2', 'compute')
+        compute.report_state()
+        aggregator = api._get_driver().aggregator
+
+        self.mox.StubOutWithMock(db, 'service_heartbeat_bulk_update')
+        db.service_heartbeat_bulk_update(self.context,
+                mox.IgnoreArg()).AndRaise(Exception())
+        db.service_heartbeat_bulk_update(self.context,
+                {compute.service_id: {'updated_at': self.now,
+                                      'report_count': 1}})
+        self.mox.ReplayAll()
+        aggregator.flush(self.context)
+        aggregator.flush(self.context)
+        # Nothing left to write.
+        aggregator.flush(self.context)
+
+    def test_leave_flushes(self):
+        scheduler = self._start_service('host1', 'scheduler')
+        compute = self._start_service('host2', 'compute')
+        compute.report_state()
+        self.services.remove(scheduler)
+        self.services.remove(compute)
+        compute.stop()
+        scheduler.stop()
+        self.assertEqual(api._get_driver().aggregator, None)
+        service_ref = db.service_get(self.context, compute.service_id)
+        self.assertEqual(service_ref['report_count'], 1)
@@ -462,6 +462,35 @@ class GenericUtilsTestCase(test.TestCase):
         h2 = hashlib.sha1(data).hexdigest()
         self.assertEquals(h1, h2)
 
+    def _read_file_range(self, data, **kwargs):
+        return utils.read_file_range(StringIO.StringIO(data), len(data),
+                                     **kwargs)
+
+    def test_read_file_range_tail(self):
+        for data in ('', 'one', 'one\ntwo\nthree', 'one\ntwo\n', '\n\n',
+                     'x' * 70000 + '\n' + 'y' * 70000):
+            for length in range(1, 5):
+                expected = '\n'.join(data.split('\n')[-length:])
+                self.assertEqual(self._read_file_range(data,
+                                                       tail_length=length),
+                                 (expected, len(data)))
+        self.assertEqual(self._read_file_range('one\ntwo', tail_length=0),
+                         ('', 7))
+
+    def test_read_file_range_offset(self):
+        data = 'one\ntwo\nthree\n'
+        self.assertEqual(self._read_file_range(data), (data, 14))
+        self.assertEqual(self._read_file_range(data, offset=4),
+                         ('two\nthree\n', 14))
+        self.assertEqual(self._read_file_range(data, offset=4, max_bytes=4),
+                         ('two\n', 8))
+        self.assertEqual(self._read_file_range(data, offset=14), ('', 14))
+        self.assertEqual(self._read_file_range(data, offset=4, max_bytes=7,
+                                               tail_length=1),
+                         ('thr', 11))
+        # The log was truncated since the last read
+        self.assertEqual(self._read_file_range(data, offset=20), (data, 14))
+
 
 class IsUUIDLikeTestCase(test.TestCase):
     def assertUUIDLike(self, val, expected):
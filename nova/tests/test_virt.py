@@ -15,10 +15,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import StringIO
+import tarfile
+
 from nova import exception
 from nova import flags
 from nova import test
+from nova import utils
 from nova.virt.disk import api as disk_api
+from nova.virt.disk import nbd
 from nova.virt import driver
 
 FLAGS = flags.FLAGS
@@ -101,3 +107,139 @@ class TestVirtDisk(test.TestCase):
                           disk_api._inject_file_into_fs,
                           '/tmp', '/etc/../../../../etc/passwd',
                           'hax')
+
+    def _make_tar(self, files, owners=None):
+        buf = StringIO.StringIO()
+        with contextlib.closing(tarfile.open(fileobj=buf, mode='w')) as tar:
+            for name, mode, contents in files:
+                info = tarfile.TarInfo(name)
+                info.mode = mode
+                info.uid = info.gid = (owners or {}).get(name, 0)
+                if contents is None:
+                    info.type = tarfile.DIRTYPE
+                    tar.addfile(info)
+                else:
+                    info.size = len(contents)
+                    tar.addfile(info, StringIO.StringIO(contents))
+        return buf.getvalue()
+
+    def _stub_execute(self, guest):
+        calls = []
+        written = {}
+
+        def fake_execute(*cmd, **kwargs):
+            calls.append(cmd)
+            self.assertTrue(kwargs.get('run_as_root'))
+            if cmd[1] == '-c':
+                return guest, ''
+            tar = tarfile.open(fileobj=StringIO.StringIO(
+                    kwargs['process_input']))
+            for info in tar:
+                contents = None
+                if info.isfile():
+                    contents = tar.extractfile(info).read()
+                written[info.name] = (info.mode, contents)
+                written[info.name + ':owner'] = (info.uid, info.gid)
+            return '', ''
+
+        self.stubs.Set(utils, 'execute', fake_execute)
+        return calls, written
+
+    def test_inject_data_into_fs_runs_two_commands(self):
+        guest = self._make_tar([
+                ('root/.ssh/authorized_keys', 0600, 'old-key\n'),
+                ('etc/selinux', 0755, None),
+                ('etc/rc.local', 0644, '#!/bin/sh\n'),
+                ('etc/network', 0750, None),
+                ('etc/network/interfaces', 0640, 'old-net\n'),
+                ('etc/passwd', 0644, 'root:x:0:0::/root:/bin/sh\n'),
+                ('etc/shadow', 0400, 'root:*:15000:0:::::\n'),
+                ('srv/motd', 0600, 'old\n')],
+                owners={'srv/motd': 1000})
+        calls, written = self._stub_execute(guest)
+        disk_api.inject_data_into_fs('/tmp/guest', 'new-key', 'net', None,
+                                     'password', [('/etc/motd', 'hi'),
+                                                  ('/srv/motd', 'new')])
+
+        self.assertEqual([cmd[:2] for cmd in calls],
+                         [('tar', '-c'), ('tar', '-x')])
+        self.assertEqual(written['root/.ssh'], (0700, None))
+        self.assertEqual(written['root/.ssh/authorized_keys'][0], 0600)
+        self.assertTrue(written['root/.ssh/authorized_keys'][1].startswith(
+                'old-key\n'))
+        self.assertTrue('new-key' in written['root/.ssh/authorized_keys'][1])
+        self.assertEqual(written['etc/rc.local'][0], 0755)
+        self.assertTrue('restorecon' in written['etc/rc.local'][1])
+        self.assertEqual(written['etc/network/interfaces'], (0640, 'net'))
+        self.assertFalse('etc/network' in written)
+        self.assertEqual(written['etc/motd'], (0644, 'hi'))
+        self.assertEqual(written['srv/motd'], (0600, 'new'))
+        self.assertEqual(written['srv/motd:owner'], (1000, 1000))
+        self.assertEqual(written['etc/shadow'][0], 0400)
+        self.assertNotEqual(written['etc/shadow'][1].split(':')[1], '*')
+        self.assertFalse('etc/passwd' in written)
+
+    def test_inject_file_keeps_owner_and_mode(self):
+        guest = self._make_tar([('home/user/.profile', 0640, 'old\n')],
+                               owners={'home/user/.profile': 1000})
+        calls, written = self._stub_execute(guest)
+        disk_api._inject_file_into_fs('/tmp/guest', '/home/user/.profile',
+                                      'new\n')
+        disk_api._inject_file_into_fs('/tmp/guest', '/home/user/.bashrc',
+                                      'new\n')
+
+        self.assertEqual([cmd[:2] for cmd in calls],
+                         [('tar', '-c'), ('tar', '-x'),
+                          ('tar', '-c'), ('tar', '-x')])
+        self.assertEqual(written['home/user/.profile'], (0640, 'new\n'))
+        self.assertEqual(written['home/user/.profile:owner'], (1000, 1000))
+        self.assertEqual(written['home/user/.bashrc'], (0644, 'new\n'))
+        self.assertEqual(written['home/user/.bashrc:owner'], (0, 0))
+
+    def test_inject_admin_password_unknown_user(self):
+        guest = self._make_tar([('etc/passwd', 0644, 'bin:x:1:1::/:\n'),
+                                ('etc/shadow', 0400, 'bin:*:15000::::::\n')])
+        self.stubs.Set(utils, 'execute', lambda *cmd, **kwargs: (guest, ''))
+        self.assertRaises(exception.NovaException,
+                          disk_api.inject_data_into_fs, '/tmp/guest', None,
+                          None, None, 'password', None)
+
+
+class TestNbdMount(test.TestCase):
+    def setUp(self):
+        super(TestNbdMount, self).setUp()
+        self.flags(timeout_nbd=1, nbd_poll_interval=0.001)
+        self.in_use = set(['/dev/nbd0'])
+        self.stubs.Set(nbd.Mount, '_DEVICES', ['/dev/nbd0', '/dev/nbd1'])
+        self.stubs.Set(nbd.Mount, '_allocated', set())
+        self.stubs.Set(nbd.Mount, '_device_in_use',
+                       staticmethod(lambda device: device in self.in_use))
+        self.stubs.Set(nbd.os.path, 'exists', lambda path: True)
+
+    def _mount(self):
+        return nbd.Mount(image='image', mount_dir='/tmp/mnt')
+
+    def test_allocate_skips_busy_and_allocated_devices(self):
+        mount = self._mount()
+        self.assertEqual(mount._allocate_nbd(), '/dev/nbd1')
+        self.assertEqual(mount._allocate_nbd(), None)
+        mount._free_nbd('/dev/nbd1')
+        self.in_use.clear()
+        self.assertEqual(mount._allocate_nbd(), '/dev/nbd0')
+        self.assertEqual(mount._allocate_nbd(), '/dev/nbd1')
+
+    def test_get_dev_waits_for_device(self):
+        def fake_trycmd(*cmd, **kwargs):
+            self.in_use.add('/dev/nbd1')
+            return '', ''
+
+        self.stubs.Set(utils, 'trycmd', fake_trycmd)
+        mount = self._mount()
+        self.assertTrue(mount.get_dev())
+        self.assertEqual(mount.device, '/dev/nbd1')
+
+    def test_get_dev_times_out(self):
+        self.stubs.Set(utils, 'trycmd', lambda *cmd, **kwargs: ('', ''))
+        mount = self._mount()
+        self.assertFalse(mount.get_dev())
+        self.assertEqual(nbd.Mount._allocated, set())
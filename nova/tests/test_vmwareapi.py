@@ -30,6 +30,7 @@ from nova.tests.vmwareapi import db_fakes
 from nova.tests.vmwareapi import stubs
 from nova.virt.vmwareapi import driver
 from nova.virt.vmwareapi import fake as vmwareapi_fake
+from nova.virt.vmwareapi import vim_util
 
 
 FLAGS = flags.FLAGS
@@ -248,6 +249,53 @@ class VMWareAPIVMTestCase(test.TestCase):
         instances = self.conn.list_instances()
         self.assertEquals(len(instances), 0)
 
+    def _count_property_calls(self):
+        calls = {'get_objects': 0, 'get_object_properties': 0}
+
+        def counted(name):
+            orig = getattr(vim_util, name)
+
+            def _wrapper(*args, **kwargs):
+                calls[name] += 1
+                return orig(*args, **kwargs)
+            self.stubs.Set(vim_util, name, _wrapper)
+
+        for name in calls:
+            counted(name)
+        return calls
+
+    def test_list_instances_detail(self):
+        self._create_vm()
+        self.conn.suspend(self.instance)
+        infos = self.conn.list_instances_detail()
+        self.assertEquals([(info.name, info.state) for info in infos],
+                          [(1, power_state.PAUSED)])
+
+    def test_get_info_after_list_instances(self):
+        self._create_vm()
+        calls = self._count_property_calls()
+        self.conn.list_instances()
+        info = self.conn.get_info({'name': 1})
+        self._check_vm_info(info, power_state.RUNNING)
+        self.assertEquals(calls, {'get_objects': 1,
+                                  'get_object_properties': 0})
+
+    def test_get_info_uses_name_index(self):
+        self.flags(vmwareapi_inventory_cache_ttl=0)
+        self._create_vm()
+        calls = self._count_property_calls()
+        info = self.conn.get_info({'name': 1})
+        self._check_vm_info(info, power_state.RUNNING)
+        self.assertEquals(calls, {'get_objects': 0,
+                                  'get_object_properties': 1})
+
+    def test_get_info_vm_removed_behind_our_back(self):
+        self.flags(vmwareapi_inventory_cache_ttl=0)
+        self._create_vm()
+        vmwareapi_fake._db_content["VirtualMachine"].clear()
+        self.assertRaises(exception.InstanceNotFound, self.conn.get_info,
+                          {'name': 1})
+
     def test_destroy_non_existent(self):
         self._create_instance_in_the_db()
         self.assertEquals(self.conn.destroy(self.instance, self.network_info),
@@ -19,9 +19,12 @@
 import ast
 import contextlib
 import cPickle as pickle
+import decimal
 import functools
 import os
 import re
+import StringIO
+import tarfile
 
 from nova.compute import api as compute_api
 from nova.compute import instance_types
@@ -40,6 +43,7 @@ from nova.tests import fake_network
 from nova.tests import fake_utils
 import nova.tests.image.fake as fake_image
 from nova.tests.xenapi import stubs
+from nova import utils
 from nova.virt.xenapi import agent
 from nova.virt.xenapi import driver as xenapi_conn
 from nova.virt.xenapi import fake as xenapi_fake
@@ -649,12 +653,15 @@ class XenAPIVMTestCase(stubs.XenAPITestBase):
         self.flags(flat_injected=True)
         db_fakes.stub_out_db_instance_api(self.stubs, injected=True)
 
-        self._tee_executed = False
+        self._interfaces_written = False
 
-        def _tee_handler(cmd, **kwargs):
+        def _tar_handler(cmd, **kwargs):
             input = kwargs.get('process_input', None)
             self.assertNotEqual(input, None)
-            config = [line.strip() for line in input.split("\n")]
+            tar = tarfile.open(fileobj=StringIO.StringIO(input))
+            with contextlib.closing(tar):
+                interfaces = tar.extractfile('etc/network/interfaces').read()
+            config = [line.strip() for line in interfaces.split("\n")]
             # Find the start of eth0 configuration and check it
             index = config.index('auto eth0')
             self.assertEquals(config[index + 1:index + 8], [
@@ -665,18 +672,18 @@ class XenAPIVMTestCase(stubs.XenAPITestBase):
                 'gateway 192.168.1.1',
                 'dns-nameservers 192.168.1.3 192.168.1.4',
                 ''])
-            self._tee_executed = True
+            self._interfaces_written = True
             return '', ''
 
         fake_utils.fake_execute_set_repliers([
-            # Capture the tee .../etc/network/interfaces command
-            (r'tee.*interfaces', _tee_handler),
+            # Capture the tar extracting the injected files into the guest
+            (r'tar -x', _tar_handler),
         ])
         self._test_spawn(IMAGE_MACHINE,
                          IMAGE_KERNEL,
                          IMAGE_RAMDISK,
                          check_injection=True)
-        self.assertTrue(self._tee_executed)
+        self.assertTrue(self._interfaces_written)
 
     def test_spawn_netinject_xenstore(self):
         db_fakes.stub_out_db_instance_api(self.stubs, injected=True)
@@ -1424,7 +1431,7 @@ class XenAPIBWUsageTestCase(stubs.XenAPITestBase):
         self.conn = xenapi_conn.XenAPIDriver(False)
 
     @classmethod
-    def _fake_compile_metrics(cls, start_time, stop_time=None):
+    def _fake_compile_metrics(cls, start_time, stop_time=None, prefix=None):
         raise exception.CouldNotFetchMetrics()
 
     def test_get_all_bw_usage_in_failure_case(self):
@@ -2089,6 +2096,69 @@ class VmUtilsTestCase(test.TestCase):
                         os_type='os type')
         self.assertEquals(expected, actual)
 
+    def _sparse_copy(self, chunks, virtual_size, **kwargs):
+        with utils.tempdir() as tmpdir:
+            src_path = os.path.join(tmpdir, 'src')
+            dst_path = os.path.join(tmpdir, 'dst')
+            with open(src_path, 'wb') as src:
+                for offset, data in chunks:
+                    src.seek(offset)
+                    src.write(data)
+                src.truncate(virtual_size)
+            open(dst_path, 'wb').close()
+            stats = vm_utils._sparse_copy(src_path, dst_path, virtual_size,
+                                          **kwargs)
+            with open(src_path, 'rb') as src:
+                with open(dst_path, 'rb') as dst:
+                    self.assertEqual(src.read(), dst.read())
+        return stats
+
+    def test_sparse_copy(self):
+        block = vm_utils.SPARSE_BLOCK_SIZE
+        progress = []
+        stats = self._sparse_copy([(0, 'a' * 10), (block * 5, 'b' * block),
+                                   (block * 6, '\0' * block),
+                                   (block * 9, 'c')],
+                                  block * 10, block_size=block * 4,
+                                  progress_callback=lambda *args:
+                                      progress.append(args))
+        # Holes are found at filesystem block size, which is usually
+        # smaller than SPARSE_BLOCK_SIZE
+        self.assertTrue(block < stats['bytes_copied'] <= block * 3)
+        self.assertEqual(stats['bytes_copied'] + stats['bytes_skipped'],
+                         block * 10)
+        self.assertEqual(progress[-1], (block * 10, block * 10))
+
+    def test_sparse_copy_all_holes(self):
+        stats = self._sparse_copy([], 1024 * 1024)
+        self.assertEqual(stats['bytes_copied'], 0)
+
+    def test_sparse_copy_partial_chunk(self):
+        stats = self._sparse_copy([(0, 'a' * 100)], 100, block_size=64)
+        self.assertEqual(stats['bytes_copied'], 100)
+
+    _rrd_updates = ('<xport><meta><start>60</start><end>120</end>'
+                    '<legend><entry>AVERAGE:vm:u1:vif_0_rx</entry>'
+                    '<entry>AVERAGE:vm:u1:cpu0</entry></legend></meta>'
+                    '<data><row><t>120</t><v>10.0</v><v>0.5</v></row>'
+                    '<row><t>60</t><v>20.0</v><v>NaN</v></row></data>'
+                    '</xport>')
+
+    def _parse_rrd_update(self, **kwargs):
+        return vm_utils._parse_rrd_update(
+            StringIO.StringIO(self._rrd_updates), 0, **kwargs)
+
+    def test_parse_rrd_update(self):
+        self.assertEqual(self._parse_rrd_update(),
+                         {'u1': {'vif_0_rx': decimal.Decimal('2100.0000'),
+                                 'cpu0': decimal.Decimal('0.5000')}})
+
+    def test_parse_rrd_update_prefix_and_until(self):
+        self.assertEqual(self._parse_rrd_update(prefix='vif_'),
+                         {'u1': {'vif_0_rx': decimal.Decimal('2100.0000')}})
+        self.assertEqual(self._parse_rrd_update(until=60, prefix='vif_'),
+                         {'u1': {'vif_0_rx': decimal.Decimal('1200.0000')}})
+
 
 class XenAPILiveMigrateTestCase(stubs.XenAPITestBase):
     """Unit tests for live_migration."""
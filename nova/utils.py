@@ -1135,6 +1135,59 @@ def hash_file(file_like_object):
     return checksum.hexdigest()
 
 
+def _tail_start(file_like_object, start, end, lines, block_size=65536):
+    """Returns where the last lines of file_like_object[start:end] begin.
+
+    The file is read backwards from end one block at a time, so only the
+    tail is read however long the file is.
+    """
+    count = 0
+    pos = end
+    while pos > start:
+        read_size = min(block_size, pos - start)
+        pos -= read_size
+        file_like_object.seek(pos)
+        block = file_like_object.read(read_size)
+        index = len(block)
+        while True:
+            index = block.rfind('\n', 0, index)
+            if index == -1:
+                break
+            count += 1
+            if count == lines:
+                return pos + index + 1
+    return start
+
+
+def read_file_range(file_like_object, size, offset=None, tail_length=None,
+                    max_bytes=None):
+    """Reads part of a log file without reading all of it.
+
+    With an offset, reads from offset up to max_bytes.  An offset past
+    size, from a log that was truncated, reads from the start again.
+    Without one, the range is the whole file.  tail_length then keeps
+    only the last tail_length lines of the range, which are found by
+    reading backwards from its end; a trailing newline ends an empty
+    last line.
+
+    :returns: (data, offset to read from next time)
+    """
+    start = offset or 0
+    if start < 0 or start > size:
+        start = 0
+    end = size
+    if offset is not None and max_bytes is not None:
+        end = min(size, start + max_bytes)
+
+    if tail_length is not None:
+        if tail_length <= 0:
+            return '', end
+        start = _tail_start(file_like_object, start, end, tail_length)
+
+    file_like_object.seek(start)
+    return file_like_object.read(end - start), end
+
+
 @contextlib.contextmanager
 def temporary_mutation(obj, **kwargs):
     """Temporarily set the attr on a particular object to a given value then
@@ -1164,11 +1217,10 @@ def temporary_mutation(obj, **kwargs):
 
 
 def service_is_up(service):
-    """Check whether a service is up based on last heartbeat."""
-    last_heartbeat = service['updated_at'] or service['created_at']
-    # Timestamps in DB are UTC.
-    elapsed = total_seconds(timeutils.utcnow() - last_heartbeat)
-    return abs(elapsed) <= FLAGS.service_down_time
+    """Check whether a service is up, using the servicegroup driver."""
+    # NOTE: imported here because the servicegroup drivers import utils.
+    from nova import servicegroup
+    return servicegroup.API().service_is_up(service)
 
 
 def generate_mac_address():
@@ -14,14 +14,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
 from nova.compute import power_state
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.virt.baremetal import nodes
 
+dom_opts = [
+    cfg.IntOpt('baremetal_dom_journal_size',
+               default=100,
+               help='Number of domain changes journaled before the '
+                    'bare-metal domain file is compacted'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(dom_opts)
 
 LOG = logging.getLogger(__name__)
 
@@ -38,10 +49,51 @@ def read_domains(fname):
 
 
 def write_domains(fname, domains):
+    """Atomically replaces fname with the given list of domains."""
     json = jsonutils.dumps(domains)
-    f = open(fname, 'w')
-    f.write(json)
-    f.close()
+    tmp_fname = fname + '.tmp'
+    f = open(tmp_fname, 'w')
+    try:
+        f.write(json)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.rename(tmp_fname, fname)
+
+
+def read_journal(fname):
+    """Returns the change records appended to a domain journal.
+
+    A partially written last record, left by a crash, is ignored.
+    """
+    records = []
+    try:
+        f = open(fname, 'r')
+    except IOError:
+        return records
+    try:
+        for line in f:
+            try:
+                records.append(jsonutils.loads(line))
+            except ValueError:
+                LOG.warn(_("Ignoring truncated record at the end of %s"),
+                         fname)
+                break
+    finally:
+        f.close()
+    return records
+
+
+def append_journal(fname, record):
+    """Durably appends a change record to a domain journal."""
+    f = open(fname, 'a')
+    try:
+        f.write(jsonutils.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
 
 
 class BareMetalDom(object):
@@ -49,6 +101,11 @@ class BareMetalDom(object):
     BareMetalDom class handles fake domain for bare metal back ends.
 
     This implements the singleton pattern.
+
+    Domains are kept in memory indexed by name.  Each change is appended to
+    a journal next to the domain file, and once the journal holds
+    baremetal_dom_journal_size records the domain file is rewritten (via an
+    atomic rename) and the journal is emptied.
     """
 
     _instance = None
@@ -76,32 +133,55 @@ class BareMetalDom(object):
         self._is_init = True
 
         self.fake_dom_file = fake_dom_file
-        self.domains = []
+        self.journal_file = fake_dom_file + '.journal'
+        # Domains by name, and their names in the order they were added
+        self._domains = {}
+        self._names = []
+        self._journal_records = 0
         self.fake_dom_nums = 0
         self.baremetal_nodes = nodes.get_baremetal_nodes()
 
         self._read_domain_from_file()
 
+    @property
+    def domains(self):
+        return [self._domains[name] for name in self._names]
+
+    def _add_domain(self, dom):
+        if dom['name'] not in self._domains:
+            self._names.append(dom['name'])
+        self._domains[dom['name']] = dom
+
+    def _remove_domain(self, name):
+        if self._domains.pop(name, None) is not None:
+            self._names.remove(name)
+
     def _read_domain_from_file(self):
         """
-        Reads the domains from a file.
+        Reads the domains from a file and replays the journal.
         """
         try:
-            self.domains = read_domains(self.fake_dom_file)
-        except IOError:
-            dom = []
+            domains = read_domains(self.fake_dom_file)
+        except exception.NotFound:
+            domains = []
             LOG.debug(_("No domains exist."))
-            return
+        for dom in domains:
+            self._add_domain(dom)
+        for record in read_journal(self.journal_file):
+            if 'domain' in record:
+                self._add_domain(record['domain'])
+            else:
+                self._remove_domain(record['name'])
         msg = _("============= initial domains =========== : %s")
-        LOG.debug(msg % (self.domains))
-        for dom in self.domains[:]:
+        LOG.debug(msg, self.domains)
+        for dom in self.domains:
             if dom['status'] == power_state.BUILDING:
                 LOG.debug(_("Building domain: to be removed"))
                 self.destroy_domain(dom['name'])
                 continue
             elif dom['status'] != power_state.RUNNING:
                 LOG.debug(_("Not running domain: remove"))
-                self.domains.remove(dom)
+                self._remove_domain(dom['name'])
                 continue
             res = self.baremetal_nodes.set_status(dom['node_id'],
                                     dom['status'])
@@ -109,7 +189,7 @@ class BareMetalDom(object):
                 self.fake_dom_nums = self.fake_dom_nums + 1
             else:
                 LOG.debug(_("domain running on an unknown node: discarded"))
-                self.domains.remove(dom)
+                self._remove_domain(dom['name'])
                 continue
 
         LOG.debug(self.domains)
@@ -157,12 +237,10 @@ class BareMetalDom(object):
         try:
             self.baremetal_nodes.deactivate_node(fd['node_id'])
 
-            self.domains.remove(fd)
-            msg = _("Domains: %s")
-            LOG.debug(msg % (self.domains))
-            self.store_domain()
-            msg = _("After storing domains: %s")
-            LOG.debug(msg % (self.domains))
+            self._remove_domain(name)
+            self._journal({'name': name})
+            msg = _("After removing domain %s")
+            LOG.debug(msg, name)
         except Exception:
             LOG.debug(_("deactivation/removing domain failed"))
             raise
@@ -192,9 +270,9 @@ class BareMetalDom(object):
                     'kernel_id': xml_dict['kernel_id'],
                     'ramdisk_id': xml_dict['ramdisk_id'],
                      'status': power_state.BUILDING}
-        self.domains.append(new_dom)
+        self._add_domain(new_dom)
         msg = _("Created new domain: %s")
-        LOG.debug(msg % (new_dom))
+        LOG.debug(msg, new_dom)
         self.change_domain_state(new_dom['name'], power_state.BUILDING)
 
         self.baremetal_nodes.set_image(bpath, node_id)
@@ -206,49 +284,60 @@ class BareMetalDom(object):
                 new_dom['ip_address'], new_dom['user_data'])
             self.change_domain_state(new_dom['name'], state)
         except Exception:
-            self.domains.remove(new_dom)
+            self._remove_domain(new_dom['name'])
+            self._journal({'name': new_dom['name']})
             self.baremetal_nodes.free_node(node_id)
             LOG.debug(_("Failed to boot Bare-metal node %s"), node_id)
         return state
 
     def change_domain_state(self, name, state):
         """
-        Changes domain state by the given state and updates domain file.
+        Changes domain state by the given state and journals the change.
         """
         l = self.find_domain(name)
         if l == []:
             msg = _("No such domain exists")
             raise exception.NotFound(msg)
-        i = self.domains.index(l)
-        self.domains[i]['status'] = state
+        l['status'] = state
         LOG.debug(_("change_domain_state: to new state %s"), str(state))
-        self.store_domain()
+        self._journal({'domain': l})
+
+    def _journal(self, record):
+        """
+        Journals a domain change, compacting the journal when it is full.
+        """
+        if self._journal_records >= FLAGS.baremetal_dom_journal_size:
+            self.store_domain()
+        else:
+            append_journal(self.journal_file, record)
+            self._journal_records += 1
 
     def store_domain(self):
         """
-        Stores fake domains to the file.
+        Stores fake domains to the file and empties the journal.
         """
         msg = _("Stored fake domains to the file: %s")
-        LOG.debug(msg % (self.domains))
+        LOG.debug(msg, self.domains)
         write_domains(self.fake_dom_file, self.domains)
+        if os.path.exists(self.journal_file):
+            os.unlink(self.journal_file)
+        self._journal_records = 0
 
     def find_domain(self, name):
         """
         Finds domain by the given name and returns the domain.
         """
-        for item in self.domains:
-            if item['name'] == name:
-                return item
-        LOG.debug(_("domain does not exist"))
-        return []
+        domain = self._domains.get(name)
+        if domain is None:
+            LOG.debug(_("domain does not exist"))
+            return []
+        return domain
 
     def list_domains(self):
         """
         Returns the instance name from domains list.
         """
-        if self.domains == []:
-            return []
-        return [x['name'] for x in self.domains]
+        return list(self._names)
 
     def get_domain_info(self, instance_name):
         """
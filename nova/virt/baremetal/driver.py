@@ -278,6 +278,16 @@ class BareMetalDriver(driver.ComputeDriver):
         return timer.start(interval=0.5).wait()
 
     def get_console_output(self, instance):
+        return libvirt_utils.load_file(self._get_console_output_path(instance))
+
+    def get_console_output_range(self, instance, offset=None,
+                                 tail_length=None, max_bytes=None):
+        path = self._get_console_output_path(instance)
+        return libvirt_utils.load_file_range(path, offset=offset,
+                                             tail_length=tail_length,
+                                             max_bytes=max_bytes)
+
+    def _get_console_output_path(self, instance):
         console_log = os.path.join(FLAGS.instances_path, instance['name'],
                                    'console.log')
 
@@ -287,9 +297,7 @@ class BareMetalDriver(driver.ComputeDriver):
 
         self.baremetal_nodes.get_console_output(console_log, fd['node_id'])
 
-        fpath = console_log
-
-        return libvirt_utils.load_file(fpath)
+        return console_log
 
     @exception.wrap_exception
     def get_ajax_console(self, instance):
@@ -25,10 +25,14 @@ Includes injection of SSH PGP keys into authorized_keys file.
 
 """
 
+import contextlib
 import crypt
 import os
 import random
+import StringIO
+import tarfile
 import tempfile
+import time
 
 from nova import exception
 from nova import flags
@@ -313,18 +317,35 @@ def inject_data_into_fs(fs, key, net, metadata, admin_password, files):
     """Injects data into a filesystem already mounted by the caller.
     Virt connections can call this directly if they mount their fs
     in a different way to inject_data
+
+    Everything is written with a single privileged tar, after the guest
+    files that need to be updated have been read with another one.
     """
+    prefetch = []
     if key:
-        _inject_key_into_fs(key, fs)
+        prefetch.extend(_KEY_PATHS)
     if net:
-        _inject_net_into_fs(net, fs)
+        prefetch.extend(_NET_PATHS)
     if metadata:
-        _inject_metadata_into_fs(metadata, fs)
+        prefetch.append(('meta.js',))
     if admin_password:
-        _inject_admin_password_into_fs(admin_password, fs)
+        prefetch.extend(_PASSWORD_PATHS)
+    if files:
+        prefetch.extend((path.lstrip('/'),) for (path, contents) in files)
+    manifest = _InjectionManifest(fs, prefetch)
+
+    if key:
+        _inject_key_into_fs(key, fs, manifest)
+    if net:
+        _inject_net_into_fs(net, fs, manifest)
+    if metadata:
+        _inject_metadata_into_fs(metadata, fs, manifest)
+    if admin_password:
+        _inject_admin_password_into_fs(admin_password, fs, manifest)
     if files:
         for (path, contents) in files:
-            _inject_file_into_fs(fs, path, contents)
+            _inject_file_into_fs(fs, path, contents, manifest=manifest)
+    manifest.apply()
 
 
 def _join_and_check_path_within_fs(fs, *args):
@@ -341,43 +362,176 @@ def _join_and_check_path_within_fs(fs, *args):
     return absolute_path
 
 
-def _inject_file_into_fs(fs, path, contents, append=False):
-    absolute_path = _join_and_check_path_within_fs(fs, path.lstrip('/'))
+class _InjectionManifest(object):
+    """Files and directories to write into a guest filesystem at once.
 
-    parent_dir = os.path.dirname(absolute_path)
-    utils.execute('mkdir', '-p', parent_dir, run_as_root=True)
-
-    args = []
-    if append:
-        args.append('-a')
-    args.append(absolute_path)
+    The guest files listed in prefetch are read with one privileged tar
+    when the manifest is created, and apply() writes every entry with
+    another one, instead of a mkdir, tee, chown and chmod per file.
+    Existing files keep their owner and mode unless told otherwise: the
+    files to write which were not prefetched are read before apply()
+    writes them.
+    """
 
-    kwargs = dict(process_input=contents, run_as_root=True)
+    def __init__(self, fs, prefetch=()):
+        self.fs = fs
+        self._existing = {}
+        self._fetched = set()
+        self._entries = {}
+        self._order = []
+        self._modes = {}
+        if prefetch:
+            self._fetch([self._relpath(*path) for path in prefetch])
+
+    def _relpath(self, *args):
+        absolute_path = _join_and_check_path_within_fs(self.fs, *args)
+        return os.path.relpath(absolute_path, os.path.realpath(self.fs))
+
+    def _fetch(self, relpaths):
+        self._fetched.update(relpaths)
+        out, _err = utils.execute('tar', '-c', '-f', '-', '-C', self.fs,
+                                  '--no-recursion', '--ignore-failed-read',
+                                  *relpaths, run_as_root=True)
+        if not out:
+            return
+        tar = tarfile.open(fileobj=StringIO.StringIO(out))
+        with contextlib.closing(tar):
+            for info in tar:
+                contents = None
+                if info.isfile():
+                    contents = tar.extractfile(info).read()
+                self._existing[info.name] = (info, contents)
+
+    def _lookup(self, relpath):
+        return self._entries.get(relpath) or self._existing.get(relpath)
+
+    def exists(self, *args):
+        return self._lookup(self._relpath(*args)) is not None
+
+    def read(self, *args):
+        """Returns the contents the file will have, or None."""
+        entry = self._lookup(self._relpath(*args))
+        return entry[1] if entry else None
+
+    def mode(self, *args):
+        entry = self._lookup(self._relpath(*args))
+        return entry[0].mode if entry else None
+
+    def _add(self, relpath, info, contents):
+        if relpath not in self._entries:
+            self._order.append(relpath)
+        self._entries[relpath] = (info, contents)
+
+    def add_dir(self, path, mode, uid=0, gid=0):
+        relpath = self._relpath(path)
+        info = tarfile.TarInfo(relpath)
+        info.type = tarfile.DIRTYPE
+        info.mode = mode
+        info.uid = uid
+        info.gid = gid
+        info.mtime = time.time()
+        self._add(relpath, info, None)
+
+    def add_file(self, path, contents, append=False, mode=None):
+        relpath = self._relpath(path)
+        if (append and relpath not in self._entries and
+            relpath not in self._fetched):
+            self._fetch([relpath])
+        entry = self._lookup(relpath)
+        if append and entry and entry[1]:
+            contents = entry[1] + contents
+        info = tarfile.TarInfo(relpath)
+        if entry:
+            info.mode, info.uid, info.gid = (entry[0].mode, entry[0].uid,
+                                             entry[0].gid)
+        else:
+            info.mode = 0644
+        if mode is not None:
+            info.mode = mode
+            self._modes[relpath] = mode
+        info.size = len(contents)
+        info.mtime = time.time()
+        self._add(relpath, info, contents)
+
+    def _fetch_owners(self):
+        """Gives the files about to be replaced their owner and mode."""
+        relpaths = [relpath for relpath in self._order
+                    if self._entries[relpath][0].isfile() and
+                    relpath not in self._fetched]
+        if not relpaths:
+            return
+        self._fetch(relpaths)
+        for relpath in relpaths:
+            existing = self._existing.get(relpath)
+            if existing:
+                info = self._entries[relpath][0]
+                info.uid, info.gid = existing[0].uid, existing[0].gid
+                info.mode = self._modes.get(relpath, existing[0].mode)
+
+    def apply(self):
+        """Writes all the entries into the guest filesystem."""
+        if not self._order:
+            return
+        self._fetch_owners()
+        buf = StringIO.StringIO()
+        with contextlib.closing(tarfile.open(fileobj=buf, mode='w')) as tar:
+            for relpath in self._order:
+                info, contents = self._entries[relpath]
+                fileobj = None
+                if contents is not None:
+                    fileobj = StringIO.StringIO(contents)
+                tar.addfile(info, fileobj)
+        utils.execute('tar', '-x', '-f', '-', '-C', self.fs,
+                      '--same-owner', '--same-permissions', '--numeric-owner',
+                      process_input=buf.getvalue(), run_as_root=True)
+        self._order = []
+        self._entries = {}
+        self._modes = {}
+
+
+def _inject_file_into_fs(fs, path, contents, append=False, manifest=None):
+    path = path.lstrip('/')
+    _join_and_check_path_within_fs(fs, path)
+    if manifest is not None:
+        manifest.add_file(path, contents, append=append)
+        return
 
-    utils.execute('tee', *args, **kwargs)
+    manifest = _InjectionManifest(fs)
+    manifest.add_file(path, contents, append=append)
+    manifest.apply()
 
 
-def _inject_metadata_into_fs(metadata, fs):
+def _inject_metadata_into_fs(metadata, fs, manifest):
     metadata = dict([(m.key, m.value) for m in metadata])
-    _inject_file_into_fs(fs, 'meta.js', jsonutils.dumps(metadata))
+    _inject_file_into_fs(fs, 'meta.js', jsonutils.dumps(metadata),
+                         manifest=manifest)
+
+
+# Guest files read before injecting a key, see _setup_selinux_for_keys
+_KEY_PATHS = [('root', '.ssh', 'authorized_keys'),
+              ('etc', 'selinux'),
+              ('etc', 'rc.local'),
+              ('etc', 'rc.d'),
+              ('etc', 'rc.d', 'rc.local')]
+
+_NET_PATHS = [('etc', 'network'),
+              ('etc', 'network', 'interfaces')]
+
+_PASSWORD_PATHS = [('etc', 'passwd'),
+                   ('etc', 'shadow')]
 
 
-def _setup_selinux_for_keys(fs):
+def _setup_selinux_for_keys(fs, manifest):
     """Get selinux guests to ensure correct context on injected keys."""
 
-    se_cfg = _join_and_check_path_within_fs(fs, 'etc', 'selinux')
-    se_cfg, _err = utils.trycmd('readlink', '-e', se_cfg, run_as_root=True)
-    if not se_cfg:
+    if not manifest.exists('etc', 'selinux'):
         return
 
-    rclocal = _join_and_check_path_within_fs(fs, 'etc', 'rc.local')
+    rclocal = os.path.join('etc', 'rc.local')
 
     # Support systemd based systems
-    rc_d = _join_and_check_path_within_fs(fs, 'etc', 'rc.d')
-    rclocal_e, _err = utils.trycmd('readlink', '-e', rclocal, run_as_root=True)
-    rc_d_e, _err = utils.trycmd('readlink', '-e', rc_d, run_as_root=True)
-    if not rclocal_e and rc_d_e:
-        rclocal = os.path.join(rc_d, 'rc.local')
+    if not manifest.exists(rclocal) and manifest.exists('etc', 'rc.d'):
+        rclocal = os.path.join('etc', 'rc.d', 'rc.local')
 
     # Note some systems end rc.local with "exit 0"
     # and so to append there you'd need something like:
@@ -388,21 +542,17 @@ def _setup_selinux_for_keys(fs):
         'restorecon -RF /root/.ssh/ 2>/dev/null || :\n',
     ]
 
-    rclocal_rel = os.path.relpath(rclocal, fs)
-    _inject_file_into_fs(fs, rclocal_rel, ''.join(restorecon), append=True)
-    utils.execute('chmod', 'a+x', rclocal, run_as_root=True)
+    mode = (manifest.mode(rclocal) or 0644) | 0111
+    manifest.add_file(rclocal, ''.join(restorecon), append=True, mode=mode)
 
 
-def _inject_key_into_fs(key, fs):
+def _inject_key_into_fs(key, fs, manifest):
     """Add the given public ssh key to root's authorized_keys.
 
     key is an ssh key string.
     fs is the path to the base of the filesystem into which to inject the key.
     """
-    sshdir = _join_and_check_path_within_fs(fs, 'root', '.ssh')
-    utils.execute('mkdir', '-p', sshdir, run_as_root=True)
-    utils.execute('chown', 'root', sshdir, run_as_root=True)
-    utils.execute('chmod', '700', sshdir, run_as_root=True)
+    manifest.add_dir(os.path.join('root', '.ssh'), 0700)
 
     keyfile = os.path.join('root', '.ssh', 'authorized_keys')
 
@@ -414,26 +564,25 @@ def _inject_key_into_fs(key, fs):
         '\n',
     ])
 
-    _inject_file_into_fs(fs, keyfile, key_data, append=True)
+    _inject_file_into_fs(fs, keyfile, key_data, append=True,
+                         manifest=manifest)
 
-    _setup_selinux_for_keys(fs)
+    _setup_selinux_for_keys(fs, manifest)
 
 
-def _inject_net_into_fs(net, fs):
+def _inject_net_into_fs(net, fs, manifest):
     """Inject /etc/network/interfaces into the filesystem rooted at fs.
 
     net is the contents of /etc/network/interfaces.
     """
-    netdir = _join_and_check_path_within_fs(fs, 'etc', 'network')
-    utils.execute('mkdir', '-p', netdir, run_as_root=True)
-    utils.execute('chown', 'root:root', netdir, run_as_root=True)
-    utils.execute('chmod', 755, netdir, run_as_root=True)
+    if not manifest.exists('etc', 'network'):
+        manifest.add_dir(os.path.join('etc', 'network'), 0755)
 
     netfile = os.path.join('etc', 'network', 'interfaces')
-    _inject_file_into_fs(fs, netfile, net)
+    _inject_file_into_fs(fs, netfile, net, manifest=manifest)
 
 
-def _inject_admin_password_into_fs(admin_passwd, fs):
+def _inject_admin_password_into_fs(admin_passwd, fs, manifest):
     """Set the root password to admin_passwd
 
     admin_password is a root password
@@ -444,41 +593,31 @@ def _inject_admin_password_into_fs(admin_passwd, fs):
     and does not require a guest agent running in the instance.
 
     """
-    # The approach used here is to copy the password and shadow
-    # files from the instance filesystem to local files, make any
-    # necessary changes, and then copy them back.
+    # The password and shadow files were read from the instance
+    # filesystem when the manifest was created, the updated shadow
+    # file is written back with the other injected files.
 
     admin_user = 'root'
 
-    fd, tmp_passwd = tempfile.mkstemp()
-    os.close(fd)
-    fd, tmp_shadow = tempfile.mkstemp()
-    os.close(fd)
+    passwd_data = manifest.read('etc', 'passwd') or ''
+    shadow_data = manifest.read('etc', 'shadow') or ''
+    new_shadow = _update_shadow(admin_user, admin_passwd, passwd_data,
+                                shadow_data)
+    manifest.add_file(os.path.join('etc', 'shadow'), new_shadow)
 
-    passwd_path = _join_and_check_path_within_fs(fs, 'etc', 'passwd')
-    shadow_path = _join_and_check_path_within_fs(fs, 'etc', 'shadow')
 
-    utils.execute('cp', passwd_path, tmp_passwd, run_as_root=True)
-    utils.execute('cp', shadow_path, tmp_shadow, run_as_root=True)
-    _set_passwd(admin_user, admin_passwd, tmp_passwd, tmp_shadow)
-    utils.execute('cp', tmp_passwd, passwd_path, run_as_root=True)
-    os.unlink(tmp_passwd)
-    utils.execute('cp', tmp_shadow, shadow_path, run_as_root=True)
-    os.unlink(tmp_shadow)
-
-
-def _set_passwd(username, admin_passwd, passwd_file, shadow_file):
+def _update_shadow(username, admin_passwd, passwd_data, shadow_data):
     """set the password for username to admin_passwd
 
-    The passwd_file is not modified.  The shadow_file is updated.
-    if the username is not found in both files, an exception is raised.
+    The passwd data is not modified.  The shadow data is returned updated.
+    if the username is not found in both, an exception is raised.
 
     :param username: the username
-    :param encrypted_passwd: the  encrypted password
-    :param passwd_file: path to the passwd file
-    :param shadow_file: path to the shadow password file
-    :returns: nothing
-    :raises: exception.NovaException(), IOError()
+    :param admin_passwd: the password
+    :param passwd_data: contents of the passwd file
+    :param shadow_data: contents of the shadow password file
+    :returns: the new contents of the shadow password file
+    :raises: exception.NovaException()
 
     """
     salt_set = ('abcdefghijklmnopqrstuvwxyz'
@@ -501,39 +640,25 @@ def _set_passwd(username, admin_passwd, passwd_file, shadow_file):
     if len(encrypted_passwd) == 13:
         encrypted_passwd = crypt.crypt(admin_passwd, algos['DES'] + salt)
 
-    try:
-        p_file = open(passwd_file, 'rb')
-        s_file = open(shadow_file, 'rb')
-
-        # username MUST exist in passwd file or it's an error
-        found = False
-        for entry in p_file:
-            split_entry = entry.split(':')
-            if split_entry[0] == username:
-                found = True
-                break
-        if not found:
-            msg = _('User %(username)s not found in password file.')
-            raise exception.NovaException(msg % username)
-
-        # update password in the shadow file.It's an error if the
-        # the user doesn't exist.
-        new_shadow = list()
-        found = False
-        for entry in s_file:
-            split_entry = entry.split(':')
-            if split_entry[0] == username:
-                split_entry[1] = encrypted_passwd
-                found = True
-            new_entry = ':'.join(split_entry)
-            new_shadow.append(new_entry)
-        s_file.close()
-        if not found:
-            msg = _('User %(username)s not found in shadow file.')
-            raise exception.NovaException(msg % username)
-        s_file = open(shadow_file, 'wb')
-        for entry in new_shadow:
-            s_file.write(entry)
-    finally:
-        p_file.close()
-        s_file.close()
+    # username MUST exist in passwd file or it's an error
+    for entry in passwd_data.splitlines(True):
+        if entry.split(':')[0] == username:
+            break
+    else:
+        msg = _('User %(username)s not found in password file.')
+        raise exception.NovaException(msg % locals())
+
+    # update password in the shadow file.It's an error if the
+    # the user doesn't exist.
+    new_shadow = list()
+    found = False
+    for entry in shadow_data.splitlines(True):
+        split_entry = entry.split(':')
+        if split_entry[0] == username:
+            split_entry[1] = encrypted_passwd
+            found = True
+        new_shadow.append(':'.join(split_entry))
+    if not found:
+        msg = _('User %(username)s not found in shadow file.')
+        raise exception.NovaException(msg % locals())
+    return ''.join(new_shadow)
@@ -31,6 +31,10 @@ nbd_opts = [
     cfg.IntOpt('max_nbd_devices',
                default=16,
                help='maximum number of possible nbd devices'),
+    cfg.FloatOpt('nbd_poll_interval',
+                 default=0.05,
+                 help='initial interval in seconds between checks that a NBD '
+                      'device came up, doubled up to one second'),
     ]
 
 FLAGS = flags.FLAGS
@@ -53,23 +57,47 @@ class Mount(mount.Mount):
     # like the aformentioned patch does.
     _DEVICES = ['/dev/nbd%s' % i for i in range(FLAGS.max_nbd_devices)]
 
+    # Devices handed out by this process, shared by all green threads
+    _allocated = set()
+
+    @staticmethod
+    def _device_in_use(device):
+        return os.path.exists("/sys/block/%s/pid" % os.path.basename(device))
+
+    @utils.synchronized('nbd-allocation')
     def _allocate_nbd(self):
         if not os.path.exists("/sys/block/nbd0"):
             self.error = _('nbd unavailable: module not loaded')
             return None
-        while True:
-            if not self._DEVICES:
-                # really want to log this info, not raise
-                self.error = _('No free nbd devices')
-                return None
-            device = self._DEVICES.pop()
-            if not os.path.exists("/sys/block/%s/pid" %
-                                  os.path.basename(device)):
-                break
-        return device
+        for device in self._DEVICES:
+            if device in self._allocated or self._device_in_use(device):
+                continue
+            self._allocated.add(device)
+            return device
+        # really want to log this info, not raise
+        self.error = _('No free nbd devices')
+        return None
 
+    @utils.synchronized('nbd-allocation')
     def _free_nbd(self, device):
-        self._DEVICES.append(device)
+        self._allocated.discard(device)
+
+    def _wait_for_device(self, device):
+        """Polls sysfs until qemu-nbd has connected the device.
+
+        Checks start every nbd_poll_interval seconds and back off to one
+        second, so a device that is ready quickly is used quickly.
+        """
+        deadline = time.time() + FLAGS.timeout_nbd
+        interval = FLAGS.nbd_poll_interval
+        while True:
+            if self._device_in_use(device):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, 1)
 
     def get_dev(self):
         device = self._allocate_nbd()
@@ -84,16 +112,12 @@ class Mount(mount.Mount):
 
         # NOTE(vish): this forks into another process, so give it a chance
         #             to set up before continuing
-        for _i in range(FLAGS.timeout_nbd):
-            if os.path.exists("/sys/block/%s/pid" % os.path.basename(device)):
-                self.device = device
-                break
-            time.sleep(1)
-        else:
+        if not self._wait_for_device(device):
             self.error = _('nbd device %s did not show up') % device
             self._free_nbd(device)
             return False
 
+        self.device = device
         self.linked = True
         return True
 
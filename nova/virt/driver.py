@@ -22,9 +22,12 @@ Driver base-classes:
     types that support that contract
 """
 
+import StringIO
+
 from nova.compute import power_state
 from nova import flags
 from nova.openstack.common import log as logging
+from nova import utils
 
 
 LOG = logging.getLogger(__name__)
@@ -222,6 +225,22 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_console_output_range(self, instance, offset=None,
+                                 tail_length=None, max_bytes=None):
+        """Return part of the console output and the offset it ends at.
+
+        See utils.read_file_range() for the meaning of the arguments.
+        Drivers that keep the console log in a file should override this
+        to read only the part asked for; by default the whole output is
+        fetched with get_console_output() and cut here.
+
+        :returns: (output, offset to read from next time)
+        """
+        output = self.get_console_output(instance)
+        return utils.read_file_range(StringIO.StringIO(output), len(output),
+                                     offset=offset, tail_length=tail_length,
+                                     max_bytes=max_bytes)
+
     def get_vnc_console(self, instance):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
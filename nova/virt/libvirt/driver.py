@@ -1077,6 +1077,22 @@ class LibvirtDriver(driver.ComputeDriver):
 
     @exception.wrap_exception()
     def get_console_output(self, instance):
+        return libvirt_utils.load_file(self._get_console_output_path(instance))
+
+    @exception.wrap_exception()
+    def get_console_output_range(self, instance, offset=None,
+                                 tail_length=None, max_bytes=None):
+        path = self._get_console_output_path(instance)
+        return libvirt_utils.load_file_range(path, offset=offset,
+                                             tail_length=tail_length,
+                                             max_bytes=max_bytes)
+
+    def _get_console_output_path(self, instance):
+        """Returns the file holding the console output of the instance.
+
+        Output pending on a pty console is appended to the console log
+        first.
+        """
         virt_dom = self._lookup_by_name(instance['name'])
         xml = virt_dom.XMLDesc(0)
         tree = etree.fromstring(xml)
@@ -1103,7 +1119,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if not path:
                     continue
                 libvirt_utils.chown(path, os.getuid())
-                return libvirt_utils.load_file(path)
+                return path
 
         # Try 'pty' types
         if console_types.get('pty'):
@@ -1122,9 +1138,7 @@ class LibvirtDriver(driver.ComputeDriver):
         self._chown_console_log_for_instance(instance['name'])
         data = self._flush_libvirt_console(pty)
         console_log = self._get_console_log_path(instance['name'])
-        fpath = self._append_to_file(data, console_log)
-
-        return libvirt_utils.load_file(fpath)
+        return self._append_to_file(data, console_log)
 
     @staticmethod
     def get_host_ip_addr():
@@ -344,6 +344,18 @@ def load_file(path):
         return fp.read()
 
 
+def load_file_range(path, offset=None, tail_length=None, max_bytes=None):
+    """Read part of a file, see utils.read_file_range()
+
+    :param path: File to read
+    :returns: (data, offset to read from next time)
+    """
+    with open(path, 'r') as fp:
+        return utils.read_file_range(fp, os.fstat(fp.fileno()).st_size,
+                                     offset=offset, tail_length=tail_length,
+                                     max_bytes=max_bytes)
+
+
 def file_open(*args, **kwargs):
     """Open file
 
@@ -126,6 +126,10 @@ class VMWareESXDriver(driver.ComputeDriver):
         """List VM instances."""
         return self._vmops.list_instances()
 
+    def list_instances_detail(self):
+        """List the names and power states of the VM instances."""
+        return self._vmops.list_instances_detail()
+
     def spawn(self, context, instance, image_meta, network_info,
               block_device_mapping=None):
         """Create VM instance."""
@@ -32,6 +32,8 @@ from nova import flags
 from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.virt import driver
+from nova.virt.vmwareapi import error_util
 from nova.virt.vmwareapi import network_utils
 from nova.virt.vmwareapi import vim_util
 from nova.virt.vmwareapi import vm_util
@@ -42,8 +44,15 @@ vmware_vif_driver_opt = cfg.StrOpt('vmware_vif_driver',
         default='nova.virt.vmwareapi.vif.VMWareVlanBridgeDriver',
         help='The VMWare VIF driver to configure the VIFs.')
 
+vmwareapi_inventory_opt = cfg.IntOpt('vmwareapi_inventory_cache_ttl',
+        default=10,
+        help='Number of seconds the power state, CPUs and memory collected '
+             'for all VMs by list_instances are used to answer get_info. '
+             'Set to 0 to always query the VM.')
+
 FLAGS = flags.FLAGS
 FLAGS.register_opt(vmware_vif_driver_opt)
+FLAGS.register_opt(vmwareapi_inventory_opt)
 
 LOG = logging.getLogger(__name__)
 
@@ -52,6 +61,11 @@ VMWARE_POWER_STATES = {
                     'poweredOn': power_state.RUNNING,
                     'suspended': power_state.PAUSED}
 
+# Properties fetched for every VM by a single inventory sweep
+INVENTORY_PROPERTIES = ["name", "runtime.connectionState",
+                        "runtime.powerState", "summary.config.numCpu",
+                        "summary.config.memorySizeMB"]
+
 
 class VMWareVMOps(object):
     """Management class for VM-related tasks."""
@@ -60,28 +74,115 @@ class VMWareVMOps(object):
         """Initializer."""
         self._session = session
         self._vif_driver = importutils.import_object(FLAGS.vmware_vif_driver)
+        # VM name -> VM reference, refreshed by every inventory sweep
+        self._vm_refs = {}
+        # VM name -> properties from the last inventory sweep
+        self._inventory = {}
+        self._inventory_updated_at = 0
+
+    def _get_vm_inventory(self):
+        """
+        Collects the INVENTORY_PROPERTIES of all the VMs on the host with a
+        single PropertyCollector call, rebuilds the name to VM reference
+        index from the result and returns the property dicts in the order
+        the host listed the VMs.
+        """
+        vms = self._session._call_method(vim_util, "get_objects",
+                     "VirtualMachine", INVENTORY_PROPERTIES)
+        vm_refs = {}
+        inventory = {}
+        lst_vm_props = []
+        for vm in vms:
+            props = dict((prop.name, prop.val) for prop in vm.propSet)
+            vm_name = props.get("name")
+            vm_refs[vm_name] = vm.obj
+            inventory[vm_name] = props
+            lst_vm_props.append(props)
+        self._vm_refs = vm_refs
+        self._inventory = inventory
+        self._inventory_updated_at = time.time()
+        return lst_vm_props
+
+    def _get_vm_props(self, vm_name, properties):
+        """
+        Fetches the properties of a VM through the name index with a single
+        call. Returns None if the VM is not indexed or if the indexed
+        reference no longer points to a VM with that name.
+        """
+        vm_ref = self._vm_refs.get(vm_name)
+        if vm_ref is None:
+            return None
+        try:
+            vm_props = self._session._call_method(vim_util,
+                        "get_object_properties", None, vm_ref,
+                        "VirtualMachine", ["name"] + properties)
+        except error_util.VimFaultException:
+            vm_props = []
+        for elem in vm_props:
+            props = dict((prop.name, prop.val) for prop in elem.propSet)
+            if props.get("name") == vm_name:
+                return props
+        self._forget_vm(vm_name)
+        return None
+
+    def _invalidate_vm(self, vm_name):
+        """Drops the inventory entry of a VM whose state has changed."""
+        self._inventory.pop(vm_name, None)
+
+    def _forget_vm(self, vm_name):
+        """Drops a VM that is gone from the index and the inventory."""
+        self._vm_refs.pop(vm_name, None)
+        self._inventory.pop(vm_name, None)
+
+    @staticmethod
+    def _is_vm_accessible(props):
+        # Ignoring the oprhaned or inaccessible VMs
+        return props.get("runtime.connectionState") not in ["orphaned",
+                                                            "inaccessible"]
+
+    @staticmethod
+    def _vm_info_from_props(props):
+        """Builds the get_info dict out of the VM properties."""
+        max_mem = None
+        num_cpu = None
+        pwr_state = None
+        if props.get("summary.config.memorySizeMB") is not None:
+            # In MB, but we want in KB
+            max_mem = int(props["summary.config.memorySizeMB"]) * 1024
+        if props.get("summary.config.numCpu") is not None:
+            num_cpu = int(props["summary.config.numCpu"])
+        if props.get("runtime.powerState") is not None:
+            pwr_state = VMWARE_POWER_STATES[props["runtime.powerState"]]
+        return {'state': pwr_state,
+                'max_mem': max_mem,
+                'mem': max_mem,
+                'num_cpu': num_cpu,
+                'cpu_time': 0}
 
     def list_instances(self):
         """Lists the VM instances that are registered with the ESX host."""
         LOG.debug(_("Getting list of instances"))
-        vms = self._session._call_method(vim_util, "get_objects",
-                     "VirtualMachine",
-                     ["name", "runtime.connectionState"])
-        lst_vm_names = []
-        for vm in vms:
-            vm_name = None
-            conn_state = None
-            for prop in vm.propSet:
-                if prop.name == "name":
-                    vm_name = prop.val
-                elif prop.name == "runtime.connectionState":
-                    conn_state = prop.val
-            # Ignoring the oprhaned or inaccessible VMs
-            if conn_state not in ["orphaned", "inaccessible"]:
-                lst_vm_names.append(vm_name)
+        lst_vm_names = [props.get("name")
+                        for props in self._get_vm_inventory()
+                        if self._is_vm_accessible(props)]
         LOG.debug(_("Got total of %s instances") % str(len(lst_vm_names)))
         return lst_vm_names
 
+    def list_instances_detail(self):
+        """
+        Lists the name and power state of the VM instances that are
+        registered with the ESX host.
+        """
+        instance_infos = []
+        for props in self._get_vm_inventory():
+            if not self._is_vm_accessible(props):
+                continue
+            pwr_state = VMWARE_POWER_STATES.get(
+                props.get("runtime.powerState"), power_state.NOSTATE)
+            instance_infos.append(driver.InstanceInfo(props.get("name"),
+                                                      pwr_state))
+        return instance_infos
+
     def spawn(self, context, instance, image_meta, network_info):
         """
         Creates a VM instance.
@@ -338,6 +439,7 @@ class VMWareVMOps(object):
             self._session._wait_for_task(instance['uuid'], power_on_task)
             LOG.debug(_("Powered on the VM instance"), instance=instance)
         _power_on_vm()
+        self._invalidate_vm(instance.name)
 
     def snapshot(self, context, instance, snapshot_name):
         """Create snapshot from a running VM instance.
@@ -534,11 +636,13 @@ class VMWareVMOps(object):
             self._session._call_method(self._session._get_vim(), "RebootGuest",
                                        vm_ref)
             LOG.debug(_("Rebooted guest OS of VM"), instance=instance)
+            self._invalidate_vm(instance.name)
         else:
             LOG.debug(_("Doing hard reboot of VM"), instance=instance)
             reset_task = self._session._call_method(self._session._get_vim(),
                                                     "ResetVM_Task", vm_ref)
             self._session._wait_for_task(instance['uuid'], reset_task)
+            self._invalidate_vm(instance.name)
             LOG.debug(_("Did hard reboot of VM"), instance=instance)
 
     def destroy(self, instance, network_info):
@@ -587,6 +691,7 @@ class VMWareVMOps(object):
                 LOG.warn(_("In vmwareapi:vmops:destroy, got this exception"
                            " while un-registering the VM: %s") % str(excep),
                          instance=instance)
+            self._forget_vm(instance.name)
 
             self._unplug_vifs(instance, network_info)
 
@@ -642,6 +747,7 @@ class VMWareVMOps(object):
             suspend_task = self._session._call_method(self._session._get_vim(),
                     "SuspendVM_Task", vm_ref)
             self._session._wait_for_task(instance['uuid'], suspend_task)
+            self._invalidate_vm(instance.name)
             LOG.debug(_("Suspended the VM"), instance=instance)
         # Raise Exception if VM is poweredOff
         elif pwr_state == "poweredOff":
@@ -666,41 +772,35 @@ class VMWareVMOps(object):
                                         self._session._get_vim(),
                                        "PowerOnVM_Task", vm_ref)
             self._session._wait_for_task(instance['uuid'], suspend_task)
+            self._invalidate_vm(instance.name)
             LOG.debug(_("Resumed the VM"), instance=instance)
         else:
             reason = _("instance is not in a suspended state")
             raise exception.InstanceResumeFailure(reason=reason)
 
     def get_info(self, instance):
-        """Return data about the VM instance."""
-        vm_ref = self._get_vm_ref_from_the_name(instance['name'])
-        if vm_ref is None:
-            raise exception.InstanceNotFound(instance_id=instance['name'])
-
-        lst_properties = ["summary.config.numCpu",
-                    "summary.config.memorySizeMB",
-                    "runtime.powerState"]
-        vm_props = self._session._call_method(vim_util,
-                    "get_object_properties", None, vm_ref, "VirtualMachine",
-                    lst_properties)
-        max_mem = None
-        pwr_state = None
-        num_cpu = None
-        for elem in vm_props:
-            for prop in elem.propSet:
-                if prop.name == "summary.config.numCpu":
-                    num_cpu = int(prop.val)
-                elif prop.name == "summary.config.memorySizeMB":
-                    # In MB, but we want in KB
-                    max_mem = int(prop.val) * 1024
-                elif prop.name == "runtime.powerState":
-                    pwr_state = VMWARE_POWER_STATES[prop.val]
+        """
+        Return data about the VM instance.
 
-        return {'state': pwr_state,
-                'max_mem': max_mem,
-                'mem': max_mem,
-                'num_cpu': num_cpu,
-                'cpu_time': 0}
+        The last inventory sweep answers without any call while it is
+        younger than vmwareapi_inventory_cache_ttl, so a list_instances
+        followed by get_info for every instance costs a single call. Else
+        the indexed VM reference is queried directly, and only a VM missing
+        from the index costs a new sweep.
+        """
+        vm_name = instance['name']
+        props = None
+        age = time.time() - self._inventory_updated_at
+        if age < FLAGS.vmwareapi_inventory_cache_ttl:
+            props = self._inventory.get(vm_name)
+        if props is None:
+            props = self._get_vm_props(vm_name, INVENTORY_PROPERTIES[1:])
+        if props is None:
+            self._get_vm_inventory()
+            props = self._inventory.get(vm_name)
+        if props is None:
+            raise exception.InstanceNotFound(instance_id=vm_name)
+        return self._vm_info_from_props(props)
 
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics."""
@@ -815,12 +915,9 @@ class VMWareVMOps(object):
 
     def _get_vm_ref_from_the_name(self, vm_name):
         """Get reference to the VM with the name specified."""
-        vms = self._session._call_method(vim_util, "get_objects",
-                    "VirtualMachine", ["name"])
-        for vm in vms:
-            if vm.propSet[0].val == vm_name:
-                return vm.obj
-        return None
+        if self._get_vm_props(vm_name, []) is None:
+            self._get_vm_inventory()
+        return self._vm_refs.get(vm_name)
 
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
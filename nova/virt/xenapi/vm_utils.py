@@ -20,11 +20,17 @@ Helper methods for operations related to the management of VM records and
 their attributes like VDIs, VIFs, as well as their lookup functions.
 """
 
+import base64
 import contextlib
 import cPickle as pickle
 import decimal
+import errno
+import httplib
+import io
+import math
 import os
 import re
+import stat
 import time
 import urllib
 import urlparse
@@ -33,6 +39,7 @@ from xml.dom import minidom
 from xml.parsers import expat
 
 from eventlet import greenthread
+from lxml import etree
 
 from nova import block_device
 from nova.compute import instance_types
@@ -78,6 +85,9 @@ xenapi_vm_utils_opts = [
                      'resize down (False will use standard dd). This speeds '
                      'up resizes down considerably since large runs of zeros '
                      'won\'t have to be rsynced'),
+    cfg.IntOpt('xenapi_sparse_copy_chunk_size',
+               default=1024 * 1024,
+               help='Size in bytes of the reads done by sparse_copy'),
     cfg.IntOpt('xenapi_num_vbd_unplug_retries',
                default=10,
                help='Maximum number of retries to unplug VBD'),
@@ -1263,17 +1273,26 @@ def compile_diagnostics(record):
         return {"Unable to retrieve diagnostics": e}
 
 
-def compile_metrics(start_time, stop_time=None):
+def compile_metrics(start_time, stop_time=None, prefix=None):
     """Compile bandwidth usage, cpu, and disk metrics for all VMs on
-       this host"""
+       this host, or only the metrics whose name starts with prefix"""
     start_time = int(start_time)
 
-    xml = _get_rrd_updates(_get_rrd_server(), start_time)
-    if xml:
-        doc = minidom.parseString(xml)
-        return _parse_rrd_update(doc, start_time, stop_time)
+    server = _get_rrd_server()
+    stream = _get_rrd_updates(server, start_time)
+    if stream is None:
+        raise exception.CouldNotFetchMetrics()
 
-    raise exception.CouldNotFetchMetrics()
+    try:
+        metrics = _parse_rrd_update(stream, start_time, stop_time, prefix)
+        # Drain what the parser left so the connection can be reused
+        stream.read()
+        return metrics
+    except (IOError, httplib.HTTPException, etree.XMLSyntaxError):
+        LOG.exception(_('Unable to read RRD XML updates with '
+                        'server details: %(server)s.') % locals())
+        _close_rrd_connection(server)
+        raise exception.CouldNotFetchMetrics()
 
 
 def _scan_sr(session, sr_ref=None):
@@ -1396,63 +1415,82 @@ def _get_rrd(server, vm_uuid):
         return None
 
 
+# (scheme, netloc) -> HTTP connection kept open to the RRD server
+_rrd_connections = {}
+
+
+def _get_rrd_connection(server):
+    conn = _rrd_connections.get(tuple(server))
+    if conn is None:
+        if server[0] == 'https':
+            conn = httplib.HTTPSConnection(server[1])
+        else:
+            conn = httplib.HTTPConnection(server[1])
+        _rrd_connections[tuple(server)] = conn
+    return conn
+
+
+def _close_rrd_connection(server):
+    conn = _rrd_connections.pop(tuple(server), None)
+    if conn is not None:
+        conn.close()
+
+
 def _get_rrd_updates(server, start_time):
-    """Return the RRD updates XML as a string"""
-    try:
-        xml = urllib.urlopen("%s://%s:%s@%s/rrd_updates?start=%s" % (
-            server[0],
-            FLAGS.xenapi_connection_username,
-            FLAGS.xenapi_connection_password,
-            server[1],
-            start_time))
-        return xml.read()
-    except IOError:
-        LOG.exception(_('Unable to obtain RRD XML updates with '
-                        'server details: %(server)s.') % locals())
-        return None
+    """Return a stream of the RRD updates XML.
 
+    The request goes over a connection that is kept open between polls,
+    and the caller is expected to read the whole response.
+    """
+    credentials = '%s:%s' % (FLAGS.xenapi_connection_username,
+                             FLAGS.xenapi_connection_password)
+    headers = {'Authorization': 'Basic %s' % base64.b64encode(credentials)}
+    path = '/rrd_updates?start=%s' % start_time
+    # A connection kept open may have been closed by the server since the
+    # last poll, so a request that fails is retried once on a new one.
+    for attempt in (1, 2):
+        conn = _get_rrd_connection(server)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            break
+        except (IOError, httplib.HTTPException):
+            _close_rrd_connection(server)
+            if attempt == 2:
+                LOG.exception(_('Unable to obtain RRD XML updates with '
+                                'server details: %(server)s.') % locals())
+                return None
+
+    if response.status != httplib.OK:
+        LOG.error(_('Unable to obtain RRD XML updates with server details: '
+                    '%(server)s, got HTTP status %(status)s.') %
+                  {'server': server, 'status': response.status})
+        response.read()
+        return None
+    return response
 
-def _parse_rrd_meta(doc):
-    data = {}
-    meta = doc.getElementsByTagName('meta')[0]
-    for tag in ('start', 'end', 'step'):
-        data[tag] = int(meta.getElementsByTagName(tag)[0].firstChild.data)
-    legend = meta.getElementsByTagName('legend')[0]
-    data['legend'] = [child.firstChild.data for child in legend.childNodes]
-    return data
 
+def _to_decimal(val):
+    return decimal.Decimal(repr(val)).quantize(decimal.Decimal('1.0000'))
 
-def _parse_rrd_data(doc):
-    dnode = doc.getElementsByTagName('data')[0]
-    return [dict(
-            time=int(child.getElementsByTagName('t')[0].firstChild.data),
-            values=[decimal.Decimal(valnode.firstChild.data)
-                  for valnode in child.getElementsByTagName('v')])
-            for child in dnode.childNodes]
 
+class _SeriesAverage(object):
+    """Averages the finite values of a column."""
 
-def _parse_rrd_update(doc, start, until=None):
-    sum_data = {}
-    meta = _parse_rrd_meta(doc)
-    data = _parse_rrd_data(doc)
-    for col, collabel in enumerate(meta['legend']):
-        _datatype, _objtype, uuid, name = collabel.split(':')
-        vm_data = sum_data.get(uuid, dict())
-        if name.startswith('vif'):
-            vm_data[name] = _integrate_series(data, col, start, until)
-        else:
-            vm_data[name] = _average_series(data, col, until)
-        sum_data[uuid] = vm_data
-    return sum_data
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
 
+    def add(self, row_time, val):
+        if not (math.isnan(val) or math.isinf(val)):
+            self.total += val
+            self.count += 1
 
-def _average_series(data, col, until=None):
-    vals = [row['values'][col] for row in data
-            if (not until or (row['time'] <= until)) and
-                row['values'][col].is_finite()]
-    if vals:
+    def result(self, start):
+        if not self.count:
+            return decimal.Decimal('0.0000')
         try:
-            return (sum(vals) / len(vals)).quantize(decimal.Decimal('1.0000'))
+            return _to_decimal(self.total / self.count)
         except decimal.InvalidOperation:
             # (mdragon) Xenserver occasionally returns odd values in
             # data that will throw an error on averaging (see bug 918490)
@@ -1461,36 +1499,92 @@ def _average_series(data, col, until=None):
             # We *think* we've got the the cases covered, but just in
             # case, log and return NaN, so we don't break reporting of
             # other statistics.
-            LOG.error(_("Invalid statistics data from Xenserver: %s")
-                      % str(vals))
+            LOG.error(_("Invalid statistics data from Xenserver: sum "
+                        "%(total)s of %(count)d values") % self.__dict__)
             return decimal.Decimal('NaN')
-    else:
-        return decimal.Decimal('0.0000')
-
-
-def _integrate_series(data, col, start, until=None):
-    total = decimal.Decimal('0.0000')
-    prev_time = int(start)
-    prev_val = None
-    for row in reversed(data):
-        if not until or (row['time'] <= until):
-            time = row['time']
-            val = row['values'][col]
-            if val.is_nan():
-                val = decimal.Decimal('0.0000')
-            if prev_val is None:
-                prev_val = val
-            if prev_val >= val:
-                total += ((val * (time - prev_time)) +
-                          (decimal.Decimal('0.5000') * (prev_val - val) *
-                          (time - prev_time)))
+
+
+class _SeriesIntegral(object):
+    """Integrates a column over time with the trapezoidal rule.
+
+    Rows can come in either time order: each pair of consecutive rows adds
+    its trapezoid, and the oldest row's value is held back to start.
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.prev_time = None
+        self.prev_val = None
+        self.oldest_time = None
+        self.oldest_val = None
+
+    def add(self, row_time, val):
+        if math.isnan(val):
+            val = 0.0
+        if self.prev_time is not None:
+            self.total += (0.5 * (self.prev_val + val) *
+                           abs(row_time - self.prev_time))
+        self.prev_time = row_time
+        self.prev_val = val
+        if self.oldest_time is None or row_time < self.oldest_time:
+            self.oldest_time = row_time
+            self.oldest_val = val
+
+    def result(self, start):
+        total = self.total
+        if self.oldest_time is not None:
+            total += self.oldest_val * (self.oldest_time - start)
+        return _to_decimal(total)
+
+
+def _new_series(collabel):
+    """vif columns are integrated over time and the others averaged."""
+    _datatype, _objtype, _uuid, name = collabel.split(':')
+    if name.startswith('vif'):
+        return _SeriesIntegral()
+    return _SeriesAverage()
+
+
+def _parse_rrd_update(stream, start, until=None, prefix=None):
+    """Aggregates an RRD updates XML stream per VM without building a DOM.
+
+    Values are summed as floats and the results returned as Decimals
+    rounded to 4 places.  Only the rows up to until are used, and only the
+    columns whose metric name starts with prefix when one is given.
+    """
+    legend = []
+    series = None
+    for _event, elem in etree.iterparse(stream):
+        if elem.tag == 'entry':
+            if not prefix or elem.text.split(':')[3].startswith(prefix):
+                legend.append((len(legend), elem.text))
             else:
-                total += ((prev_val * (time - prev_time)) +
-                          (decimal.Decimal('0.5000') * (val - prev_val) *
-                          (time - prev_time)))
-            prev_time = time
-            prev_val = val
-    return total.quantize(decimal.Decimal('1.0000'))
+                legend.append((None, elem.text))
+        elif elem.tag == 'row':
+            if series is None:
+                legend = [(col, collabel) for col, collabel in legend
+                          if col is not None]
+                series = [_new_series(collabel) for _col, collabel in legend]
+            row_time = int(elem.findtext('t'))
+            if not until or row_time <= until:
+                valnodes = elem.findall('v')
+                for (col, _collabel), aggregate in zip(legend, series):
+                    aggregate.add(row_time, float(valnodes[col].text))
+            # Drop the rows already aggregated to keep memory flat
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+    if series is None:
+        legend = [(col, collabel) for col, collabel in legend
+                  if col is not None]
+        series = [_new_series(collabel) for _col, collabel in legend]
+    sum_data = {}
+    for (_col, collabel), aggregate in zip(legend, series):
+        _datatype, _objtype, uuid, name = collabel.split(':')
+        vm_data = sum_data.setdefault(uuid, {})
+        vm_data[name] = aggregate.result(int(start))
+    return sum_data
 
 
 def _get_all_vdis_in_sr(session, sr_ref):
@@ -1795,13 +1889,89 @@ def _resize_part_and_fs(dev, start, old_sectors, new_sectors):
     utils.execute('tune2fs', '-j', partition_path, run_as_root=True)
 
 
-def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
-    """Copy data, skipping long runs of zeros to create a sparse file."""
+# NOTE: os.SEEK_DATA and os.SEEK_HOLE are not exposed before python 3.3,
+# these are the Linux values.
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+# Granularity of the holes punched in the destination within a chunk
+SPARSE_BLOCK_SIZE = 64 * 1024
+
+
+def _data_extents(fd, size):
+    """Yields the (start, end) ranges of fd that may hold data.
+
+    Uses SEEK_DATA/SEEK_HOLE so that holes in the source are never read.
+    Sources that don't support them (block devices on older kernels, NFS)
+    are reported as a single extent.
+    """
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, SEEK_DATA)
+            end = os.lseek(fd, start, SEEK_HOLE)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # Nothing but a hole up to the end of the file
+                return
+            if e.errno != errno.EINVAL or offset:
+                raise
+            yield 0, size
+            return
+        if start >= size:
+            return
+        end = min(end, size)
+        yield start, end
+        offset = end
+
+
+def _write_sparse(dst, buf, length, offset, zeros):
+    """Writes the first length bytes of buf at offset, skipping zeros.
+
+    buffer() slices are compared and written so that no data is copied.
+    Returns the number of bytes skipped.
+    """
+    if buffer(buf, 0, length) == buffer(zeros, 0, length):
+        return length
+
+    skipped = 0
+    run_start = None
+    for pos in xrange(0, length, SPARSE_BLOCK_SIZE):
+        size = min(SPARSE_BLOCK_SIZE, length - pos)
+        if buffer(buf, pos, size) == buffer(zeros, 0, size):
+            skipped += size
+            if run_start is not None:
+                dst.seek(offset + run_start)
+                dst.write(buffer(buf, run_start, pos - run_start))
+                run_start = None
+        elif run_start is None:
+            run_start = pos
+    if run_start is not None:
+        dst.seek(offset + run_start)
+        dst.write(buffer(buf, run_start, length - run_start))
+    return skipped
+
+
+def _sparse_copy(src_path, dst_path, virtual_size, block_size=None,
+                 progress_callback=None):
+    """Copy data, skipping holes and runs of zeros to create a sparse file.
+
+    Only the data extents of the source are read, in block_size chunks
+    (xenapi_sparse_copy_chunk_size by default) into a single preallocated
+    buffer.  Chunks, and then SPARSE_BLOCK_SIZE blocks, that are all zeros
+    are not written.
+
+    :param progress_callback: called with (bytes done, virtual_size) after
+                              each chunk
+    :returns: dict of bytes_copied, bytes_skipped, duration and throughput
+              in MB/s
+    """
     start_time = time.time()
-    EMPTY_BLOCK = '\0' * block_size
-    bytes_read = 0
-    skipped_bytes = 0
-    left = virtual_size
+    block_size = block_size or FLAGS.xenapi_sparse_copy_chunk_size
+    buf = bytearray(block_size)
+    zeros = '\0' * block_size
+    bytes_copied = 0
+    last_log = start_time
 
     LOG.debug(_("Starting sparse_copy src=%(src_path)s dst=%(dst_path)s "
                 "virtual_size=%(virtual_size)d block_size=%(block_size)d"),
@@ -1812,31 +1982,54 @@ def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
     # ownership of the devices.
     with utils.temporary_chown(src_path):
         with utils.temporary_chown(dst_path):
-            with open(src_path, "r") as src:
-                with open(dst_path, "w") as dst:
-                    data = src.read(min(block_size, left))
-                    while data:
-                        if data == EMPTY_BLOCK:
-                            dst.seek(block_size, os.SEEK_CUR)
-                            left -= block_size
-                            bytes_read += block_size
-                            skipped_bytes += block_size
-                        else:
-                            dst.write(data)
-                            data_len = len(data)
-                            left -= data_len
-                            bytes_read += data_len
-
-                        if left <= 0:
+            with io.open(src_path, "rb", buffering=0) as src:
+                with io.open(dst_path, "wb", buffering=0) as dst:
+                    for start, end in _data_extents(src.fileno(),
+                                                    virtual_size):
+                        src.seek(start)
+                        offset = start
+                        while offset < end:
+                            # Reading past the end of the extent only
+                            # reads the hole after it, which is ignored
+                            length = min(src.readinto(buf), end - offset)
+                            if length <= 0:
+                                break
+                            skipped = _write_sparse(dst, buf, length,
+                                                    offset, zeros)
+                            bytes_copied += length - skipped
+                            offset += length
+
+                            if progress_callback:
+                                progress_callback(offset, virtual_size)
+                            now = time.time()
+                            if now - last_log > 30:
+                                last_log = now
+                                LOG.debug(_("sparse_copy of %(src_path)s "
+                                            "at %(offset)d of "
+                                            "%(virtual_size)d bytes"),
+                                          locals())
+                        if offset < end:
+                            # Source is shorter than virtual_size
                             break
 
-                        data = src.read(min(block_size, left))
+                    # Holes at the end are never written, give a regular
+                    # file its full size
+                    if stat.S_ISREG(os.fstat(dst.fileno()).st_mode):
+                        dst.truncate(virtual_size)
+
+    if progress_callback:
+        progress_callback(virtual_size, virtual_size)
 
     duration = time.time() - start_time
-    compression_pct = float(skipped_bytes) / bytes_read * 100
+    skipped_bytes = virtual_size - bytes_copied
+    compression_pct = float(skipped_bytes) / max(virtual_size, 1) * 100
+    throughput = virtual_size / max(duration, 0.000001) / (1024 * 1024)
 
     LOG.debug(_("Finished sparse_copy in %(duration).2f secs, "
+                "%(throughput).2f MB/s, %(bytes_copied)d bytes written, "
                 "%(compression_pct).2f%% reduction in size"), locals())
+    return dict(bytes_copied=bytes_copied, bytes_skipped=skipped_bytes,
+                duration=duration, throughput=throughput)
 
 
 def _copy_partition(session, src_ref, dst_ref, partition, virtual_size):
@@ -1192,7 +1192,8 @@ class VMOps(object):
         """Return bandwidth usage info for each interface on each
            running VM"""
         try:
-            metrics = vm_utils.compile_metrics(start_time, stop_time)
+            metrics = vm_utils.compile_metrics(start_time, stop_time,
+                                               prefix='vif_')
         except exception.CouldNotFetchMetrics:
             LOG.exception(_("Could not get bandwidth info."))
             return {}
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compares creating the instance records of a multi-instance boot one at a
+time, the way the filter scheduler used to, with the bulk
+create_instance_db_entries() it uses now.  Runs against a sqlite
+database built from the migrations, like the unit tests use, and counts
+the SQL statements each way issues.
+
+Usage:
+
+    python tools/benchmarks/bulk_instance_create.py [instances] [directory]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from sqlalchemy import event
+
+from nova.compute import instance_types
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import session
+from nova import flags
+from nova.scheduler import driver
+from nova.scheduler import filter_scheduler
+
+
+def make_request_spec(num_instances):
+    instance_type = instance_types.get_default_instance_type()
+    image = {'id': 1, 'properties': {'kernel_id': 'kernel',
+                                     'ramdisk_id': 'ramdisk',
+                                     'architecture': 'x86_64'}}
+    base_options = {'instance_type_id': instance_type['id'],
+                    'user_id': 'user', 'project_id': 'project',
+                    'image_ref': 1, 'display_name': None,
+                    'metadata': dict(('key%d' % i, 'value')
+                                     for i in xrange(5))}
+    return {'image': image,
+            'instance_properties': base_options,
+            'instance_type': instance_type,
+            'num_instances': num_instances,
+            'block_device_mapping': [],
+            'security_group': ['default']}
+
+
+def one_at_a_time(scheduler, ctxt, num_instances, hosts):
+    """The loop _provision_resource used to run, without the casts."""
+    request_spec = make_request_spec(num_instances)
+    for num, host in enumerate(hosts):
+        request_spec['instance_properties']['launch_index'] = num
+        instance = scheduler.create_instance_db_entry(ctxt, request_spec,
+                                                      None)
+        driver.cast_to_compute_host(ctxt, host, 'run_instance',
+                                    instance_uuid=instance['uuid'])
+        del request_spec['instance_properties']['uuid']
+
+
+def bulk(scheduler, ctxt, num_instances, hosts):
+    request_spec = make_request_spec(num_instances)
+    scheduler.create_instance_db_entries(ctxt, request_spec, None, hosts)
+
+
+def main():
+    num_instances = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    tmpdir = tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2 else None)
+    flags.FLAGS(['bulk_instance_create',
+                 '--sql_connection=sqlite:///%s/nova.sqlite' % tmpdir,
+                 '--notification_driver=nova.openstack.common.notifier.'
+                 'no_op_notifier',
+                 '--rpc_backend=nova.openstack.common.rpc.impl_fake'])
+    try:
+        migration.db_sync()
+        statements = []
+        event.listen(session.get_engine(), 'before_cursor_execute',
+                     lambda *args: statements.append(1))
+
+        scheduler = filter_scheduler.FilterScheduler()
+        ctxt = context.RequestContext('user', 'project', is_admin=True)
+        hosts = ['host%d' % (i % 50) for i in xrange(num_instances)]
+        print '%-16s %10s %12s %12s' % ('create', 'seconds', 'instances/s',
+                                        'statements')
+        for name, create in (('one at a time', one_at_a_time),
+                             ('bulk', bulk)):
+            del statements[:]
+            start = time.time()
+            create(scheduler, ctxt, num_instances, hosts)
+            elapsed = time.time() - start
+            print '%-16s %10.2f %12.1f %12d' % (
+                name, elapsed, num_instances / elapsed, len(statements))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures LOG.debug() calls per second with the logger at INFO level, with
+a request context and an instance, the way compute and scheduler code
+logs.  The 'process first' column is the old ContextAdapter behaviour of
+building the record extras before the level check.
+
+Usage:
+
+    python tools/benchmarks/log_disabled.py [iterations]
+"""
+
+import logging
+import os
+import sys
+import timeit
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from nova import context
+from nova.openstack.common import log
+
+
+def process_first(adapter, msg, *args, **kwargs):
+    msg, kwargs = adapter.process(msg, kwargs)
+    adapter.logger.debug(msg, *args, **kwargs)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    adapter = log.getLogger('nova.benchmark')
+    adapter.logger.setLevel(logging.INFO)
+    ctxt = context.RequestContext('user', 'project')
+    instance = {'uuid': 'b2b1d8a4-6b8f-4a1f-9c35-2f4e1a0f0cde'}
+    host = 'host1'
+
+    def eager():
+        process_first(adapter,
+                      'Host filter passes for %(host)s' % {'host': host},
+                      context=ctxt, instance=instance)
+
+    def lazy():
+        adapter.debug('Host filter passes for %(host)s', {'host': host},
+                      context=ctxt, instance=instance)
+
+    print '%-28s %14s' % ('call', 'calls/sec')
+    for name, func in (('process first, eager format', eager),
+                       ('level check first, lazy', lazy)):
+        elapsed = timeit.timeit(func, number=iterations)
+        print '%-28s %14d' % (name, iterations / elapsed)
+
+
+if __name__ == '__main__':
+    main()
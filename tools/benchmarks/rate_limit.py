@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the overhead of the compute API RateLimitingMiddleware per request
+for a mix of verbs and users, with the default limits plus a number of
+extra per-URI limits.  The 'before' row is the old middleware, which
+matched each limit's raw regex for every user level and built the limits
+display on every request.  The MemcachedLimiter is measured when
+--memcached_servers is given.
+
+Usage:
+
+    python tools/benchmarks/rate_limit.py [requests] [extra limits] [users]
+        [--memcached_servers=host:port]
+"""
+
+import os
+import re
+import sys
+import time
+
+import webob
+import webob.dec
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from nova.api.openstack.compute import limits
+from nova import context
+from nova import flags
+
+
+class OldLimiter(limits.Limiter):
+    """The check loop as it was: one re.match() per limit and user, and
+    the limits display built right away."""
+
+    def check_for_delay(self, verb, url, username=None):
+        delays = []
+        for limit in self.levels[username]:
+            if limit.verb != verb or not re.match(limit.regex, url):
+                continue
+            delay = limit.fill()
+            if delay:
+                delays.append((delay, limit.error_message))
+        self.get_limits(username)
+        if delays:
+            delays.sort()
+            return delays[0]
+        return None, None
+
+
+@webob.dec.wsgify
+def empty_app(request):
+    return webob.Response()
+
+
+def make_limits(extra):
+    # Large values so that no request is rate limited
+    result = [limits.Limit(limit.verb, limit.uri, limit.regex,
+                           1000000, limit.unit)
+              for limit in limits.DEFAULT_LIMITS]
+    for i in xrange(extra):
+        result.append(limits.Limit("POST", "*/os-ext%d" % i,
+                                   "^/v2/[^/]+/os-ext%d" % i,
+                                   1000000, limits.PER_MINUTE))
+    return result
+
+
+def make_requests(count, users):
+    paths = ["/v2/%s/servers", "/v2/%s/servers/detail?changes-since=x",
+             "/v2/%s/servers/1/action", "/v2/%s/os-ext3"]
+    verbs = ["GET", "POST", "PUT", "DELETE"]
+    requests = []
+    for i in xrange(count):
+        project = "project%d" % (i % users)
+        request = webob.Request.blank(paths[i % len(paths)] % project,
+                                      method=verbs[i % len(verbs)])
+        request.environ["nova.context"] = context.RequestContext(
+            "user%d" % (i % users), project)
+        requests.append(request)
+    return requests
+
+
+def run(app, requests):
+    start = time.time()
+    for request in requests:
+        request.get_response(app)
+    return (time.time() - start) / len(requests) * 1e6
+
+
+def main():
+    args = flags.FLAGS(sys.argv)
+    count = int(args[1]) if len(args) > 1 else 20000
+    extra = int(args[2]) if len(args) > 2 else 20
+    users = int(args[3]) if len(args) > 3 else 100
+    requests = make_requests(count, users)
+    base = run(empty_app, requests)
+    print '%d requests, %d limits, %d users' % (count, 5 + extra, users)
+    print '%-24s %14s %14s' % ('limiter', 'us/request', 'overhead us')
+    print '%-24s %14.1f %14s' % ('no middleware', base, '-')
+    limiters = [('before', OldLimiter),
+                ('Limiter', limits.Limiter)]
+    if flags.FLAGS.memcached_servers:
+        limiters.append(('MemcachedLimiter', limits.MemcachedLimiter))
+    for name, limiter in limiters:
+        app = limits.RateLimitingMiddleware(empty_app)
+        app._limiter = limiter(make_limits(extra))
+        elapsed = run(app, requests)
+        print '%-24s %14.1f %14.1f' % (name, elapsed, elapsed - base)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compares the xenapi sparse_copy with the old 4 KiB block-by-block copy on
+files like the ones attached as loopback disks: a mostly empty image with
+some data and some written zeros.  The copies are checked to match.
+
+Usage:
+
+    python tools/benchmarks/sparse_copy.py [size in MiB] [directory]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from nova import flags
+from nova.virt.xenapi import vm_utils
+
+MB = 1024 * 1024
+
+
+def block_copy(src_path, dst_path, virtual_size, block_size=4096):
+    """The copy loop sparse_copy used before, without the chown."""
+    empty_block = '\0' * block_size
+    left = virtual_size
+    with open(src_path, 'r') as src:
+        with open(dst_path, 'w') as dst:
+            data = src.read(min(block_size, left))
+            while data:
+                if data == empty_block:
+                    dst.seek(block_size, os.SEEK_CUR)
+                else:
+                    dst.write(data)
+                left -= len(data)
+                if left <= 0:
+                    break
+                data = src.read(min(block_size, left))
+            dst.truncate(virtual_size)
+
+
+def make_image(path, size):
+    """10% random data and 10% written zeros, in 1 MiB runs."""
+    rand = random.Random(42)
+    with open(path, 'wb') as image:
+        for offset in xrange(0, size, MB):
+            kind = rand.random()
+            if kind < 0.1:
+                image.seek(offset)
+                image.write(os.urandom(MB))
+            elif kind < 0.2:
+                image.seek(offset)
+                image.write('\0' * MB)
+        image.truncate(size)
+
+
+def same_content(path1, path2):
+    with open(path1, 'rb') as file1:
+        with open(path2, 'rb') as file2:
+            while True:
+                data1 = file1.read(MB)
+                if data1 != file2.read(MB):
+                    return False
+                if not data1:
+                    return True
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 1024) * MB
+    tmpdir = tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2 else None)
+    flags.FLAGS([])
+    src_path = os.path.join(tmpdir, 'src.img')
+    dst_path = os.path.join(tmpdir, 'dst.img')
+    try:
+        make_image(src_path, size)
+        print '%-16s %10s %12s %14s' % ('copy', 'seconds', 'MB/s',
+                                        'dst blocks MB')
+        for name, copy in (('4 KiB blocks', block_copy),
+                           ('sparse_copy', vm_utils._sparse_copy)):
+            open(dst_path, 'wb').close()
+            start = time.time()
+            copy(src_path, dst_path, size)
+            elapsed = time.time() - start
+            assert same_content(src_path, dst_path)
+            print '%-16s %10.2f %12.1f %14.1f' % (
+                name, elapsed, size / elapsed / MB,
+                os.stat(dst_path).st_blocks * 512.0 / MB)
+            os.unlink(dst_path)
+    finally:
+        for path in (src_path, dst_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
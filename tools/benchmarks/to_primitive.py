@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compares jsonutils.to_primitive() with jsonutils.to_primitive_fast() on
+payloads shaped like the ones sent over RPC: an instance with metadata
+and info_cache, a run_instance request_spec and a network_info model.
+
+Usage:
+
+    python tools/benchmarks/to_primitive.py [iterations]
+"""
+
+import datetime
+import os
+import sys
+import timeit
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from nova.network import model
+from nova.openstack.common import jsonutils
+from nova.tests import fake_network_cache_model
+
+
+def make_nw_info(num_vifs=4):
+    return model.NetworkInfo([fake_network_cache_model.new_vif(dict(id=i))
+                              for i in xrange(num_vifs)])
+
+
+def make_instance():
+    now = datetime.datetime.utcnow()
+    instance = dict(('column_%d' % i, 'value %d' % i) for i in xrange(40))
+    instance.update(
+        id=1, uuid='b2b1d8a4-6b8f-4a1f-9c35-2f4e1a0f0cde',
+        created_at=now, updated_at=now, deleted_at=None, deleted=False,
+        memory_mb=2048, vcpus=2, root_gb=20, ephemeral_gb=0,
+        metadata=[{'key': 'key%d' % i, 'value': 'value%d' % i}
+                  for i in xrange(20)],
+        system_metadata=[{'key': 'image_%d' % i, 'value': str(i)}
+                         for i in xrange(10)],
+        security_groups=[{'id': 1, 'name': 'default', 'rules': []}],
+        info_cache={'network_info': jsonutils.dumps(make_nw_info()),
+                    'created_at': now})
+    return instance
+
+
+def make_request_spec():
+    instance = make_instance()
+    return {'image': {'id': 'c1a2', 'properties': {'kernel_id': 'k',
+                                                   'ramdisk_id': 'r'},
+                      'min_ram': 0, 'min_disk': 0, 'size': 25165824},
+            'instance_properties': instance,
+            'instance_type': dict(('col_%d' % i, i) for i in xrange(15)),
+            'instance_uuids': ['uuid-%d' % i for i in xrange(10)],
+            'security_group': ['default'],
+            'block_device_mapping': [],
+            'num_instances': 10}
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    payloads = [('instance', make_instance()),
+                ('request_spec', make_request_spec()),
+                ('nw_info', make_nw_info())]
+    print '%-14s %12s %12s %8s' % ('payload', 'to_primitive', 'fast',
+                                   'speedup')
+    for name, payload in payloads:
+        assert (jsonutils.to_primitive(payload) ==
+                jsonutils.to_primitive_fast(payload))
+        slow = timeit.timeit(lambda: jsonutils.to_primitive(payload),
+                             number=iterations)
+        fast = timeit.timeit(lambda: jsonutils.to_primitive_fast(payload),
+                             number=iterations)
+        print '%-14s %11.2fus %11.2fus %7.1fx' % (
+            name, slow / iterations * 1e6, fast / iterations * 1e6,
+            slow / fast)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the XML serialization of a GET /servers/detail response, with
+the slave templates of the extended status, extended server attributes
+and disk config extensions attached as they are for each request.  The
+'before' row merges the templates while walking the data, as
+Template._serialize() does; both outputs are checked to be the same.
+
+Usage:
+
+    python tools/benchmarks/xml_serialize.py [servers] [repeats]
+"""
+
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from lxml import etree
+
+from nova.api.openstack.compute.contrib import disk_config
+from nova.api.openstack.compute.contrib import extended_server_attributes
+from nova.api.openstack.compute.contrib import extended_status
+from nova.api.openstack.compute import servers
+from nova import flags
+
+
+def make_server(i):
+    links = [{'rel': 'self',
+              'href': 'http://localhost/v2/fake/servers/%d' % i},
+             {'rel': 'bookmark',
+              'href': 'http://localhost/fake/servers/%d' % i}]
+    return {
+        'id': 'b2b1d8a4-6b8f-4a1f-9c35-%012d' % i,
+        'name': 'server%d' % i,
+        'user_id': 'fake_user',
+        'tenant_id': 'fake_project',
+        'updated': '2012-08-01T12:00:00Z',
+        'created': '2012-08-01T11:00:00Z',
+        'hostId': 'e4d909c290d0fb1ca068ffaddf22cbd0',
+        'accessIPv4': '',
+        'accessIPv6': '',
+        'status': 'ACTIVE',
+        'progress': 100,
+        'image': {'id': '10', 'links': links[1:]},
+        'flavor': {'id': '1', 'links': links[1:]},
+        'metadata': {'key1': 'value1', 'key2': 'value2'},
+        'addresses': {'private': [{'version': 4,
+                                   'addr': '10.0.%d.%d' % (i / 250, i % 250)},
+                                  {'version': 6, 'addr': 'fd00::%x' % i}]},
+        'links': links,
+        'OS-EXT-STS:task_state': None,
+        'OS-EXT-STS:vm_state': 'active',
+        'OS-EXT-STS:power_state': 1,
+        'OS-EXT-SRV-ATTR:instance_name': 'instance-%08x' % i,
+        'OS-EXT-SRV-ATTR:host': 'compute%d' % (i % 10),
+        'OS-DCF:diskConfig': 'MANUAL',
+        }
+
+
+def make_template():
+    """Builds the template as the wsgi ResponseObject does."""
+    template = servers.ServersTemplate()
+    template.attach(extended_status.ExtendedStatusesTemplate())
+    template.attach(
+        extended_server_attributes.ExtendedServerAttributesTemplate())
+    template.attach(disk_config.ServersDiskConfigTemplate())
+    return template
+
+
+def serialize_before(obj):
+    template = make_template()
+    elem = template._serialize(None, obj, template._siblings(),
+                               template._nsmap())
+    return etree.tostring(elem, **template.serialize_options)
+
+
+def serialize(obj):
+    return make_template().serialize(obj)
+
+
+def main():
+    flags.FLAGS([])
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    obj = {'servers': [make_server(i) for i in xrange(count)]}
+    assert serialize_before(obj) == serialize(obj)
+    print '%d servers, %d bytes' % (count, len(serialize(obj)))
+    print '%-16s %14s' % ('serializer', 'ms/response')
+    for name, func in (('before', serialize_before),
+                       ('compiled', serialize)):
+        start = time.time()
+        for i in xrange(repeats):
+            func(obj)
+        print '%-16s %14.1f' % (name, (time.time() - start) / repeats * 1000)
+
+
+if __name__ == '__main__':
+    main()